@@ -0,0 +1,354 @@
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+from flask import current_app, has_app_context
+from sqlalchemy import func, select
+
+from engine import read_engine
+from models import Player
+from revisions import changes_committed
+
+ANALYTICS = 'analytics'
+
+# 统计列；空值在数组里存为 NULL，比任何真实数据都小，排序后排在最前面
+STATS = ('points', 'rebounds', 'assists')
+NULL = -2 ** 31
+# team_of 里表示没有这名球员
+ABSENT = NULL + 1
+
+# 还没合并的改动超过这个数时不再逐行合并，改为在后台整体重新加载
+REFRESH_LIMIT = 1000
+
+player_table = Player.__table__
+
+
+class PlayerColumns:
+    """
+    球员数据列的内存快照：id、team_id 和各项数据各一个定长整数数组（array 模块），
+    按 (team_id, id) 排序，每支球队的球员占一段连续的下标，按球队统计就是对数组切片的扫描，
+    求和、计数、排序都在 C 里完成，不经过数据库和 ORM。另有一个按 id 下标的数组记录每名球员的球队，
+    用来在所在球队的区间里二分找到球员。100 万球员约占 28MB。
+    快照生成后不再修改，合并改动时生成新的快照（updated），读者不用加锁
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.team_ids = array('i')
+        self.columns = {name: array('i') for name in STATS}
+        # team_of[id] 为球员所在球队，没有这名球员时为 ABSENT
+        self.team_of = array('i')
+        # 排好序的列，按 (列名, 球队) 缓存
+        self._sorted = {}
+        # 快照的版本：每次整体加载一个随机值，之后每合并一次加一，作为快照接口的 ETag
+        self.version = (os.urandom(4).hex(), 0)
+
+    @classmethod
+    def load(cls, connection, team_ids=None, batch_size=10000):
+        """从数据库读取全部（或 team_ids 中球队的）球员，空值由 SQLite 换成 NULL"""
+        snapshot = cls()
+        columns = [player_table.c.id, func.coalesce(player_table.c.team_id, NULL)]
+        columns += [func.coalesce(player_table.c[name], NULL) for name in STATS]
+        stmt = select(*columns).order_by(player_table.c.team_id, player_table.c.id)
+        if team_ids is not None:
+            stmt = stmt.where(player_table.c.team_id.in_(team_ids))
+        result = connection.execute(stmt.execution_options(yield_per=batch_size))
+        for batch in result.partitions():
+            for target, values in zip(snapshot._arrays(), zip(*batch)):
+                target.extend(values)
+        snapshot._index()
+        return snapshot
+
+    def _index(self):
+        self.team_of = array('i', [ABSENT]) * (max(self.ids, default=0) + 1)
+        team_of = self.team_of
+        for id_, team_id in zip(self.ids, self.team_ids):
+            team_of[id_] = team_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def team_range(self, team_id):
+        """某支球队的球员在数组里的下标范围 [lo, hi)；team_id 为 None 时是全部球员"""
+        if team_id is None:
+            return 0, len(self.ids)
+        lo = bisect_left(self.team_ids, team_id)
+        return lo, bisect_right(self.team_ids, team_id, lo)
+
+    def teams(self):
+        """按 team_id 顺序生成 (team_id, lo, hi)，没有球队的球员 team_id 为 None"""
+        for team_id, lo, hi in self._segments():
+            yield (None if team_id == NULL else team_id), lo, hi
+
+    def _segments(self):
+        """按数组里的顺序生成 (team_id, lo, hi)，没有球队的球员 team_id 为 NULL"""
+        lo, size = 0, len(self.ids)
+        while lo < size:
+            team_id = self.team_ids[lo]
+            hi = bisect_right(self.team_ids, team_id, lo)
+            yield team_id, lo, hi
+            lo = hi
+
+    def totals(self, lo, hi):
+        """一段球员的人数和各项数据之和（忽略空值），和 SQL 的 COUNT/SUM 一致"""
+        result = {'players': hi - lo}
+        for name in STATS:
+            values = self.columns[name][lo:hi]
+            nulls = values.count(NULL)
+            result[name] = sum(values) - NULL * nulls
+        return result
+
+    def sorted_values(self, stat, team_id=None):
+        """某项数据去掉空值后排好序的数组"""
+        key = (stat, team_id)
+        values = self._sorted.get(key)
+        if values is None:
+            lo, hi = self.team_range(team_id)
+            values = array('i', sorted(self.columns[stat][lo:hi]))
+            values = self._sorted[key] = values[bisect_right(values, NULL):]
+        return values
+
+    def updated(self, ids, rows):
+        """
+        返回合并了 ids 对应最新数据（rows，已删除的不在其中）的新快照，自己保持不变。
+        没换球队的球员在复制出的数组里按二分找到的下标原地改；换了球队、新增或删除的球员
+        只重建涉及的球队那几段，其余球队的数据按切片整段复制（C 里的内存拷贝）
+        """
+        latest = {row[0]: row for row in rows}
+        snapshot = PlayerColumns()
+        snapshot.team_ids = array('i', self.team_ids)
+        snapshot.ids = array('q', self.ids)
+        snapshot.columns = {name: array('i', values) for name, values in self.columns.items()}
+        snapshot.team_of = array('i', self.team_of)
+        snapshot.version = (self.version[0], self.version[1] + 1)
+        # affected 为要重建的球队，touched 为只原地改了数据的球队
+        affected, touched = set(), set()
+        for id_ in ids:
+            old_team = self.team_of[id_] if id_ < len(self.team_of) else ABSENT
+            row = latest.get(id_)
+            if row is not None and row[1] == old_team:
+                lo, hi = self.team_range(old_team)
+                position = bisect_left(self.ids, id_, lo, hi)
+                for name, value in zip(STATS, row[2:]):
+                    snapshot.columns[name][position] = value
+                touched.add(old_team)
+                continue
+            if old_team != ABSENT:
+                affected.add(old_team)
+            if row is not None:
+                affected.add(row[1])
+        if affected:
+            snapshot._rebuild_segments(ids, latest, affected)
+        # 没有改动的球队排好序的列可以沿用；全联盟的要重新排
+        for (stat, team_id), values in self._sorted.items():
+            if team_id is not None and team_id not in affected and team_id not in touched:
+                snapshot._sorted[stat, team_id] = values
+        return snapshot
+
+    def _rebuild_segments(self, ids, latest, affected):
+        changed = set(ids)
+        segments = {team_id: (lo, hi) for team_id, lo, hi in self._segments()}
+        old = self._arrays()
+        new = [array(target.typecode) for target in old]
+        for team_id in sorted(set(segments) | affected):
+            lo, hi = segments.get(team_id, (0, 0))
+            if team_id not in affected:
+                for target, values in zip(new, old):
+                    target.extend(values[lo:hi])
+                continue
+            rows = [row for row in zip(*(values[lo:hi] for values in old)) if row[0] not in changed]
+            rows += [row for row in latest.values() if row[1] == team_id]
+            rows.sort()
+            for target, values in zip(new, zip(*rows)):
+                target.extend(values)
+        self.ids, self.team_ids = new[0], new[1]
+        self.columns = dict(zip(STATS, new[2:]))
+        # 新增的球员可能超出 team_of 的长度
+        size = max(latest, default=0) + 1
+        if size > len(self.team_of):
+            self.team_of.extend(array('i', [ABSENT]) * (size - len(self.team_of)))
+        for id_ in changed:
+            if id_ < len(self.team_of):
+                row = latest.get(id_)
+                self.team_of[id_] = ABSENT if row is None else row[1]
+
+    def _arrays(self):
+        return [self.ids, self.team_ids] + [self.columns[name] for name in STATS]
+
+
+class AnalyticsStore:
+    """
+    每个进程一份球员快照：第一次读取时同步加载，之后写接口提交时只记下改动的 ID，
+    由一个后台线程读出这些行、生成合并了改动的新快照再替换引用，提交和读请求都不等它。
+    读到的快照可能比刚提交的写入晚一点；其他进程的写入看不到，靠 max_age 秒后在后台整体重新加载来限制过期时间，
+    重新加载期间旧快照照常提供服务
+    """
+
+    def __init__(self, app, db, max_age=None):
+        self.app, self.db, self.max_age = app, db, max_age
+        # 保护下面几个字段，只在很短的时间里持有
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # 生成快照（加载或合并）一次只有一个线程做
+        self._build_lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = 0
+        # 还没合并进快照的改动；_full 表示要整体重新加载
+        self._dirty = set()
+        self._full = False
+        self._building = False
+        self._worker = None
+        self.loads = self.refreshes = 0
+
+    def _engine(self):
+        return read_engine() or self.db.engine
+
+    def version(self):
+        """当前快照的版本，还没有快照时先加载"""
+        with self.read() as snapshot:
+            return '{}.{}'.format(*snapshot.version)
+
+    @contextmanager
+    def read(self):
+        """with store.read() as columns: 快照生成后不再修改，读的时候不加锁；过期时在后台重新加载，先用旧的"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._load_now()
+        elif self.max_age and time.monotonic() - self._loaded_at > self.max_age:
+            with self._lock:
+                if self._worker is None:
+                    self._full = True
+                    self._start_worker()
+        yield snapshot
+
+    def _load_now(self):
+        """还没有快照时在当前线程加载，同时来的读请求等同一次加载"""
+        with self._build_lock:
+            if self._snapshot is None:
+                with self._lock:
+                    # 加载会读到在这之前提交的全部改动
+                    self._dirty, self._full, self._building = set(), False, True
+                try:
+                    self._build(True, ())
+                finally:
+                    with self._lock:
+                        self._building = False
+                        if self._dirty or self._full:
+                            self._start_worker()
+            return self._snapshot
+
+    def refresh(self, ids):
+        """写事务提交后调用：只记下改动的 ID 并唤醒后台线程；ids 为 None 或太多时改为整体重新加载"""
+        with self._lock:
+            if self._snapshot is None and not self._building:
+                return
+            if ids is None or len(self._dirty) + len(ids) > REFRESH_LIMIT:
+                self._full, self._dirty = True, set()
+            elif not self._full:
+                self._dirty.update(ids)
+            self.refreshes += 1
+            self._start_worker()
+
+    def _start_worker(self):
+        # 调用时持有 _lock
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, name='analytics-refresh', daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        with self.app.app_context():
+            while True:
+                with self._lock:
+                    if not self._full and not self._dirty:
+                        self._worker = None
+                        self._idle.notify_all()
+                        return
+                    full, ids = self._full, self._dirty
+                    self._full, self._dirty = False, set()
+                try:
+                    with self._build_lock:
+                        self._build(full, ids)
+                except Exception:
+                    # 合并失败就丢掉快照，下一次读取时在请求里重新加载，错误会暴露给调用方
+                    self.app.logger.exception('Failed to refresh the analytics snapshot')
+                    with self._lock:
+                        self._snapshot, self._dirty, self._full = None, set(), False
+
+    def _build(self, full, ids):
+        """在 _build_lock 下生成新快照并替换引用"""
+        if full or self._snapshot is None:
+            loaded_at = time.monotonic()
+            with self._engine().connect() as connection:
+                snapshot = PlayerColumns.load(connection)
+            self._snapshot, self._loaded_at = snapshot, loaded_at
+            self.loads += 1
+        elif ids:
+            ids = sorted(ids)
+            columns = [player_table.c.id, func.coalesce(player_table.c.team_id, NULL)]
+            columns += [func.coalesce(player_table.c[name], NULL) for name in STATS]
+            with self._engine().connect() as connection:
+                rows = connection.execute(select(*columns).where(player_table.c.id.in_(ids))).all()
+            self._snapshot = self._snapshot.updated(ids, [tuple(row) for row in rows])
+
+    def wait(self, timeout=None):
+        """等后台线程把已提交的改动都合并进快照，返回是否等到了"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._worker is None, timeout)
+
+    def clear(self):
+        with self._lock:
+            self._snapshot, self._dirty, self._full = None, set(), False
+
+
+def percentile(values, p):
+    """排好序的 values 的第 p 百分位数，两个相邻值之间线性插值"""
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    lo = int(rank)
+    if lo + 1 >= len(values):
+        return values[lo]
+    return values[lo] + (values[lo + 1] - values[lo]) * (rank - lo)
+
+
+def distribution(values, percentiles, buckets):
+    """排好序的 values 的分布：人数、最值、平均数、百分位数和等宽直方图，都靠切片和二分完成"""
+    count = len(values)
+    if not count:
+        return {'count': 0, 'min': None, 'max': None, 'mean': None, 'percentiles': {}, 'histogram': []}
+    low, high = values[0], values[-1]
+    width = (high - low) / buckets or 1
+    edges = [low + width * index for index in range(buckets)] + [high]
+    histogram = []
+    for index in range(buckets):
+        start = bisect_left(values, edges[index])
+        # 最后一个区间包含最大值
+        end = count if index == buckets - 1 else bisect_left(values, edges[index + 1])
+        histogram.append({'lo': edges[index], 'hi': edges[index + 1], 'count': end - start})
+    return {
+        'count': count, 'min': low, 'max': high, 'mean': sum(values) / count,
+        'percentiles': {f'p{p:g}': percentile(values, p) for p in percentiles},
+        'histogram': histogram,
+    }
+
+
+def init_analytics(app, db):
+    """ANALYTICS_SNAPSHOT 打开时为应用创建球员快照，并随写接口的提交增量更新"""
+    if not app.config['ANALYTICS_SNAPSHOT']:
+        return
+    store = app.extensions[ANALYTICS] = AnalyticsStore(app, db, app.config['ANALYTICS_MAX_AGE'])
+
+    def on_commit(table, ids=None):
+        # 测试里会创建多个应用，只处理本应用上下文里的提交
+        if table == 'player' and has_app_context() and current_app._get_current_object() is app:
+            store.refresh(ids)
+
+    changes_committed.connect(on_commit, weak=False)
+
+
+def analytics_store():
+    """当前应用的球员快照，没有开启时返回 None"""
+    return current_app.extensions.get(ANALYTICS)
@@ -1,6 +1,10 @@
 from resources.teams import ns as ns_teams
 from resources.players import ns as ns_players
+from resources.stats import ns as ns_stats
+from resources.changes import ns as ns_changes
 
 def init_api(api):
   api.add_namespace(ns_teams)
-  api.add_namespace(ns_players)
\ No newline at end of file
+  api.add_namespace(ns_players)
+  api.add_namespace(ns_stats)
+  api.add_namespace(ns_changes)
\ No newline at end of file
@@ -1,25 +1,55 @@
+import os
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
 from flask_restx import Api
-    
-db = SQLAlchemy() ## this must be first, even the following import clause
+from config import configs
+from engine import RoutingSession, init_engines
+
+db = SQLAlchemy(session_options={'class_': RoutingSession}) ## this must be first, even the following import clause
 api = Api()
-migrate = Migrate()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///your_database.db'
-    
-    ## init db, api and migrate
+    ## config 可以是 configs 里的名字或配置类；默认读环境变量 APP_CONFIG，APP_CONFIG=production 使用生产配置
+    if config is None or isinstance(config, str):
+        config = configs[config or os.environ.get('APP_CONFIG', 'development')]
+    app.config.from_object(config)
+
+    ## init db, api and migrate（flask db 命令用到时才导入 Flask-Migrate）
     db.init_app(app)
+    init_engines(app, db)
     
     from api import init_api
     api.init_app(app)
     init_api(api)
 
-    migrate.init_app(app, db)
+    from search import include_name
+    from dbcli import init_migrate
+    init_migrate(app, db, include_name=include_name)
+
+    from openapi import init_openapi
+    init_openapi(app, api)
+
+    from rollups import init_rollups
+    init_rollups(app, db)
+
+    from changes import init_changes
+    init_changes(app, db)
+
+    from cache import init_cache
+    init_cache(app)
+
+    from statements import init_statement_cache
+    init_statement_cache(app, db)
+
+    from analytics import init_analytics
+    init_analytics(app, db)
+
+    from writer import init_group_commit
+    init_group_commit(app, db)
+
+    from metrics import init_metrics
+    init_metrics(app, db, api)
     
     return app
-
@@ -0,0 +1,408 @@
+"""
+压测脚本：用 seed.py 生成指定规模的数据库，
+分别通过 Flask test client 和真实的多线程 HTTP 服务压测 resources/ 下的每个接口，
+输出吞吐量、p50/p95/p99 延迟、每个接口压测期间的 RSS 增量和每个请求的 SQL 语句数（JSON），便于跨提交对比。
+
+    python -m bench.load --players 1000,100000 --requests 200 --concurrency 8 --output bench.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import create_app, db
+from cache import caches
+from config import configs
+from models import Team
+from seed import MASCOTS, seed_database
+
+# 搜索压测用的查询词：常见姓氏（退回 LIKE）和三字片段（走全文索引）
+SEARCH_TERMS = ['王', '李', '张伟', '王秀英', '李桂英', '张建华']
+
+
+class Scenario:
+    """一个被压测的接口：method + 路径模板，请求体和路径参数在每次请求时生成"""
+
+    def __init__(self, name, method, path, body=None, repeat=1.0):
+        self.name, self.method, self.path, self.body = name, method, path, body
+        # 相对请求数，全表流式输出之类的重接口少跑几次
+        self.repeat = repeat
+
+
+def player_body(state):
+    return {'name': '压测球员', 'team_id': state.random_team(), 'points': random.randint(5, 30), 'rebounds': random.randint(2, 15), 'assists': random.randint(1, 10)}
+
+
+def team_body(state):
+    return {'name': f'压测球队{next(state.counter)}', 'points_scored': 80, 'rebounds': 40, 'assists': 20}
+
+
+def players_csv(state):
+    # 字符串请求体按 text/csv 发送
+    return 'name,team_id,points,rebounds,assists\n' + ''.join(f'导入球员,{state.random_team()},{random.randint(5, 30)},5,3\n' for _ in range(1000))
+
+
+def teams_csv(state):
+    return 'name,points_scored,rebounds,assists\n' + ''.join(f'压测球队{next(state.counter)},80,40,20\n' for _ in range(100))
+
+
+SCENARIOS = [
+    Scenario('list_players', 'GET', lambda s: '/players?limit=100'),
+    Scenario('list_players_cursor', 'GET', lambda s: f'/players?limit=100&after={s.random_player()}'),
+    Scenario('list_players_filtered', 'GET', lambda s: f'/players?team_id={s.random_team()}&sort=-points&limit=50'),
+    Scenario('list_players_fields', 'GET', lambda s: '/players?limit=100&fields=id,name,points'),
+    Scenario('stream_players', 'GET', lambda s: '/players?stream=1', repeat=0.02),
+    Scenario('players_since', 'GET', lambda s: f'/players?since={s.random_player()}&limit=100'),
+    Scenario('export_players', 'GET', lambda s: '/players/export.csv', repeat=0.02),
+    Scenario('import_players', 'POST', lambda s: '/players/import', players_csv, repeat=0.05),
+    Scenario('search_players', 'GET', lambda s: '/players/search?' + urlencode({'q': random.choice(SEARCH_TERMS), 'limit': 20})),
+    Scenario('get_player', 'GET', lambda s: f'/players/{s.random_player()}'),
+    Scenario('get_players_by_ids', 'GET', lambda s: '/players?ids=' + ','.join(str(s.random_player()) for _ in range(30))),
+    Scenario('lookup_players', 'POST', lambda s: '/players/lookup', lambda s: {'ids': [s.random_player() for _ in range(1000)]}, repeat=0.2),
+    Scenario('create_player', 'POST', lambda s: '/players', player_body),
+    Scenario('update_player', 'PUT', lambda s: f'/players/{s.random_player()}', lambda s: {'points': random.randint(5, 30)}),
+    Scenario('patch_player', 'PATCH', lambda s: f'/players/{s.random_player()}', lambda s: {'assists': random.randint(0, 10)}),
+    Scenario('bulk_create_players', 'POST', lambda s: '/players/bulk', lambda s: [player_body(s) for _ in range(100)], repeat=0.2),
+    Scenario('bulk_update_players', 'PATCH', lambda s: '/players', lambda s: [{'id': s.random_player(), 'points': 1} for _ in range(100)], repeat=0.2),
+    Scenario('delete_player', 'DELETE', lambda s: f'/players/{s.take_created("player")}'),
+    Scenario('bulk_delete_players', 'DELETE', lambda s: '/players?ids=' + ','.join(str(s.take_created('player')) for _ in range(20)), repeat=0.2),
+    Scenario('list_teams', 'GET', lambda s: '/teams'),
+    Scenario('list_teams_with_players', 'GET', lambda s: '/teams?include=players&limit=10', repeat=0.2),
+    Scenario('list_teams_with_totals', 'GET', lambda s: '/teams?include=totals'),
+    Scenario('teams_since', 'GET', lambda s: '/teams?since=0'),
+    Scenario('team_players', 'GET', lambda s: f'/teams/{s.random_team()}/players?sort=-points&limit=50'),
+    Scenario('export_teams', 'GET', lambda s: '/teams/export.csv', repeat=0.2),
+    Scenario('import_teams', 'POST', lambda s: '/teams/import?upsert=1', teams_csv, repeat=0.2),
+    Scenario('search_teams', 'GET', lambda s: '/teams/search?' + urlencode({'q': random.choice(MASCOTS)})),
+    Scenario('get_team', 'GET', lambda s: f'/teams/{s.random_team()}'),
+    Scenario('get_teams_by_ids', 'GET', lambda s: '/teams?ids=' + ','.join(str(s.random_team()) for _ in range(5))),
+    Scenario('lookup_teams', 'POST', lambda s: '/teams/lookup?include=players', lambda s: [s.random_team() for _ in range(5)], repeat=0.2),
+    Scenario('create_team', 'POST', lambda s: '/teams', team_body),
+    Scenario('update_team', 'PUT', lambda s: f'/teams/{s.random_team()}', lambda s: {'rebounds': random.randint(20, 70)}),
+    Scenario('patch_team', 'PATCH', lambda s: f'/teams/{s.random_team()}', lambda s: {'assists': random.randint(0, 30)}),
+    Scenario('bulk_create_teams', 'POST', lambda s: '/teams/bulk', lambda s: [team_body(s) for _ in range(20)], repeat=0.2),
+    Scenario('bulk_update_teams', 'PATCH', lambda s: '/teams', lambda s: [{'id': s.random_team(), 'assists': 25}], repeat=0.2),
+    Scenario('delete_team', 'DELETE', lambda s: f'/teams/{s.take_created("team")}'),
+    Scenario('bulk_delete_teams', 'DELETE', lambda s: '/teams?ids=' + ','.join(str(s.take_created('team')) for _ in range(5)), repeat=0.2),
+    Scenario('team_totals', 'GET', lambda s: f'/teams/{s.random_team()}/totals'),
+    Scenario('stats_leaders', 'GET', lambda s: '/stats/leaders?stat=points&k=20'),
+    Scenario('stats_by_team', 'GET', lambda s: '/stats/by-team', repeat=0.2),
+    Scenario('stats_distribution', 'GET', lambda s: f'/stats/distribution?stat=points&team_id={s.random_team()}'),
+    Scenario('stats_distribution_all', 'GET', lambda s: '/stats/distribution?stat=rebounds&buckets=20', repeat=0.2),
+    Scenario('stats_compare', 'GET', lambda s: '/stats/compare?stat=assists&team_ids=' + ','.join(str(s.random_team()) for _ in range(5))),
+    Scenario('stats_cache', 'GET', lambda s: '/stats/cache'),
+    Scenario('changes_backlog', 'GET', lambda s: f'/changes?since={s.random_team()}&tables=teams&follow=false', repeat=0.2),
+]
+
+
+class State:
+    """压测过程中共享的数据：已有的 ID 范围、压测自己创建的记录（供删除接口使用）"""
+
+    def __init__(self, team_ids, max_player_id):
+        self.team_ids = team_ids
+        self.max_player_id = max_player_id
+        self.created = {'player': [], 'team': []}
+        self.lock = threading.Lock()
+        self.counter = iter(range(10 ** 9))
+
+    def random_team(self):
+        return random.choice(self.team_ids)
+
+    def random_player(self):
+        return random.randint(1, self.max_player_id)
+
+    def take_created(self, table):
+        # 优先删除压测自己创建的记录；球员不够时删除种子数据末尾的球员，球队不够时返回不存在的 ID（404）
+        with self.lock:
+            if self.created[table]:
+                return self.created[table].pop()
+            if table == 'team':
+                return 0
+            self.max_player_id -= 1
+            return self.max_player_id + 1
+
+    def record(self, data):
+        """记录创建接口返回的 ID"""
+        if not isinstance(data, dict):
+            return
+        with self.lock:
+            for table in self.created:
+                if f'{table}_id' in data:
+                    self.created[table].append(data[f'{table}_id'])
+
+
+class QuietHandler(WSGIRequestHandler):
+    """不打印每个请求的访问日志"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class StatementCounter:
+    """统计引擎上执行的 SQL 语句数"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self.lock:
+            self.count += 1
+
+    def attach(self, engines):
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self)
+
+
+def current_rss():
+    """当前进程的常驻内存（字节），读 /proc/self/statm；不是 Linux 时返回 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    """
+    在一个场景压测期间每 interval 秒采样一次当前 RSS，
+    得到这个场景开始、结束和期间最高的 RSS；ru_maxrss 是整个进程的历史最高值，分不出是哪个场景
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = self.end = self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        if self.start is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.end = current_rss()
+            self.peak = max(self.peak, self.end)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def summary(self):
+        """场景结束和期间最高的 RSS 相对开始时的增量（MB）"""
+        if self.start is None:
+            return {'rss_delta_mb': None, 'rss_peak_delta_mb': None}
+        return {
+            'rss_delta_mb': round((self.end - self.start) / 1024 / 1024, 1),
+            'rss_peak_delta_mb': round((self.peak - self.start) / 1024 / 1024, 1),
+        }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(name, driver, num_players, latencies, errors, elapsed, statements, rss):
+    latencies.sort()
+    requests = len(latencies)
+    return {
+        'players': num_players,
+        'driver': driver,
+        'endpoint': name,
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'sql_statements_per_request': round(statements / requests, 2),
+        **rss.summary(),
+        # 整个进程到目前为止的最高 RSS，包含之前的场景和造数据，只用来看总体量级
+        'process_max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_test_client(app, state, scenario, requests, counter, num_players):
+    """在当前线程里用 test client 顺序发请求"""
+    client = app.test_client()
+    latencies, errors = [], 0
+    before = counter.count
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        for _ in range(requests):
+            body = scenario.body(state) if scenario.body else None
+            start = time.perf_counter()
+            if isinstance(body, str):
+                response = client.open(scenario.path(state), method=scenario.method, data=body, content_type='text/csv')
+            else:
+                response = client.open(scenario.path(state), method=scenario.method, json=body)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+            if response.status_code == 201:
+                state.record(response.get_json(silent=True))
+        elapsed = time.perf_counter() - started
+    return summarize(scenario.name, 'test_client', num_players, latencies, errors, elapsed, counter.count - before, rss)
+
+
+def run_http(port, state, scenario, requests, concurrency, counter, num_players):
+    """用多个线程并发请求真实的 HTTP 服务"""
+    def one(_):
+        body = scenario.body(state) if scenario.body else None
+        if isinstance(body, str):
+            payload, headers = body.encode(), {'Content-Type': 'text/csv'}
+        else:
+            payload = json.dumps(body).encode() if body is not None else None
+            headers = {'Content-Type': 'application/json'} if payload else {}
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        start = time.perf_counter()
+        connection.request(scenario.method, scenario.path(state), body=payload, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        latency = time.perf_counter() - start
+        connection.close()
+        if response.status == 201:
+            state.record(json.loads(data))
+        return latency, response.status >= 400
+
+    before = counter.count
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+    errors = sum(error for _, error in results)
+    return summarize(scenario.name, 'http', num_players, latencies, errors, elapsed, counter.count - before, rss)
+
+
+def uncovered_routes(app):
+    """resources/ 里注册了但没有压测场景的路由"""
+    adapter = app.url_map.bind('localhost')
+    state = State([1], 1)
+    covered = set()
+    for scenario in SCENARIOS:
+        endpoint, _ = adapter.match(scenario.path(state).split('?')[0], method=scenario.method)
+        covered.add((scenario.method, endpoint))
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint in ('static', 'specs', 'doc', 'root', 'restx_doc.static', 'metrics'):
+            continue
+        missing.extend(f'{method} {rule.rule}' for method in rule.methods - {'HEAD', 'OPTIONS'} if (method, rule.endpoint) not in covered)
+    return sorted(missing)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_size(args, num_players, tmp):
+    base = configs[args.profile]
+
+    class BenchConfig(base):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, f'bench_{num_players}.db')
+        GROUP_COMMIT = args.group_commit or base.GROUP_COMMIT
+
+    app = create_app(BenchConfig)
+    results = []
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed_database(db.engine, args.teams, num_players, seed=num_players)
+        team_ids = db.session.scalars(db.select(Team.id).order_by(Team.id)).all()
+        seed_seconds = time.perf_counter() - started
+        engines = [db.engine] + [engine for engine in [app.extensions.get('readonly_engine')] if engine is not None]
+        counter = StatementCounter()
+        counter.attach(engines)
+        for cache in caches.values():
+            cache.clear()
+        state = State(team_ids, num_players)
+        db.session.remove()
+
+        scenarios = [scenario for scenario in SCENARIOS if not args.only or scenario.name in args.only.split(',')]
+        drivers = ['test_client', 'http'] if args.driver == 'both' else [args.driver]
+        for driver in drivers:
+            server = None
+            if driver == 'http':
+                server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+            for scenario in scenarios:
+                requests = max(1, int(args.requests * scenario.repeat))
+                if driver == 'http':
+                    results.append(run_http(server.port, state, scenario, requests, args.concurrency, counter, num_players))
+                else:
+                    results.append(run_test_client(app, state, scenario, requests, counter, num_players))
+            if server is not None:
+                server.shutdown()
+        missing = uncovered_routes(app)
+        db.session.remove()
+        for engine in engines:
+            engine.dispose()
+    return {'players': num_players, 'seed_seconds': round(seed_seconds, 2), 'uncovered_routes': missing}, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', default='1000', help='逗号分隔的球员数量，例如 1000,100000,1000000')
+    parser.add_argument('--teams', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=200, help='每个接口的请求数')
+    parser.add_argument('--concurrency', type=int, default=8, help='HTTP 压测的并发线程数')
+    parser.add_argument('--driver', choices=('test_client', 'http', 'both'), default='both')
+    parser.add_argument('--profile', choices=tuple(configs), default='development', help='使用的配置')
+    parser.add_argument('--group-commit', action='store_true', help='打开组提交')
+    parser.add_argument('--only', help='逗号分隔的场景名，只压测这些接口')
+    parser.add_argument('--output', help='结果写入的文件，默认输出到标准输出')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'profile': args.profile,
+            'requests_per_endpoint': args.requests,
+            'concurrency': args.concurrency,
+            'group_commit': args.group_commit,
+        },
+        'datasets': [],
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_players in (int(size) for size in args.players.split(',')):
+            dataset, results = bench_size(args, num_players, tmp)
+            report['datasets'].append(dataset)
+            report['results'].extend(results)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
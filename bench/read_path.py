@@ -0,0 +1,82 @@
+"""
+读路径基准：Player.query.all() 逐个构造 ORM 对象再转 dict，
+对比 Core select() 返回行元组 + 预编译的 row -> dict 函数，输出每秒处理的行数（JSON）。
+
+    python -m bench.read_path --rows 200000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import insert
+
+from app import create_app, db
+from config import Config
+from fieldsets import columns_for, row_mapper
+from models import Player
+
+FIELDS = ('id', 'name', 'team_id', 'points', 'rebounds', 'assists')
+
+
+def seed(rows, batch_size=10000):
+    for start in range(0, rows, batch_size):
+        db.session.execute(insert(Player), [
+            {'name': f'Player {i}', 'team_id': i % 30 + 1, 'points': i % 40, 'rebounds': i % 15, 'assists': i % 10}
+            for i in range(start, min(start + batch_size, rows))
+        ])
+    db.session.commit()
+
+
+def orm_path():
+    players = Player.query.all()
+    return [{'id': player.id, 'name': player.name, 'team_id': player.team_id, 'points': player.points, 'rebounds': player.rebounds, 'assists': player.assists} for player in players]
+
+
+def core_path():
+    to_dict = row_mapper(FIELDS)
+    return [to_dict(row) for row in db.session.execute(db.select(*columns_for(Player.__table__, FIELDS)))]
+
+
+def measure(func, repeat):
+    """取多次运行中最快的一次，返回每秒行数"""
+    best = float('inf')
+    for _ in range(repeat):
+        # 每轮换一个新会话，ORM 路径不能复用上一轮 identity map 里的对象
+        db.session.remove()
+        start = time.perf_counter()
+        count = len(func())
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            seed(args.rows)
+            orm = measure(orm_path, args.repeat)
+            core = measure(core_path, args.repeat)
+            db.session.remove()
+            db.engine.dispose()
+
+    print(json.dumps({
+        'rows': args.rows,
+        'orm_rows_per_sec': round(orm),
+        'core_rows_per_sec': round(core),
+        'speedup': round(core / orm, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+启动耗时：在全新的子进程里分别计时 import app、create_app() 和第一次、之后以及带 If-None-Match 的 /swagger.json 请求，
+多次运行取中位数（JSON），用来看 worker 冷启动和扩容有多快。
+
+    python -m bench.startup --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# 在子进程里执行，打印一行 JSON
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+first = client.get('/swagger.json')
+first_done = time.perf_counter()
+cached = client.get('/swagger.json')
+cached_done = time.perf_counter()
+revalidated = client.get('/swagger.json', headers={'If-None-Match': first.headers.get('ETag', '')})
+revalidated_done = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_spec_ms': (first_done - created) * 1000,
+    'cached_spec_ms': (cached_done - first_done) * 1000,
+    'revalidated_spec_ms': (revalidated_done - cached_done) * 1000,
+    'revalidated_status': revalidated.status_code,
+    'alembic_imported': 'alembic' in sys.modules,
+}))
+'''
+
+
+def run_probe():
+    output = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='子进程次数')
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(args.runs)]
+    result = {'runs': args.runs}
+    for key, value in runs[0].items():
+        if isinstance(value, float):
+            result[key] = round(statistics.median(run[key] for run in runs), 3)
+        else:
+            result[key] = value
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+语句缓存的微基准：用 test client 对热点查询形状（单条读取、列表页、过滤后的列表、按 ID 更新）
+各发 N 个请求，分别在关闭（STATEMENT_CACHE_SIZE=0）和开启语句缓存时统计每个请求的 CPU 时间（JSON）。
+
+    python -m bench.statements --requests 2000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from app import create_app, db
+from config import configs
+from seed import seed_database
+from statements import compiled_stats, statements
+
+SHAPES = [
+    ('get_by_id', 'GET', lambda: f'/players/{random.randint(1, 10000)}?fields=id,name,points', None),
+    ('list_page', 'GET', lambda: '/players?limit=20', None),
+    ('list_cursor', 'GET', lambda: '/players?limit=20&sort=-points&cursor=' + CURSOR, None),
+    ('filtered_list', 'GET', lambda: f'/players?team_id={random.randint(1, 30)}&min_points={random.randint(5, 25)}&limit=20', None),
+    ('update_by_id', 'PATCH', lambda: f'/players/{random.randint(1, 10000)}', lambda: {'points': random.randint(0, 30)}),
+]
+
+# 按得分降序翻页的第二页游标：(20, 500)
+CURSOR = 'WzIwLDUwMF0'
+
+
+def measure(client, method, path, body, requests):
+    started = time.process_time()
+    for _ in range(requests):
+        response = client.open(path(), method=method, json=body() if body else None)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return (time.process_time() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='每个形状的请求数')
+    parser.add_argument('--players', type=int, default=10000, help='球员数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(configs['development']):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            seed_database(db.engine, 30, args.players, seed=1)
+            client = app.test_client()
+            results = []
+            for name, method, path, body in SHAPES:
+                row = {'shape': name}
+                for label, size in (('uncached', 0), ('cached', 1024)):
+                    statements.configure(size)
+                    statements.clear()
+                    measure(client, method, path, body, 50)
+                    before = compiled_stats.stats()
+                    row[f'{label}_cpu_us'] = round(measure(client, method, path, body, args.requests), 1)
+                    after = compiled_stats.stats()
+                    row[f'{label}_compiled_hit_ratio'] = round((after['hit'] - before['hit']) / max(sum(after.values()) - sum(before.values()), 1), 3)
+                row['saved_pct'] = round(100 * (1 - row['cached_cpu_us'] / row['uncached_cpu_us']), 1)
+                row['statement_cache'] = statements.stats()
+                results.append(row)
+            db.session.remove()
+            db.engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
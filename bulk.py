@@ -0,0 +1,228 @@
+import json
+
+from flask import request
+from jsonschema import Draft4Validator
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from fieldsets import columns_for, select_fields
+from statements import cached_statement
+from streaming import NDJSON_MIMETYPE
+
+# 每条 INSERT 语句携带的行数，远低于 SQLite 的绑定参数上限
+CHUNK_SIZE = 500
+
+# 一次按 ID 批量读取的 ID 数上限
+MAX_LOOKUP_IDS = 10000
+
+
+def chunked(seq, size=CHUNK_SIZE):
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+
+def read_items():
+    """读取批量请求体：JSON 数组，或每行一个对象的 NDJSON"""
+    if request.mimetype == NDJSON_MIMETYPE:
+        try:
+            return [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError:
+            raise ValueError('Invalid NDJSON body')
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValueError('Request body must be a JSON array or NDJSON')
+    return items
+
+
+def partial_schema(model, key='id'):
+    """批量更新用的校验规则：只要求 key（默认 id），其余字段可选；key 为 None 时全部可选"""
+    schema = dict(model.__schema__)
+    if key == 'id':
+        schema['properties'] = dict(schema['properties'], id={'type': 'integer'})
+    schema['required'] = [key] if key else []
+    return schema
+
+
+def validate_patch(model, item):
+    """单条部分更新的请求体：字段都可选但至少要有一个，0 和空字符串也是要写入的值；返回要更新的字段"""
+    if not isinstance(item, dict):
+        raise ValueError('Request body must be a JSON object')
+    schema = partial_schema(model, None)
+    messages = [e.message for e in Draft4Validator(schema).iter_errors(item)]
+    if messages:
+        raise ValueError('; '.join(messages))
+    values = {key: item[key] for key in schema['properties'] if key in item}
+    if not values:
+        raise ValueError('No fields to update')
+    return values
+
+
+def validate_items(model, items, partial=False):
+    """
+    按 restx 模型逐条校验，返回 (合法行列表 [(下标, 行)], 错误列表)。
+    多余的字段会被丢掉，不会写进数据库。partial=True 时按 id + 部分字段校验。
+    """
+    schema = partial_schema(model) if partial else model.__schema__
+    validator = Draft4Validator(schema)
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'Item must be an object'})
+            continue
+        messages = [e.message for e in validator.iter_errors(item)]
+        if messages:
+            errors.append({'index': index, 'error': '; '.join(messages)})
+            continue
+        valid.append((index, {key: item[key] for key in schema['properties'] if key in item}))
+    return valid, errors
+
+
+def insert_rows(db, entity, rows):
+    """用多行 INSERT ... RETURNING 分批插入，返回新 ID（不保证与输入顺序对应）"""
+    stmt = insert(entity).returning(entity.id)
+    ids = []
+    for chunk in chunked(rows):
+        ids.extend(db.session.scalars(stmt, chunk))
+    return ids
+
+
+def insert_new_rows(db, entity, rows, key):
+    """
+    和 insert_rows 一样分批插入，唯一列 key 冲突的行跳过（INSERT ... ON CONFLICT (key) DO NOTHING），
+    先查重之后别的请求插入了同样的值也不会让整批失败；返回 {key 的值: 新 ID}，跳过的行不在其中
+    """
+    table = entity.__table__
+    stmt = sqlite_insert(table).on_conflict_do_nothing(index_elements=[table.c[key]]).returning(table.c[key], table.c.id)
+    inserted = {}
+    for chunk in chunked(rows):
+        inserted.update(db.session.execute(stmt, chunk).all())
+    return inserted
+
+
+def update_row(db, entity, id_, values, columns):
+    """
+    一条 UPDATE ... WHERE id = ? RETURNING 更新单行并取回 columns，不先读出 ORM 对象；
+    行不存在时返回 None。改同一组字段的语句只构造一次
+    """
+    table = entity.__table__
+    names = tuple(values)
+
+    def build():
+        stmt = update(table).where(table.c.id == bindparam('_id')).values({name: bindparam('v_' + name) for name in names})
+        return stmt.returning(*columns)
+
+    stmt = cached_statement(('update_by_id', table.name, names, tuple(column.key for column in columns)), build)
+    return db.session.execute(stmt, {'_id': id_, **{'v_' + name: value for name, value in values.items()}}).first()
+
+
+def delete_row(db, entity, id_):
+    """一条 DELETE ... WHERE id = ? RETURNING id 删除单行，返回是否删除了"""
+    table = entity.__table__
+    stmt = cached_statement(('delete_by_id', table.name), lambda: delete(table).where(table.c.id == bindparam('_id')).returning(table.c.id))
+    return db.session.execute(stmt, {'_id': id_}).first() is not None
+
+
+def update_rows(db, entity, rows):
+    """
+    按主键批量更新，不加载 ORM 对象。
+    要改的字段相同的行归为一组，每组一条 UPDATE ... WHERE id = ? 的 executemany，
+    返回实际更新的行数。
+    """
+    table = entity.__table__
+    groups = {}
+    for row in rows:
+        fields = tuple(sorted(key for key in row if key != 'id'))
+        groups.setdefault(fields, []).append({'_id': row['id'], **{'v_' + key: row[key] for key in fields}})
+    count = 0
+    for fields, params in groups.items():
+        if not fields:
+            continue
+        stmt = update(table).where(table.c.id == bindparam('_id')).values({key: bindparam('v_' + key) for key in fields})
+        for chunk in chunked(params):
+            count += db.session.execute(stmt, chunk).rowcount
+    return count
+
+
+def delete_rows(db, entity, ids):
+    """按 ID 集合批量删除，返回实际删除的行数"""
+    table = entity.__table__
+    count = 0
+    for chunk in chunked(ids):
+        count += db.session.execute(delete(table).where(table.c.id.in_(chunk))).rowcount
+    return count
+
+
+def parse_ids(raw):
+    """解析 ids=1,2,3 形式的参数，去重并保持顺序"""
+    try:
+        ids = [int(part) for part in (raw or '').split(',') if part.strip()]
+    except ValueError:
+        raise ValueError('ids must be a comma separated list of integers')
+    if not ids:
+        raise ValueError('ids is required')
+    return list(dict.fromkeys(ids))
+
+
+def read_ids():
+    """读取按 ID 批量读取的请求体：{"ids": [...]} 或 ID 数组，去重并保持顺序"""
+    body = request.get_json(silent=True)
+    ids = body.get('ids') if isinstance(body, dict) else body
+    if not isinstance(ids, list) or not all(isinstance(id_, int) and not isinstance(id_, bool) for id_ in ids):
+        raise ValueError('Request body must be {"ids": [...]} or a JSON array of integer ids')
+    if not ids:
+        raise ValueError('ids is required')
+    return list(dict.fromkeys(ids))
+
+
+def load_by_ids(db, table, ids, fields):
+    """
+    按 ID 列表批量读取，每 CHUNK_SIZE 个 ID 一条 WHERE id IN (...) 查询，语句按字段缓存。
+    返回 (按请求顺序排列的行, 不存在的 ID)，行里先是 fields 的列，没有请求 id 时补在最后
+    """
+    if len(ids) > MAX_LOOKUP_IDS:
+        raise ValueError(f'At most {MAX_LOOKUP_IDS} ids can be fetched at once')
+    selected = select_fields(fields, 'id')
+    stmt = cached_statement(
+        ('by_ids', table.name, selected),
+        lambda: select(*columns_for(table, selected)).where(table.c.id.in_(bindparam('ids', expanding=True))))
+    position = selected.index('id')
+    found = {}
+    for chunk in chunked(ids):
+        for row in db.session.execute(stmt, {'ids': chunk}):
+            found[row[position]] = row
+    return [found[id_] for id_ in ids if id_ in found], [id_ for id_ in ids if id_ not in found]
+
+
+def add_ids_argument(parser, help):
+    """给列表接口的解析器加上 ?ids= 参数"""
+    parser.add_argument('ids', type=str, location='args', help=help)
+    return parser
+
+
+def check_lookup_args(args, names):
+    """?ids= 按 ID 取记录，不能和分页、排序、流式输出以及过滤参数一起用"""
+    used = [name for name in ('limit', 'after', 'cursor', 'sort', 'stream') + tuple(names) if args.get(name) not in (None, '', False)]
+    if used:
+        raise ValueError('ids cannot be used with ' + ', '.join(used))
+
+
+def missing_headers(missing):
+    """批量读取时不存在的 ID 放在响应头 X-Missing-Ids 里，响应体和列表接口一样是记录数组"""
+    return {'X-Missing-Ids': ','.join(str(id_) for id_ in missing)} if missing else {}
+
+
+def id_ranges(ids):
+    """把 ID 列表压缩成 [起, 止] 区间列表"""
+    ranges = []
+    for id_ in sorted(ids):
+        if ranges and ranges[-1][1] + 1 == id_:
+            ranges[-1][1] = id_
+        else:
+            ranges.append([id_, id_])
+    return ranges
+
+
+def bulk_result(ids, errors):
+    """批量写入的统一响应"""
+    body = {'created': len(ids), 'id_ranges': id_ranges(ids), 'errors': errors}
+    return body, 201 if ids else 400
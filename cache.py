@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+from revisions import changes_committed
+
+POLICIES = ('lru', 'fifo')
+
+
+class EntityCache:
+    """
+    线程安全的有界缓存，按 LRU 或 FIFO 淘汰，可选 TTL 过期。
+    maxsize 为 0 时不缓存任何数据。
+    条目记下加载时的表修订号，修订号变了就不再命中：本进程的提交靠信号立即失效，
+    其他进程（多个 worker）的写入没有信号，靠修订号发现，不会在新的 ETag 下返回旧数据
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, policy='lru'):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        # 每次失效都加一，加载期间发生过失效的结果不写回缓存，避免把旧数据放回去
+        self._generation = 0
+        self.hits = self.misses = self.evictions = 0
+        self.configure(maxsize, ttl, policy)
+
+    def configure(self, maxsize, ttl=None, policy='lru'):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown cache policy: {policy}')
+        with self._lock:
+            self.maxsize, self.ttl, self.policy = maxsize, ttl, policy
+            self._evict()
+
+    def get_or_load(self, key, loader, revision=None):
+        """
+        缓存命中直接返回，否则调用 loader 读取并写回；loader 返回 None 时不缓存。
+        revision 为当前的表修订号，和条目加载时的不同就重新读取
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now) and entry[2] == revision:
+                self.hits += 1
+                if self.policy == 'lru':
+                    self._data.move_to_end(key)
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+        value = loader()
+        if value is not None and self.maxsize:
+            with self._lock:
+                if generation == self._generation:
+                    expires = now + self.ttl if self.ttl else None
+                    self._data[key] = (value, expires, revision)
+                    self._data.move_to_end(key)
+                    self._evict()
+        return value
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl, 'policy': self.policy,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            }
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+# 单条记录查询的缓存，键为主键，值为接口返回的 dict
+caches = {'player': EntityCache(), 'team': EntityCache()}
+
+
+def init_cache(app):
+    """按配置调整缓存大小、TTL 和淘汰策略"""
+    for cache in caches.values():
+        cache.configure(
+            app.config.get('ENTITY_CACHE_SIZE', 1024),
+            app.config.get('ENTITY_CACHE_TTL', 30),
+            app.config.get('ENTITY_CACHE_POLICY', 'lru'),
+        )
+
+
+@changes_committed.connect
+def _invalidate(table, ids=None):
+    cache = caches.get(table)
+    if cache is None:
+        return
+    if ids is None:
+        cache.clear()
+    else:
+        cache.invalidate(ids)
@@ -0,0 +1,222 @@
+import heapq
+import json
+import threading
+import time
+
+from flask import Response, current_app, has_app_context, request
+from sqlalchemy import DDL, bindparam, event, select, text
+
+from fieldsets import columns_for, row_mapper, select_fields
+from statements import cached_statement
+
+# table_revision 里全局变更序号那一行的名字；每次插入、修改、删除一行都会加一，
+# 跨表单调递增，写到行的 revision 列或删除记录里
+CHANGES = 'changes'
+
+TOMBSTONE = 'tombstone'
+
+SSE_MIMETYPE = 'text/event-stream'
+
+_BUMP = (f"INSERT INTO table_revision (name, revision) VALUES ('{CHANGES}', 1) "
+         f"ON CONFLICT (name) DO UPDATE SET revision = revision + 1;")
+_CURRENT = f"(SELECT revision FROM table_revision WHERE name = '{CHANGES}')"
+
+
+def tracked_columns(base):
+    """修改后要分配新序号的列：除主键和 revision 以外的全部列"""
+    return [column.name for column in base.columns if not column.primary_key and column.name != 'revision']
+
+
+def changes_ddl(base):
+    """
+    base 表上分配变更序号的触发器：插入、修改后把新序号写到行的 revision 列，
+    删除时写一条删除记录（tombstone）。只改 revision 列不会再次触发
+    """
+    source = base.name
+    stamp = f'UPDATE {source} SET revision = {_CURRENT} WHERE id = new.id;'
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {source}_changes_ai AFTER INSERT ON {source} BEGIN {_BUMP} {stamp} END',
+        f"CREATE TRIGGER IF NOT EXISTS {source}_changes_au AFTER UPDATE OF {', '.join(tracked_columns(base))} ON {source} BEGIN "
+        f'{_BUMP} {stamp} END',
+        f'CREATE TRIGGER IF NOT EXISTS {source}_changes_ad AFTER DELETE ON {source} BEGIN {_BUMP} '
+        f"INSERT INTO {TOMBSTONE} (table_name, row_id, revision) VALUES ('{source}', old.id, {_CURRENT}); END",
+    ]
+
+
+def drop_triggers_ddl(base):
+    return [f'DROP TRIGGER IF EXISTS {base.name}_changes_{suffix}' for suffix in ('ai', 'ad', 'au')]
+
+
+def stamp_ddl(base):
+    """
+    给没有序号的行（关掉触发器批量写入的）补上序号：从当前序号往后按 id 依次分配，
+    每行的序号仍然不同，按序号翻页不会漏行
+    """
+    return [
+        f"INSERT INTO table_revision (name, revision) VALUES ('{CHANGES}', 0) ON CONFLICT (name) DO NOTHING",
+        f'UPDATE {base.name} SET revision = {_CURRENT} + id WHERE revision IS NULL',
+        f"UPDATE table_revision SET revision = max(revision, (SELECT coalesce(max(revision), 0) FROM {base.name})) WHERE name = '{CHANGES}'",
+    ]
+
+
+def install_changes(base):
+    """create_all / drop_all 时一起创建、删除变更序号的触发器（只对 SQLite 生效）"""
+    for statement in changes_ddl(base):
+        event.listen(base, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    for statement in drop_triggers_ddl(base):
+        event.listen(base, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def add_since_argument(parser):
+    """给列表接口的解析器加上 ?since= 参数"""
+    parser.add_argument('since', type=int, location='args', help='只返回序号大于该值的变更（含删除），下一次的 since 在响应头 X-Revision 中')
+    return parser
+
+
+def check_since_args(args, names):
+    """?since= 按变更序号增量同步，不能和游标翻页、排序、流式输出、按 ID 读取以及过滤参数一起用"""
+    used = [name for name in ('after', 'cursor', 'sort', 'stream', 'ids') + tuple(names) if args.get(name) not in (None, '', False)]
+    if used:
+        raise ValueError('since cannot be used with ' + ', '.join(used))
+
+
+def head_revision(connection):
+    """当前的全局变更序号"""
+    return connection.execute(text('SELECT revision FROM table_revision WHERE name = :name'), {'name': CHANGES}).scalar() or 0
+
+
+def changes_since(connection, table, since, fields, limit, head=None):
+    """
+    table 表序号在 (since, head] 之间的变更，按序号排序，最多 limit 条：
+    修改过的行输出 fields 加上 id 和 revision，删除的行输出 {"id", "revision", "deleted": true}。
+    返回 (变更, 下一次的 since, 是否还有)；head 默认为当前序号，读到的变更不会跨过它
+    """
+    from models import Tombstone
+
+    if since < 0:
+        raise ValueError('since must not be negative')
+    if head is None:
+        head = head_revision(connection)
+    selected = select_fields(fields, 'id', 'revision')
+    rows_stmt = cached_statement(
+        ('changes', table.name, selected),
+        lambda: select(*columns_for(table, selected))
+        .where(table.c.revision > bindparam('since'), table.c.revision <= bindparam('head'))
+        .order_by(table.c.revision).limit(bindparam('limit')))
+    tombstones = Tombstone.__table__
+    tombstones_stmt = cached_statement(
+        ('tombstones', table.name),
+        lambda: select(tombstones.c.row_id, tombstones.c.revision)
+        .where(tombstones.c.table_name == table.name, tombstones.c.revision > bindparam('since'), tombstones.c.revision <= bindparam('head'))
+        .order_by(tombstones.c.revision).limit(bindparam('limit')))
+    params = {'since': since, 'head': head, 'limit': limit}
+    to_dict = row_mapper(selected)
+    changed = [(row.revision, to_dict(row)) for row in connection.execute(rows_stmt, params)]
+    deleted = [(row.revision, {'id': row.row_id, 'revision': row.revision, 'deleted': True}) for row in connection.execute(tombstones_stmt, params)]
+    items = [item for _, item in heapq.merge(changed, deleted, key=lambda pair: pair[0])]
+    # 合并后超过 limit 条被截掉了，或者任一边取满了 limit 条，后面都可能还有
+    more = len(items) > limit or len(changed) == limit or len(deleted) == limit
+    items = items[:limit]
+    return items, (items[-1]['revision'] if more else head), more
+
+
+def since_headers(next_since, more):
+    """?since= 的响应头：X-Revision 为下一次请求的 since，还有没返回的变更时 X-More-Changes 为 true"""
+    headers = {'X-Revision': str(next_since)}
+    if more:
+        headers['X-More-Changes'] = 'true'
+    return headers
+
+
+class ChangeNotifier:
+    """写接口提交后唤醒等待中的 /changes 连接，不用每个连接都轮询数据库"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.version = 0
+
+    def notify(self):
+        with self._condition:
+            self.version += 1
+            self._condition.notify_all()
+
+    def wait(self, version, timeout):
+        """等到有新的提交（version 变化）或超时，返回当前的 version"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+def format_event(table, item):
+    """一条变更对应的 SSE 事件，id 为变更序号，断线重连时浏览器会带上 Last-Event-ID"""
+    data = {'table': table, 'op': 'delete' if item.get('deleted') else 'upsert', 'id': item['id'], 'revision': item['revision']}
+    if not item.get('deleted'):
+        data['row'] = item
+    return f"id: {item['revision']}\nevent: change\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def next_batch(connection, tables, since, limit):
+    """
+    tables（{表名: (表, 输出字段)}）里序号大于 since 的下一批变更，
+    返回 (按序号排好的 [(序号, 表名, 变更)], 当前序号)
+    """
+    head = head_revision(connection)
+    if since >= head:
+        return [], head
+    batch = [(item['revision'], name, item) for name, (table, fields) in tables.items()
+             for item in changes_since(connection, table, since, fields, limit, head)[0]]
+    return sorted(batch, key=lambda change: change[0])[:limit], head
+
+
+def stream_changes(engine, tables, since, follow=True):
+    """
+    以 Server-Sent Events 推送 tables 序号大于 since 的变更：先补发积压的变更，follow 时再等待新的提交。
+    本进程的提交立即唤醒，其他进程的写入靠每 CHANGES_POLL_INTERVAL 秒查一次序号发现；
+    空闲时每 CHANGES_HEARTBEAT 秒发一行注释，防止代理断开连接
+    """
+    config = current_app.config
+    notifier = current_app.extensions[CHANGES]
+    batch_size, poll, heartbeat = config['CHANGES_BATCH_SIZE'], config['CHANGES_POLL_INTERVAL'], config['CHANGES_HEARTBEAT']
+
+    def generate():
+        last, version, idle_since = since, notifier.version, time.monotonic()
+        yield 'retry: 3000\n\n'
+        while True:
+            # 每批用一个新连接读，发送时不占着连接
+            with engine.connect() as connection:
+                batch, head = next_batch(connection, tables, last, batch_size)
+            if batch:
+                last, idle_since = batch[-1][0], time.monotonic()
+                yield ''.join(format_event(name, item) for _, name, item in batch)
+                continue
+            # 其他表的变更不用再查一遍
+            last = max(last, head)
+            if not follow:
+                return
+            if time.monotonic() - idle_since >= heartbeat:
+                idle_since = time.monotonic()
+                yield ': keep-alive\n\n'
+            version = notifier.wait(version, poll)
+
+    # 生成器只用传进来的引擎，不保留请求上下文，长连接期间不占着 db.session
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(generate(), mimetype=SSE_MIMETYPE, headers=headers)
+
+
+def last_event_id():
+    """断线重连时浏览器带上的 Last-Event-ID，不是数字时忽略"""
+    value = request.headers.get('Last-Event-ID', '')
+    return int(value) if value.isdigit() else None
+
+
+def init_changes(app, db):
+    """写接口提交后通知本应用的 /changes 连接"""
+    notifier = app.extensions[CHANGES] = ChangeNotifier()
+
+    def on_commit(table, ids=None):
+        # 测试里会创建多个应用，只处理本应用上下文里的提交
+        if has_app_context() and current_app._get_current_object() is app:
+            notifier.notify()
+
+    from revisions import changes_committed
+    changes_committed.connect(on_commit, weak=False)
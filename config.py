@@ -0,0 +1,82 @@
+import os
+
+
+class Config:
+    """默认配置，本地开发和测试使用"""
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///your_database.db')
+
+    # 单条记录查询缓存
+    ENTITY_CACHE_SIZE = 1024
+    ENTITY_CACHE_TTL = 30
+    ENTITY_CACHE_POLICY = 'lru'
+
+    # 按形状缓存的热点查询语句数（单条读取、列表页、按 ID 更新），0 表示每次重新构造
+    STATEMENT_CACHE_SIZE = 1024
+
+    # 每个新的 SQLite 连接上执行的 PRAGMA
+    SQLITE_PRAGMAS = {}
+    # 为 GET/HEAD 请求单独开一个只读引擎（连接上设置 query_only）
+    SQLITE_READ_ENGINE = False
+    SQLITE_READ_ENGINE_OPTIONS = {}
+
+    # 组提交：单行写请求交给一个写线程，攒够 GROUP_COMMIT_MAX_ITEMS 个或等满 GROUP_COMMIT_MAX_DELAY 秒后一起提交；
+    # 等待时间为 0 时只合并上一批提交期间排队的请求，并发低时不增加延迟；
+    # 请求等写线程超过 GROUP_COMMIT_TIMEOUT 秒返回 503
+    GROUP_COMMIT = False
+    GROUP_COMMIT_MAX_ITEMS = 100
+    GROUP_COMMIT_MAX_DELAY = 0
+    GROUP_COMMIT_TIMEOUT = 30
+
+    # 请求指标，/metrics 以 Prometheus 文本格式输出
+    METRICS_ENABLED = True
+    METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    # 慢请求采样分析：设置为秒数后，按 PROFILE_SAMPLE_RATE 的比例对请求采样调用栈，
+    # 耗时超过该值的请求把折叠栈写到 PROFILE_DIR
+    PROFILE_SLOW_REQUESTS = None
+    PROFILE_SAMPLE_RATE = 1.0
+    PROFILE_INTERVAL = 0.005
+    PROFILE_DIR = 'profiles'
+
+    # 分析接口用的球员数据列快照（进程内的定长整数数组），写接口提交后增量更新；
+    # 其他进程的写入要等 ANALYTICS_MAX_AGE 秒后整体重新加载才能看到。关闭时分析接口每次从数据库读取
+    ANALYTICS_SNAPSHOT = False
+    ANALYTICS_MAX_AGE = 60
+
+    # /changes 推送：每批最多读多少条变更，每隔多少秒查一次其他进程的写入，空闲多少秒发一次心跳
+    CHANGES_BATCH_SIZE = 500
+    CHANGES_POLL_INTERVAL = 1.0
+    CHANGES_HEARTBEAT = 15
+
+    # swagger.json 在每个进程里只生成一次；指向部署时用 flask openapi PATH 生成的文件时直接读取文件
+    OPENAPI_SPEC_FILE = os.environ.get('OPENAPI_SPEC_FILE')
+
+
+class ProductionConfig(Config):
+    """生产配置：WAL 模式下读写互不阻塞，读请求走独立的只读连接池"""
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    }
+    # SQLite 同一时刻只有一个写者，写连接池不需要太大
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 4,
+        'max_overflow': 4,
+        'pool_timeout': 10,
+    }
+    SQLITE_READ_ENGINE = True
+    SQLITE_READ_ENGINE_OPTIONS = {
+        'pool_size': 16,
+        'max_overflow': 16,
+        'pool_timeout': 10,
+    }
+    ANALYTICS_SNAPSHOT = True
+
+
+configs = {
+    'development': Config,
+    'production': ProductionConfig,
+}
@@ -0,0 +1,197 @@
+import csv
+import io
+from itertools import islice
+
+from flask import Response, request, stream_with_context
+from flask_restx import inputs
+from jsonschema import Draft4Validator
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import FileStorage
+
+from bulk import chunked, partial_schema
+from revisions import mark_changed
+from streaming import BATCH_SIZE
+
+CSV_MIMETYPE = 'text/csv'
+# 导入时每个事务写入的行数：中途失败时之前的块已经提交，内存里最多只有一块
+IMPORT_CHUNK_SIZE = 1000
+# 响应里最多列出的错误行，其余的只计数
+MAX_ERRORS = 100
+
+
+def add_import_arguments(parser):
+    """给导入接口的解析器加上上传文件和 upsert 开关"""
+    parser.add_argument('file', type=FileStorage, location='files', help='CSV 文件，第一行为表头；也可以直接用 text/csv 请求体上传')
+    parser.add_argument('upsert', type=inputs.boolean, location='args', help='按唯一键更新已有记录，不存在时插入')
+    return parser
+
+
+def stream_csv(db, stmt, filename, batch_size=BATCH_SIZE):
+    """
+    用服务端游标按批读取查询结果，逐批以 CSV 输出，第一行为列名。
+    和 stream_rows 一样内存里最多只有一批数据
+    """
+    columns = tuple(stmt.selected_columns.keys())
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+        for batch in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(batch)
+            yield buffer.getvalue()
+
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    return Response(stream_with_context(generate()), mimetype=CSV_MIMETYPE, headers=headers)
+
+
+def read_csv():
+    """
+    逐行解析上传的 CSV：multipart 的 file 字段，或 text/csv 请求体，不把整个文件读进内存。
+    返回 (表头, 生成 (行号, 行字典) 的迭代器)，行号从表头的 1 开始数
+    """
+    upload = request.files.get('file')
+    stream = upload.stream if upload is not None else request.stream
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    try:
+        header = [name.strip() for name in next(reader)]
+    except StopIteration:
+        raise ValueError('CSV file is empty')
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid CSV: {e}')
+
+    def rows():
+        try:
+            for values in reader:
+                if any(values):
+                    yield reader.line_num, dict(zip(header, values))
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise ValueError(f'Invalid CSV at line {reader.line_num + 1}: {e}')
+
+    return header, rows()
+
+
+def _coerce(schema, item):
+    # CSV 里都是字符串：整数列转成 int，空单元格当作没有值；转不了的留给校验报错
+    for name, value in item.items():
+        if schema['properties'].get(name, {}).get('type') != 'integer':
+            continue
+        value = value.strip() if value is not None else ''
+        if not value:
+            item[name] = None
+        else:
+            try:
+                item[name] = int(value)
+            except ValueError:
+                pass
+    return item
+
+
+def import_csv(db, entity, model, key, upsert=False, unique=(), chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    把上传的 CSV 导入 entity 对应的表，每 chunk_size 行校验、写入并提交一次。
+    upsert=True 时按唯一列 key 合并：已有的记录只更新 CSV 里出现的列，没有的按完整的模型校验后插入；
+    否则一律插入，CSV 里的 id 列被忽略，unique 中的列和库里或前面的行重复时该行报错。
+    某一块写入失败只回滚这一块，继续导入后面的行。返回导入结果汇总
+    """
+    table = entity.__table__
+    header, rows = read_csv()
+    allowed = ('id',) + tuple(model)
+    unknown = [name for name in header if name not in allowed]
+    if unknown:
+        raise ValueError('Unknown columns: ' + ', '.join(unknown))
+    if upsert and key not in header:
+        raise ValueError(f'CSV must have a {key} column to upsert')
+    schema = partial_schema(model, key) if upsert else model.__schema__
+    validator = Draft4Validator(schema)
+    # upsert 时库里还没有的 key 要新建，必填字段一个都不能少
+    insert_validator = Draft4Validator(dict(model.__schema__, properties=schema['properties']))
+    columns = [name for name in header if name in schema['properties']]
+    taken = {name: set() for name in unique}
+    summary = {'rows': 0, 'created': 0, 'updated': 0, 'failed': 0, 'chunks': 0, 'errors': []}
+
+    def fail(line, error, count=1):
+        summary['failed'] += count
+        if len(summary['errors']) < MAX_ERRORS:
+            summary['errors'].append({'line': line, 'error': error})
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        summary['rows'] += len(chunk)
+        valid = []
+        for line, item in chunk:
+            item = _coerce(schema, item)
+            messages = [e.message for e in validator.iter_errors(item)]
+            if messages:
+                fail(line, '; '.join(messages))
+            else:
+                valid.append((line, {name: item[name] for name in columns}))
+        if not upsert:
+            for name, seen in taken.items():
+                for values in chunked([row[name] for _, row in valid]):
+                    seen.update(db.session.scalars(db.select(table.c[name]).where(table.c[name].in_(values))))
+                kept = []
+                for line, row in valid:
+                    if row[name] in seen:
+                        fail(line, f'{name} already exists')
+                    else:
+                        seen.add(row[name])
+                        kept.append((line, row))
+                valid = kept
+        existing = set()
+        if upsert:
+            for values in chunked([row[key] for _, row in valid]):
+                existing.update(db.session.scalars(db.select(table.c[key]).where(table.c[key].in_(values))))
+            kept, inserted = [], set()
+            for line, row in valid:
+                if row[key] not in existing and row[key] not in inserted:
+                    messages = [e.message for e in insert_validator.iter_errors(row)]
+                    if messages:
+                        fail(line, '; '.join(messages))
+                        continue
+                    # 同一块里后面 key 相同的行更新这一行
+                    inserted.add(row[key])
+                kept.append((line, row))
+            valid = kept
+        if not valid:
+            continue
+        try:
+            created, ids = _write_chunk(db, table, key, [row for _, row in valid], upsert, existing)
+            mark_changed(table.name, ids)
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            fail(valid[0][0], f'Lines {valid[0][0]}-{valid[-1][0]} were not imported: {e.orig}', len(valid))
+            continue
+        summary['chunks'] += 1
+        summary['created'] += created
+        summary['updated'] += len(valid) - created
+    return summary
+
+
+def _write_chunk(db, table, key, rows, upsert, existing=()):
+    """写入一块行，existing 为 upsert 时库里已有的 key，返回 (新建的行数, 涉及的 ID 列表)"""
+    if not upsert:
+        ids = []
+        for part in chunked(rows):
+            ids.extend(db.session.scalars(insert(table).returning(table.c.id), part))
+        return len(ids), ids
+    created = len({row[key] for row in rows} - existing)
+    stmt = insert(table)
+    updates = {name: stmt.excluded[name] for name in rows[0] if name != key}
+    if updates:
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c[key]], set_=updates)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[table.c[key]])
+    ids = []
+    for part in chunked(rows):
+        ids.extend(db.session.scalars(stmt.returning(table.c.id), part))
+    # DO NOTHING 的行没有 RETURNING，但也没有被修改
+    return created, ids
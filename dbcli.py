@@ -0,0 +1,37 @@
+import click
+
+
+class LazyMigrateGroup(click.Group):
+    """
+    flask db 命令组的占位：真正执行 flask db 时才导入 Flask-Migrate（连带 alembic），
+    换上它的参数和回调，子命令也从它那里取。处理请求的进程从不执行迁移，不用为它多花导入时间
+    """
+
+    def __init__(self, app, db, **kwargs):
+        super().__init__('db', help='Perform database migrations.')
+        self.app, self.db, self.kwargs = app, db, kwargs
+        self._group = None
+
+    def _load(self):
+        if self._group is None:
+            from flask_migrate import Migrate
+            from flask_migrate.cli import db as db_cli_group
+            Migrate(self.app, self.db, **self.kwargs)
+            self._group = db_cli_group
+            self.params, self.callback = db_cli_group.params, db_cli_group.callback
+        return self._group
+
+    def parse_args(self, ctx, args):
+        self._load()
+        return super().parse_args(ctx, args)
+
+    def list_commands(self, ctx):
+        return self._load().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._load().get_command(ctx, name)
+
+
+def init_migrate(app, db, **kwargs):
+    """注册 flask db 命令，kwargs 原样传给 Migrate"""
+    app.cli.add_command(LazyMigrateGroup(app, db, **kwargs))
@@ -0,0 +1,48 @@
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+
+READ_ENGINE = 'readonly_engine'
+
+
+class RoutingSession(Session):
+    """GET/HEAD 请求里的查询交给只读引擎，其余情况沿用默认的绑定规则"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and request.method in ('GET', 'HEAD'):
+            engine = read_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_engines(app, db):
+    """
+    给 SQLite 引擎的新连接执行配置里的 PRAGMA；
+    开启只读引擎时再为同一个库建一个独立连接池，连接上打开 query_only
+    """
+    pragmas = [f'PRAGMA {name} = {value}' for name, value in app.config['SQLITE_PRAGMAS'].items()]
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+        if pragmas:
+            event.listen(engine, 'connect', _pragma_hook(pragmas))
+        if app.config['SQLITE_READ_ENGINE']:
+            read_engine = create_engine(engine.url, **app.config['SQLITE_READ_ENGINE_OPTIONS'])
+            event.listen(read_engine, 'connect', _pragma_hook(pragmas + ['PRAGMA query_only = ON']))
+            app.extensions[READ_ENGINE] = read_engine
+
+
+def read_engine():
+    """当前应用的只读引擎，没有开启时返回 None"""
+    return current_app.extensions.get(READ_ENGINE)
+
+
+def _pragma_hook(statements):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    return on_connect
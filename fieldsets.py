@@ -0,0 +1,45 @@
+from functools import lru_cache
+
+
+def add_fields_argument(parser):
+    """给接口的解析器加上 ?fields= 参数"""
+    parser.add_argument('fields', type=str, location='args', help='逗号分隔的返回字段，例如 id,name,points')
+    return parser
+
+
+def parse_fields(raw, model):
+    """
+    解析 ?fields=，按 restx 模型的字段（加上 id）校验，返回要输出的字段元组；
+    没有指定时返回全部字段
+    """
+    allowed = ('id',) + tuple(model)
+    if not raw:
+        return allowed
+    names = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(unknown))
+    if not names:
+        raise ValueError('fields must not be empty')
+    return names
+
+
+def columns_for(table, fields):
+    """字段名对应的表列（Core 列，查询结果是普通的行元组）"""
+    return [table.c[name] for name in fields]
+
+
+def select_fields(fields, *extra):
+    """查询要取的字段：先是输出字段，再补上分页、排序需要但没有请求的列"""
+    return fields + tuple(name for name in dict.fromkeys(extra) if name not in fields)
+
+
+@lru_cache(maxsize=256)
+def row_mapper(fields):
+    """
+    为一组输出字段生成 row -> dict 的函数，按字段元组缓存。
+    zip 在字段用完时停止，只输出前 len(fields) 列，select_fields 补上的列不会输出
+    """
+    def to_dict(row):
+        return dict(zip(fields, row))
+    return to_dict
@@ -0,0 +1,252 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Response, g, has_request_context, request
+from flask_restx.representations import output_json
+from sqlalchemy import event
+
+from cache import caches
+from statements import compiled_stats, statements
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """单个请求的计数，请求结束时并入 Registry"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.sampler = None
+
+
+class Registry:
+    """按接口汇总的指标，线程安全"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._totals = {}
+        self.profiles = 0
+
+    def observe(self, method, endpoint, status, stats, seconds):
+        with self._lock:
+            histogram = self._latency.get((method, endpoint, status))
+            if histogram is None:
+                histogram = self._latency[(method, endpoint, status)] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+            totals = self._totals.setdefault(endpoint, Counter())
+            totals['db_statements'] += stats.statements
+            totals['db_seconds'] += stats.sql_seconds
+            totals['json_encode_seconds'] += stats.encode_seconds
+            totals['rows'] += stats.rows
+            totals['bytes'] += stats.bytes
+
+    def profile_written(self):
+        with self._lock:
+            self.profiles += 1
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (method, endpoint, status), (counts, total, count) in sorted(self._latency.items()):
+                labels = f'method="{method}",endpoint="{_escape(endpoint)}",status="{status}"'
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {total}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {count}')
+            for name, key, help_text in TOTALS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, totals in sorted(self._totals.items()):
+                    lines.append(f'{name}{{endpoint="{_escape(endpoint)}"}} {totals[key]}')
+            lines.append('# HELP profiles_written_total Slow request profiles written to disk.')
+            lines.append('# TYPE profiles_written_total counter')
+            lines.append(f'profiles_written_total {self.profiles}')
+        lines.append('# HELP entity_cache_requests_total Entity cache lookups by result.')
+        lines.append('# TYPE entity_cache_requests_total counter')
+        for name, cache in sorted(caches.items()):
+            stats = cache.stats()
+            lines.append(f'entity_cache_requests_total{{cache="{name}",result="hit"}} {stats["hits"]}')
+            lines.append(f'entity_cache_requests_total{{cache="{name}",result="miss"}} {stats["misses"]}')
+        stats = statements.stats()
+        lines.append('# HELP statement_cache_requests_total Cached statement lookups by result.')
+        lines.append('# TYPE statement_cache_requests_total counter')
+        lines.append(f'statement_cache_requests_total{{result="hit"}} {stats["hits"]}')
+        lines.append(f'statement_cache_requests_total{{result="miss"}} {stats["misses"]}')
+        lines.append('# HELP sql_compiled_cache_total SQL executions by compiled cache result.')
+        lines.append('# TYPE sql_compiled_cache_total counter')
+        for result, count in compiled_stats.stats().items():
+            lines.append(f'sql_compiled_cache_total{{result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# (指标名, RequestStats 字段, 说明)
+TOTALS = [
+    ('db_statements_total', 'db_statements', 'SQL statements executed.'),
+    ('db_statement_duration_seconds_total', 'db_seconds', 'Time spent executing SQL statements.'),
+    ('json_encode_duration_seconds_total', 'json_encode_seconds', 'Time spent encoding JSON responses.'),
+    ('response_rows_total', 'rows', 'Records returned in response bodies.'),
+    ('response_bytes_total', 'bytes', 'Response body bytes sent.'),
+]
+
+
+class Sampler(threading.Thread):
+    """
+    采样分析器：后台线程每隔 interval 秒抓一次请求线程的调用栈，
+    按折叠栈格式（flamegraph.pl / speedscope 可直接读取）计数，开销和请求里执行了多少 Python 代码无关
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id, self.interval = thread_id, interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def init_metrics(app, db, api):
+    """
+    用请求钩子和游标事件收集每个接口的延迟、SQL 语句数和耗时、返回行数和字节数，
+    在 /metrics 以 Prometheus 文本格式输出；PROFILE_SLOW_REQUESTS 设置时对慢请求保存采样分析结果
+    """
+    if not app.config['METRICS_ENABLED']:
+        return
+    registry = app.extensions['metrics'] = Registry(app.config['METRICS_BUCKETS'])
+    slow = app.config['PROFILE_SLOW_REQUESTS']
+
+    @app.before_request
+    def start_request():
+        if request.endpoint == 'metrics':
+            return
+        stats = g._metrics = RequestStats()
+        if slow is not None and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+            stats.sampler = Sampler(threading.get_ident(), app.config['PROFILE_INTERVAL'])
+            stats.sampler.start()
+
+    @app.after_request
+    def finish_request(response):
+        # 不从 g 里删除：流式响应发送期间执行的 SQL 还要记到这个请求上
+        stats = g.get('_metrics')
+        if stats is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        method, status = request.method, response.status_code
+
+        def finish():
+            seconds = time.perf_counter() - stats.started
+            registry.observe(method, endpoint, status, stats, seconds)
+            if stats.sampler is not None:
+                stats.sampler.stop()
+                if seconds >= slow:
+                    _write_profile(app, registry, stats.sampler, method, endpoint)
+
+        if response.is_streamed:
+            # 流式响应在发送完之后才算结束，边发送边统计字节数和 NDJSON 行数
+            response.response = _counting(response.response, stats)
+            response.call_on_close(finish)
+        else:
+            stats.bytes = response.calculate_content_length() or 0
+            finish()
+        return response
+
+    @app.teardown_request
+    def clear_request(exc):
+        # 测试里多个请求共用一个应用上下文，g 不会自动清空
+        g.pop('_metrics', None)
+
+    app.add_url_rule('/metrics', 'metrics', lambda: Response(registry.render(), mimetype=PROMETHEUS_MIMETYPE))
+    # restx 的 JSON 输出经过这里，顺便记录编码耗时和返回的记录数
+    api.representations['application/json'] = _timed_output_json
+
+    with app.app_context():
+        engines = [db.engine] + [engine for engine in [app.extensions.get('readonly_engine')] if engine is not None]
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and '_metrics' in g:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if started and has_request_context() and '_metrics' in g:
+        stats = g._metrics
+        stats.statements += 1
+        stats.sql_seconds += time.perf_counter() - started.pop()
+
+
+def _timed_output_json(data, code, headers=None):
+    if not (has_request_context() and '_metrics' in g):
+        return output_json(data, code, headers)
+    stats = g._metrics
+    started = time.perf_counter()
+    response = output_json(data, code, headers)
+    stats.encode_seconds += time.perf_counter() - started
+    if code < 400:
+        stats.rows += len(data) if isinstance(data, list) else 1
+    return response
+
+
+def _counting(chunks, stats):
+    for chunk in chunks:
+        data = chunk.encode() if isinstance(chunk, str) else chunk
+        stats.bytes += len(data)
+        stats.rows += data.count(b'\n')
+        yield chunk
+
+
+def _write_profile(app, registry, sampler, method, endpoint):
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    name = ''.join(c if c.isalnum() else '_' for c in endpoint).strip('_')
+    sampler.dump(os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{method}-{name}-{threading.get_ident()}.folded'))
+    registry.profile_written()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
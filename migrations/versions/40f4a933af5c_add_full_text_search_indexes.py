@@ -0,0 +1,43 @@
+"""add full text search indexes
+
+Revision ID: 40f4a933af5c
+Revises: 890da02b33d8
+Create Date: 2026-10-18 15:05:24.775360
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '40f4a933af5c'
+down_revision = '890da02b33d8'
+branch_labels = None
+depends_on = None
+
+
+# 迁移里写死 DDL，不引用应用代码，以后修改 search.py 不会影响已有的迁移
+TABLES = ('team', 'player')
+
+
+def upgrade():
+    for table in TABLES:
+        fts = f'{table}_fts'
+        op.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5(name, content='{table}', content_rowid='id', tokenize='trigram')")
+        op.execute(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                   f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END")
+        op.execute(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                   f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END")
+        op.execute(f"CREATE TRIGGER {fts}_au AFTER UPDATE OF name ON {table} BEGIN "
+                   f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+                   f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END")
+        # 给已有数据建索引
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        fts = f'{table}_fts'
+        for suffix in ('au', 'ad', 'ai'):
+            op.execute(f'DROP TRIGGER {fts}_{suffix}')
+        op.execute(f'DROP TABLE {fts}')
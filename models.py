@@ -1,16 +1,70 @@
 from app import db
+from search import install_fts
+from rollups import install_rollups
+from changes import install_changes
 
 class Team(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True)
-    points_scored = db.Column(db.Integer)
+    points_scored = db.Column(db.Integer, index=True)
     rebounds = db.Column(db.Integer)
     assists = db.Column(db.Integer)
+    # 全局变更序号，插入、修改时由触发器写入（见 changes.py），?since= 和 /changes 按它增量同步
+    revision = db.Column(db.Integer, index=True)
+    # 球队阵容；删除球队时不改动球员（passive_deletes='all'），和原来只有外键时的行为一致
+    players = db.relationship('Player', back_populates='team', order_by='Player.id', passive_deletes='all')
 
 class Player(db.Model):
+    # 按球队过滤时每种排序都有 (team_id, 排序列) 复合索引（末尾隐含 id），过滤后按排序列的顺序范围扫描，不用再排序；
+    # (team_id) 同时服务于按 id 排序和按 team_id IN (...) 批量读取阵容
+    __table_args__ = (
+        db.Index('ix_player_team_id', 'team_id'),
+        db.Index('ix_player_team_id_name', 'team_id', 'name'),
+        db.Index('ix_player_team_id_points', 'team_id', 'points'),
+        db.Index('ix_player_team_id_rebounds', 'team_id', 'rebounds'),
+        db.Index('ix_player_team_id_assists', 'team_id', 'assists'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80))
+    name = db.Column(db.String(80), index=True)
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'))
-    points = db.Column(db.Integer)
-    rebounds = db.Column(db.Integer)
-    assists = db.Column(db.Integer)
\ No newline at end of file
+    points = db.Column(db.Integer, index=True)
+    rebounds = db.Column(db.Integer, index=True)
+    assists = db.Column(db.Integer, index=True)
+    # 全局变更序号，插入、修改时由触发器写入（见 changes.py），?since= 和 /changes 按它增量同步
+    revision = db.Column(db.Integer, index=True)
+    team = db.relationship('Team', back_populates='players')
+
+class TeamRollup(db.Model):
+    # 按球队汇总的球员人数和数据之和，由球员表上的触发器增量维护（见 rollups.py），读汇总不用扫描球员表；
+    # 没有球队的球员汇总在 team_id 0 下
+    team_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    players = db.Column(db.Integer, nullable=False, default=0)
+    points = db.Column(db.Integer, nullable=False, default=0)
+    rebounds = db.Column(db.Integer, nullable=False, default=0)
+    assists = db.Column(db.Integer, nullable=False, default=0)
+
+class Tombstone(db.Model):
+    # 删除记录：哪张表的哪一行在哪个变更序号被删除，由触发器写入，下游增量同步时据此删掉本地的行
+    __table_args__ = (db.Index('ix_tombstone_table_name_revision', 'table_name', 'revision'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(32), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+
+class TableRevision(db.Model):
+    # 每张表一个修订号，写接口在同一个事务里递增，读接口用它生成 ETag
+    name = db.Column(db.String(32), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+# 球队名、球员名的全文索引（FTS5 trigram），由触发器同步
+install_fts(Team.__table__)
+install_fts(Player.__table__)
+
+# 球队汇总，由球员表上的触发器同步
+install_rollups(Player.__table__)
+
+# 变更序号和删除记录，由触发器维护
+install_changes(Team.__table__)
+install_changes(Player.__table__)
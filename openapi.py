@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+
+import click
+from flask import Response, request
+
+OPENAPI = 'openapi'
+
+
+class SpecCache:
+    """
+    swagger.json 的响应体：进程里只生成一次 JSON 字节串和 ETag，之后每个请求直接返回，
+    客户端带 If-None-Match 时返回 304。设置了 OPENAPI_SPEC_FILE 时直接读部署时生成好的文件
+    """
+
+    def __init__(self, api, path=None):
+        self.api = api
+        self._lock = threading.Lock()
+        self.body = self.etag = None
+        if path:
+            with open(path, 'rb') as f:
+                self._set(f.read())
+
+    def _set(self, body):
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def get(self):
+        """返回 (响应体, ETag)，第一次调用时生成，需要在请求上下文里（basePath 要用 url_for）"""
+        if self.body is None:
+            with self._lock:
+                if self.body is None:
+                    schema = self.api.__schema__
+                    if 'error' in schema:
+                        # 生成失败不缓存，restx 已经记录了异常
+                        return None, None
+                    self._set(render_spec(schema))
+        return self.body, self.etag
+
+
+def render_spec(schema):
+    return json.dumps(schema, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def init_openapi(app, api):
+    """用缓存的字节串替换 restx 的 swagger.json 接口，并注册 flask openapi 命令在部署时预先生成文件"""
+    if 'specs' not in app.view_functions:
+        return
+    cache = app.extensions[OPENAPI] = SpecCache(api, app.config['OPENAPI_SPEC_FILE'])
+
+    def specs():
+        body, etag = cache.get()
+        if body is None:
+            return Response(json.dumps({'message': 'Unable to render schema'}), status=500, mimetype='application/json')
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    app.view_functions['specs'] = specs
+
+    @app.cli.command('openapi')
+    @click.argument('path')
+    def write_spec(path):
+        """把 swagger.json 写到 PATH，配合 OPENAPI_SPEC_FILE 使用"""
+        with app.test_request_context():
+            schema = api.__schema__
+        if 'error' in schema:
+            raise click.ClickException(schema['error'])
+        with open(path, 'wb') as f:
+            f.write(render_spec(schema))
+        click.echo(f'Wrote {path}')
@@ -0,0 +1,199 @@
+import base64
+import binascii
+import json
+from urllib.parse import urlencode
+
+from flask import request
+from sqlalchemy import and_, bindparam, tuple_
+
+from statements import cached_statement
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def add_page_arguments(parser):
+    """给列表接口的解析器加上分页参数"""
+    parser.add_argument('limit', type=int, location='args', help=f'每页条数，默认 {DEFAULT_LIMIT}，最大 {MAX_LIMIT}')
+    parser.add_argument('after', type=int, location='args', help='从该 ID 之后开始返回')
+    parser.add_argument('cursor', type=str, location='args', help='上一页响应头 X-Next-Cursor 中的游标')
+    parser.add_argument('sort', type=str, location='args', help='排序字段，前缀 - 表示降序，例如 -points')
+    return parser
+
+
+def encode_cursor(values):
+    """把排序键编码成不透明游标"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游标，格式不对时抛出 ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, binascii.Error):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or not values:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def page_limit(args):
+    limit = args.get('limit')
+    if limit is None:
+        return DEFAULT_LIMIT
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_LIMIT)
+
+
+def parse_sort(value, columns):
+    """解析 sort=points / sort=-points，返回 (列, 是否降序)；columns 为允许排序的 {字段名: 列}"""
+    value = value or 'id'
+    descending = value.startswith('-')
+    name = value[1:] if descending else value
+    if name not in columns:
+        raise ValueError(f'Unsupported sort field: {name}')
+    return columns[name], descending
+
+
+def prefix_bounds(prefix):
+    """前缀对应的区间 [prefix, 上界)"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def prefix_filter(column, prefix=None, lower='prefix_lo', upper='prefix_hi'):
+    """
+    name_prefix 过滤写成 column >= prefix AND column < 上界 的区间条件，
+    普通 B 树索引就能做范围扫描，不依赖 LIKE 优化的大小写设置。
+    不传 prefix 时两端是名为 lower、upper 的 bindparam，值由 prefix_bounds 算出、执行时传入
+    """
+    if prefix is None:
+        return and_(column >= bindparam(lower), column < bindparam(upper))
+    low, high = prefix_bounds(prefix)
+    return and_(column >= low, column < high)
+
+
+def check_range_filters(names, sort, ranges):
+    """
+    区间过滤（ranges 为 {过滤参数名: 列名}，例如得分上下限、姓名前缀）只能和按同一列排序一起用，
+    每页才是排序列索引（或 (等值过滤列, 排序列) 复合索引）上的一段范围扫描；
+    按别的列排序时要么把整个排序索引走一遍再过滤，要么取出全部匹配的行再排序，这样的组合返回 400。
+    返回排序列上是否有区间过滤，有的话排序列不会是 NULL
+    """
+    filtered = False
+    for name in names:
+        column = ranges.get(name)
+        if column is None:
+            continue
+        if column != sort[0].key:
+            raise ValueError(f'{name} can only be used with sort={column} or sort=-{column}')
+        filtered = True
+    return filtered
+
+
+def _regions(column, id_column, descending, after, nullable=True):
+    """
+    按 (column, id) 排序时游标之后的数据分成两段：column 为 NULL 的一段和非 NULL 的一段
+    （SQLite 升序时 NULL 排在最前，降序时排在最后）。每段都是一个能走索引的范围条件，
+    返回按输出顺序排列的 [(where 条件列表, order_by)]。nullable 为 False 时（排序列上有区间过滤）
+    没有 NULL 的一段，不查这一段，也省得查询计划为一段必定为空的数据排序。
+    游标的值用 bindparam cursor_value、cursor_id 表示，条件只取决于游标的形状，不取决于具体的值
+    """
+    last_id = bindparam('cursor_id')
+    if column is id_column:
+        order = (id_column.desc(),) if descending else (id_column,)
+        conds = []
+        if after is not None:
+            conds.append(id_column < last_id if descending else id_column > last_id)
+        return [(conds, order)]
+    if not nullable:
+        conds = []
+        if after is not None:
+            key, bound = tuple_(column, id_column), tuple_(bindparam('cursor_value'), last_id)
+            conds.append(key < bound if descending else key > bound)
+        return [(conds, (column.desc(), id_column.desc()) if descending else (column, id_column))]
+
+    null_region = [column.is_(None)]
+    value_region = [column.isnot(None)]
+    if after is not None:
+        if after[0] is None:
+            null_region.append(id_column < last_id if descending else id_column > last_id)
+            if descending:
+                value_region = None
+        else:
+            key, bound = tuple_(column, id_column), tuple_(bindparam('cursor_value'), last_id)
+            value_region.append(key < bound if descending else key > bound)
+            if not descending:
+                null_region = None
+    if descending:
+        regions = [(value_region, (column.desc(), id_column.desc())), (null_region, (id_column.desc(),))]
+    else:
+        regions = [(null_region, (id_column,)), (value_region, (column, id_column))]
+    return [(conds, order) for conds, order in regions if conds is not None]
+
+
+def paginate(db, stmt, id_column, args, sort=None, key=None, params=None, nullable=True):
+    """
+    keyset 分页：WHERE (排序列, id) > 游标 ORDER BY 排序列, id LIMIT :n，
+    每页只做索引范围扫描，代价和翻到第几页无关。
+    stmt 为 Core select，必须包含 id 列和排序列；sort 为 parse_sort 的结果，默认按主键升序。
+    给出形状 key 时 stmt 可以是返回 select 的函数，加上游标条件后的语句按形状缓存复用，
+    params 为 stmt 里 bindparam 的取值；stmt 的条件排除了排序列为 NULL 的行时 nullable 传 False。
+    返回 (当前页的行列表, 下一页游标或 None)
+    """
+    column, descending = sort or (id_column, False)
+    limit = page_limit(args)
+    after = None
+    if args.get('cursor'):
+        after = decode_cursor(args['cursor'])
+        if len(after) != (1 if column is id_column else 2) or not isinstance(after[-1], int):
+            raise ValueError('Invalid cursor')
+        if not nullable and column is not id_column and after[0] is None:
+            raise ValueError('Invalid cursor')
+    elif args.get('after') is not None:
+        if column is not id_column:
+            raise ValueError('after can only be used when sorting by id')
+        after = [args['after']]
+
+    def build():
+        base = stmt() if callable(stmt) else stmt
+        return [base.where(*conds).order_by(*order).limit(bindparam('page_limit')) for conds, order in _regions(column, id_column, descending, after, nullable)]
+
+    params = dict(params or {})
+    if after is not None:
+        params['cursor_id'] = after[-1]
+        if column is not id_column and after[0] is not None:
+            params['cursor_value'] = after[0]
+    if key is None:
+        pages = build()
+    else:
+        shape = None if after is None else (len(after), after[0] is None)
+        pages = cached_statement((key, column.key, descending, shape, nullable), build)
+
+    # 多取一条用来判断是否还有下一页
+    rows = []
+    for page in pages:
+        rows.extend(db.session.execute(page, dict(params, page_limit=limit + 1 - len(rows))))
+        if len(rows) > limit:
+            break
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]._mapping
+    if column is id_column:
+        return rows, encode_cursor([last[id_column]])
+    return rows, encode_cursor([last[column], last[id_column]])
+
+
+def page_headers(next_cursor):
+    """生成下一页的响应头"""
+    if next_cursor is None:
+        return {}
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args['cursor'] = next_cursor
+    return {
+        'X-Next-Cursor': next_cursor,
+        'Link': '<%s?%s>; rel="next"' % (request.base_url, urlencode(args)),
+    }
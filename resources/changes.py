@@ -0,0 +1,56 @@
+from flask_restx import Namespace, Resource, inputs
+from app import db
+from engine import read_engine
+from changes import head_revision, last_event_id, stream_changes
+from resources.players import player_fields, player_table
+from resources.teams import team_fields, team_table
+
+ns = Namespace('changes', description='数据变更推送')
+
+# 可以订阅的表：事件里的表名 -> (表, 输出字段)
+feeds = {'players': (player_table, player_fields), 'teams': (team_table, team_fields)}
+
+changes_parser = ns.parser()
+changes_parser.add_argument('since', type=int, location='args', help='从该变更序号之后开始推送，默认只推送之后的新变更；重连时以 Last-Event-ID 为准')
+changes_parser.add_argument('tables', type=str, location='args', help='逗号分隔的表名（players、teams），默认全部')
+changes_parser.add_argument('follow', type=inputs.boolean, location='args', default=True, help='为 false 时推送完积压的变更就结束')
+
+
+def parse_tables(raw):
+    """解析 ?tables=，返回要订阅的 {表名: (表, 输出字段)}"""
+    if not raw:
+        return feeds
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in feeds]
+    if unknown:
+        raise ValueError('Unknown tables: ' + ', '.join(unknown))
+    if not names:
+        raise ValueError('tables must not be empty')
+    return {name: feeds[name] for name in names}
+
+
+@ns.route('', strict_slashes=False)
+class Changes(Resource):
+    """
+    此接口以 Server-Sent Events 推送球员和球队的变更，写入一提交就发出：
+    每个事件的 id 为变更序号，data 为 {"table", "op": "upsert"|"delete", "id", "revision", "row"}；
+    先补发 since 之后积压的变更，断线重连时浏览器带上 Last-Event-ID 从断点继续
+    """
+    @ns.doc('stream_changes')
+    @ns.expect(changes_parser)
+    def get(self):
+        args = changes_parser.parse_args()
+        try:
+            tables = parse_tables(args.get('tables'))
+        except ValueError as e:
+            ns.abort(400, str(e))
+        since = last_event_id()
+        if since is None:
+            since = args.get('since')
+        if since is not None and since < 0:
+            ns.abort(400, 'since must not be negative')
+        engine = read_engine() or db.engine
+        if since is None:
+            with engine.connect() as connection:
+                since = head_revision(connection)
+        return stream_changes(engine, tables, since, args['follow'])
@@ -1,6 +1,18 @@
 from flask_restx import Namespace, Resource, fields
+from sqlalchemy import bindparam
 from sqlalchemy.orm import Session
 from models import db, Player
+from pagination import add_page_arguments, check_range_filters, page_limit, paginate, page_headers, parse_sort, prefix_bounds, prefix_filter
+from streaming import add_stream_argument, stream_rows, wants_stream
+from revisions import conditional, mark_changed, require_match, table_revision
+from cache import caches
+from search import add_search_arguments, search
+from fieldsets import add_fields_argument, columns_for, parse_fields, row_mapper, select_fields
+from writer import run_write
+from statements import cached_statement
+from bulk import add_ids_argument, bulk_result, check_lookup_args, chunked, delete_row, delete_rows, load_by_ids, missing_headers, parse_ids, read_ids, update_row, update_rows, insert_rows, read_items, validate_items, validate_patch
+from csvio import add_import_arguments, import_csv, stream_csv
+from changes import add_since_argument, changes_since, check_since_args, since_headers
 
 ns = Namespace('players', description='NBA 球员相关操作')
 
@@ -12,19 +24,161 @@ player_model = ns.model('Player', {
     'assists': fields.Integer(required=True)
 })
 
+
+def add_filter_arguments(parser):
+    """列表和导出接口共用的过滤参数"""
+    parser.add_argument('team_id', type=int, location='args', help='只返回该球队的球员')
+    parser.add_argument('min_points', type=int, location='args', help='得分下限（含），列表接口需要 sort=points 或 -points')
+    parser.add_argument('max_points', type=int, location='args', help='得分上限（含），列表接口需要 sort=points 或 -points')
+    parser.add_argument('name_prefix', type=str, location='args', help='姓名前缀，列表接口需要 sort=name 或 -name')
+    return parser
+
+
+list_parser = add_filter_arguments(add_fields_argument(add_stream_argument(add_page_arguments(ns.parser()))))
+add_ids_argument(list_parser, '逗号分隔的球员 ID，按给出的顺序返回这些球员')
+add_since_argument(list_parser)
+
+export_parser = add_filter_arguments(add_fields_argument(ns.parser()))
+
+import_parser = add_import_arguments(ns.parser())
+
+detail_parser = add_fields_argument(ns.parser())
+
+search_parser = add_fields_argument(add_search_arguments(ns.parser()))
+
+lookup_parser = add_fields_argument(ns.parser())
+
+# 读接口直接用 Core 查询表，结果是行元组，不经过 ORM 的对象构造和 identity map
+player_table = Player.__table__
+
+# 全部字段，用于默认输出和单条记录缓存
+player_fields = parse_fields(None, player_model)
+
+# 允许排序的字段，每个都有对应的索引
+sort_columns = {'id': player_table.c.id, 'name': player_table.c.name, 'points': player_table.c.points, 'rebounds': player_table.c.rebounds, 'assists': player_table.c.assists}
+
+
+# 过滤参数对应的条件，取值都是 bindparam（name_prefix 为 prefix_lo、prefix_hi），
+# 用到同一组过滤参数的查询语句相同，可以按形状缓存
+filter_conditions = {
+    'team_id': lambda: player_table.c.team_id == bindparam('team_id'),
+    'min_points': lambda: player_table.c.points >= bindparam('min_points'),
+    'max_points': lambda: player_table.c.points <= bindparam('max_points'),
+    'name_prefix': lambda: prefix_filter(player_table.c.name),
+}
+
+
+# 区间过滤对应的列：只能和按这一列排序一起用（见 check_range_filters）
+range_filters = {'min_points': 'points', 'max_points': 'points', 'name_prefix': 'name'}
+
+
+def filter_params(args):
+    """列表接口用到的过滤参数，返回 (过滤参数名元组, bindparam 的取值)"""
+    names, params = [], {}
+    for name in ('team_id', 'min_points', 'max_points'):
+        if args.get(name) is not None:
+            names.append(name)
+            params[name] = args[name]
+    if args.get('name_prefix'):
+        names.append('name_prefix')
+        params['prefix_lo'], params['prefix_hi'] = prefix_bounds(args['name_prefix'])
+    return tuple(names), params
+
+
+def filter_players(stmt, args):
+    """把列表接口的过滤参数加到查询上"""
+    names, params = filter_params(args)
+    return stmt.where(*(filter_conditions[name]() for name in names)).params(params)
+
+
+ids_parser = ns.parser()
+ids_parser.add_argument('ids', type=str, location='args', required=True, help='逗号分隔的球员 ID')
+
+
+def load_player(player_id, fields=player_fields):
+    """按主键读取单个球员，只查询 fields 对应的列；同一组字段的语句只构造一次"""
+    stmt = cached_statement(('player_by_id', fields), lambda: db.select(*columns_for(player_table, fields)).where(player_table.c.id == bindparam('id')))
+    row = db.session.execute(stmt, {'id': player_id}).first()
+    return row_mapper(fields)(row) if row else None
+
+
+def patch_player(player_id, data):
+    """
+    按请求体里出现的字段更新球员（0 也会写入），一条 UPDATE ... RETURNING 完成，
+    没有更新到行就是球员不存在，返回 404；返回更新后的球员
+    """
+    try:
+        values = validate_patch(player_model, data)
+    except ValueError as e:
+        ns.abort(400, str(e))
+
+    def update():
+        row = update_row(db, Player, player_id, values, columns_for(player_table, player_fields))
+        if row is None:
+            ns.abort(404, "Player not found")
+        mark_changed('player', [player_id])
+        return row_mapper(player_fields)(row)
+
+    return run_write(db, update)
+
+
+def load_rosters(team_ids, fields=player_fields):
+    """
+    批量读取多支球队的球员，和 selectinload 一样每批球队一条 WHERE team_id IN (...) 查询，
+    查询次数和球队数量无关。返回 {球队 ID: [球员, ...]}，球员按 ID 排序
+    """
+    rosters = {team_id: [] for team_id in team_ids}
+    to_dict = row_mapper(fields)
+    columns = columns_for(player_table, select_fields(fields, 'team_id'))
+    for ids in chunked(list(rosters)):
+        stmt = db.select(*columns).where(player_table.c.team_id.in_(ids)).order_by(player_table.c.team_id, player_table.c.id)
+        for row in db.session.execute(stmt):
+            rosters[row.team_id].append(to_dict(row))
+    return rosters
+
+
 @ns.route('/', strict_slashes=False)
 class PlayerList(Resource):
     """
-    此接口用于获取所有球员的列表
+    此接口用于分页获取球员列表，可按球队、得分、姓名前缀过滤并排序，翻页游标在响应头 X-Next-Cursor 中；
+    每种组合都是索引上的范围扫描：得分上下限只能和按得分排序、姓名前缀只能和按姓名排序一起用，其他组合返回 400；
+    ?stream=1 或 Accept: application/x-ndjson 时以 NDJSON 流式返回全部球员；
+    ?ids=1,5,9 时按给出的顺序返回这些球员，不存在的 ID 在响应头 X-Missing-Ids 中；
+    ?since=<序号> 时按变更序号返回之后新增、修改（带 revision）和删除（deleted 为 true）的球员，
+    每页最多 limit 条，下一次的 since 在响应头 X-Revision 中，X-More-Changes 为 true 时还没取完
     """
     @ns.doc('get_all_players')
+    @ns.expect(list_parser)
+    @conditional('player')
     def get(self):
-        # players = db.session.scalars(db.select(Player)).all()
-        players = Player.query.all()
-        return [{'id': player.id, 'name': player.name, 'team_id': player.team_id, 'points': player.points, 'rebounds': player.rebounds, 'assists': player.assists} for player in players]
-        # with Session(db.engine) as session:
-        #     players = session.scalars(db.select(Player)).all()
-        #     return [{'id': player.id, 'name': player.name, 'team_id': player.team_id, 'points': player.points, 'rebounds': player.rebounds, 'assists': player.assists} for player in players]
+        args = list_parser.parse_args()
+        try:
+            fields = parse_fields(args.get('fields'), player_model)
+            if args.get('since') is not None:
+                check_since_args(args, filter_conditions)
+                items, next_since, more = changes_since(db.session.connection(), player_table, args['since'], fields, page_limit(args))
+                return items, 200, since_headers(next_since, more)
+            if args.get('ids') is not None:
+                check_lookup_args(args, filter_conditions)
+                rows, missing = load_by_ids(db, player_table, parse_ids(args['ids']), fields)
+                to_dict = row_mapper(fields)
+                return [to_dict(row) for row in rows], 200, missing_headers(missing)
+            if wants_stream(args):
+                stmt = filter_players(db.select(*columns_for(player_table, fields)), args).order_by(player_table.c.id)
+                if args.get('after') is not None:
+                    stmt = stmt.where(player_table.c.id > args['after'])
+                return stream_rows(db, stmt)
+            sort = parse_sort(args.get('sort'), sort_columns)
+            # 只查询请求的字段，以及游标需要的 id 和排序列；字段、过滤参数和排序相同的请求复用缓存的语句
+            selected = select_fields(fields, 'id', sort[0].key)
+            names, params = filter_params(args)
+            nullable = not check_range_filters(names, sort, range_filters)
+            build = lambda: db.select(*columns_for(player_table, selected)).where(*(filter_conditions[name]() for name in names))
+            rows, next_cursor = paginate(db, build, player_table.c.id, args, sort, key=('players', selected, names), params=params, nullable=nullable)
+        except ValueError as e:
+            ns.abort(400, str(e))
+        to_dict = row_mapper(fields)
+        return [to_dict(row) for row in rows], 200, page_headers(next_cursor)
 
     """
     此接口用于创建新的球员
@@ -33,60 +187,182 @@ class PlayerList(Resource):
     @ns.expect(player_model)
     def post(self):
         data = ns.payload
-        # player = Player(name=data['name'], team_id=data['team_id'], points=data['points'], rebounds=data['rebounds'], assists=data['assists'])
-        player = Player(**data)
-        db.session.add(player)
-        db.session.commit()
-        return {'message': 'Player created successfully', 'player_id': player.id}, 201
+
+        def create():
+            # player = Player(name=data['name'], team_id=data['team_id'], points=data['points'], rebounds=data['rebounds'], assists=data['assists'])
+            player = Player(**data)
+            db.session.add(player)
+            db.session.flush()
+            mark_changed('player', [player.id])
+            return player.id
+
+        player_id = run_write(db, create)
+        return {'message': 'Player created successfully', 'player_id': player_id}, 201
         # with Session(db.engine) as session:
         #     player = Player(name=data['name'], team_id=data['team_id'], points=data['points'], rebounds=data['rebounds'], assists=data['assists'])
         #     session.add(player)
         #     session.commit()
         #     return {'message': 'Player created successfully', 'player_id': player.id}, 201
 
+    """
+    此接口用于批量更新球员，请求体为 [{"id": ..., 要修改的字段...}]，
+    按主键执行集合式 UPDATE，不加载 ORM 对象，返回实际更新的行数
+    """
+    @ns.doc('bulk_update_players')
+    def patch(self):
+        try:
+            items = read_items()
+        except ValueError as e:
+            ns.abort(400, str(e))
+        valid, errors = validate_items(player_model, items, partial=True)
+        if not valid:
+            return {'updated': 0, 'errors': errors}, 400
+        updated = update_rows(db, Player, [row for _, row in valid])
+        mark_changed('player', [row['id'] for _, row in valid])
+        db.session.commit()
+        return {'updated': updated, 'errors': errors}
+
+    """
+    此接口用于按 ID 集合批量删除球员，例如 DELETE /players?ids=1,2,3
+    """
+    @ns.doc('bulk_delete_players')
+    @ns.expect(ids_parser)
+    def delete(self):
+        try:
+            ids = parse_ids(ids_parser.parse_args()['ids'])
+        except ValueError as e:
+            ns.abort(400, str(e))
+        deleted = delete_rows(db, Player, ids)
+        mark_changed('player', ids)
+        db.session.commit()
+        return {'deleted': deleted}
+
+
+@ns.route('/bulk')
+class PlayerBulk(Resource):
+    """
+    此接口用于批量创建球员，请求体为 JSON 数组或 NDJSON，所有合法的行在一个事务里写入
+    """
+    @ns.doc('bulk_create_players')
+    @ns.expect([player_model])
+    def post(self):
+        try:
+            items = read_items()
+        except ValueError as e:
+            ns.abort(400, str(e))
+        valid, errors = validate_items(player_model, items)
+        ids = insert_rows(db, Player, [row for _, row in valid])
+        mark_changed('player', ids)
+        db.session.commit()
+        return bulk_result(ids, errors)
+
+
+@ns.route('/lookup')
+class PlayerLookup(Resource):
+    """
+    此接口用于按 ID 列表批量读取球员，请求体为 {"ids": [...]} 或 ID 数组，适合放不进 URL 的长列表；
+    每 500 个 ID 一条 IN 查询，按给出的顺序返回 {"items": [...], "missing": [不存在的 ID]}
+    """
+    @ns.doc('lookup_players')
+    @ns.expect(lookup_parser)
+    def post(self):
+        try:
+            fields = parse_fields(lookup_parser.parse_args().get('fields'), player_model)
+            rows, missing = load_by_ids(db, player_table, read_ids(), fields)
+        except ValueError as e:
+            ns.abort(400, str(e))
+        to_dict = row_mapper(fields)
+        return {'items': [to_dict(row) for row in rows], 'missing': missing}
+
+
+@ns.route('/export.csv')
+class PlayerExport(Resource):
+    """
+    此接口用于以 CSV 导出球员，支持列表接口的过滤参数和 ?fields=（id 总在第一列），
+    按 id 顺序用服务端游标分批读取、边读边发送，导出多少行内存占用都一样
+    """
+    @ns.doc('export_players')
+    @ns.expect(export_parser)
+    @conditional('player')
+    def get(self):
+        args = export_parser.parse_args()
+        try:
+            fields = select_fields(('id',), *parse_fields(args.get('fields'), player_model))
+        except ValueError as e:
+            ns.abort(400, str(e))
+        stmt = filter_players(db.select(*columns_for(player_table, fields)), args).order_by(player_table.c.id)
+        return stream_csv(db, stmt, 'players.csv')
+
+
+@ns.route('/import')
+class PlayerImport(Resource):
+    """
+    此接口用于从 CSV 导入球员，表头为字段名；边解析边分块写入，每块单独提交。
+    ?upsert=1 时按 id 列更新已有球员（只改 CSV 里有的列），否则全部作为新球员插入。
+    返回处理的行数、新建和更新的数量以及出错的行号
+    """
+    @ns.doc('import_players')
+    @ns.expect(import_parser)
+    def post(self):
+        args = import_parser.parse_args()
+        try:
+            summary = import_csv(db, Player, player_model, 'id', upsert=args.get('upsert'))
+        except ValueError as e:
+            ns.abort(400, str(e))
+        return summary, 400 if summary['errors'] and not summary['chunks'] else 200
+
+
+@ns.route('/search')
+class PlayerSearch(Resource):
+    """
+    此接口用于按名字片段搜索球员，例如 ?q=张伟；走 FTS5 trigram 索引，中文子串也能匹配，
+    结果按相关度排序并分页，翻页游标在响应头 X-Next-Cursor 中
+    """
+    @ns.doc('search_players')
+    @ns.expect(search_parser)
+    @conditional('player')
+    def get(self):
+        args = search_parser.parse_args()
+        try:
+            fields = parse_fields(args.get('fields'), player_model)
+            columns = columns_for(player_table, select_fields(fields, 'id'))
+            rows, next_cursor = search(db, player_table, columns, args['q'], args)
+        except ValueError as e:
+            ns.abort(400, str(e))
+        to_dict = row_mapper(fields)
+        return [to_dict(row) for row in rows], 200, page_headers(next_cursor)
+
 
 @ns.route('/<int:player_id>')
 class PlayerDetail(Resource):
     """
-    此接口用于根据 ID 获取单个球员的详细信息
+    此接口用于根据 ID 获取单个球员的详细信息，结果经过进程内缓存，写接口提交后失效
     """
     @ns.doc('get_player_by_id')
+    @ns.expect(detail_parser)
+    @conditional('player')
     def get(self, player_id):
-        # player = Player.query.get(player_id)
-        player = db.session.get(Player, player_id)
+        try:
+            fields = parse_fields(detail_parser.parse_args().get('fields'), player_model)
+        except ValueError as e:
+            ns.abort(400, str(e))
+        if set(fields) == set(player_fields):
+            player = caches['player'].get_or_load(player_id, lambda: load_player(player_id), table_revision('player'))
+            player = player and {name: player[name] for name in fields}
+        else:
+            player = load_player(player_id, fields)
         if player:
-            return {'id': player.id, 'name': player.name, 'team_id': player.team_id, 'points': player.points, 'rebounds': player.rebounds, 'assists': player.assists}
+            return player
         else:
             ns.abort(404, "Player not found")
 
-        # with Session(db.engine) as session:
-        #     player = session.get(Player, player_id)
-        #     if player:
-        #         return {'id': player.id, 'name': player.name, 'team_id': player.team_id, 'points': player.points, 'rebounds': player.rebounds, 'assists': player.assists}
-        #     else:
-        #         ns.abort(404, "Player not found")
-
     """
-    此接口用于根据 ID 更新单个球员的信息
+    此接口用于根据 ID 更新单个球员的信息，只修改请求体里出现的字段
     """
     @ns.doc('update_player_by_id')
+    @require_match('player')
     def put(self, player_id):
-        # player = Player.query.get(player_id)
-        player = db.session.get(Player, player_id)
-        if not player:
-            ns.abort(404, "Player not found")
-        data = ns.payload
-        if data.get('name'):
-            player.name = data['name']
-        if data.get('team_id'):
-            player.team_id = data['team_id']
-        if data.get('points'):
-            player.points = data['points']
-        if data.get('rebounds'):
-            player.rebounds = data['rebounds']
-        if data.get('assists'):
-            player.assists = data['assists']
-        db.session.commit()
+        patch_player(player_id, ns.payload)
         return {'message': 'Player updated successfully'}
         # with Session(db.engine) as session:
         #     player = session.get(Player, player_id)
@@ -107,16 +383,26 @@ class PlayerDetail(Resource):
         #     return {'message': 'Player updated successfully'}
 
     """
-    此接口用于根据 ID 删除球员
+    此接口用于部分更新单个球员，请求体只需包含要修改的字段，0 也会写入；
+    一条 UPDATE ... RETURNING 完成，不先读出球员，返回更新后的球员
+    """
+    @ns.doc('patch_player_by_id')
+    @require_match('player')
+    def patch(self, player_id):
+        return patch_player(player_id, ns.payload)
+
+    """
+    此接口用于根据 ID 删除球员，一条 DELETE ... RETURNING 完成，没有删除到行时返回 404
     """
     @ns.doc('delete_player_by_id')
+    @require_match('player')
     def delete(self, player_id):
-        # player = Player.query.get(player_id)
-        player = db.session.get(Player, player_id)
-        if not player:
-            ns.abort(404, "Player not found")
-        db.session.delete(player)
-        db.session.commit()
+        def remove():
+            if not delete_row(db, Player, player_id):
+                ns.abort(404, "Player not found")
+            mark_changed('player', [player_id])
+
+        run_write(db, remove)
         return {'message': 'Player deleted successfully'}
         # with Session(db.engine) as session:
         #     player = session.get(Player, player_id)
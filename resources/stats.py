@@ -0,0 +1,198 @@
+from contextlib import contextmanager
+
+from flask_restx import Namespace, Resource
+from sqlalchemy import func
+from app import db
+from models import Team, Player, TeamRollup
+from resources.teams import ns as ns_teams
+from revisions import conditional
+from cache import caches
+from analytics import STATS, PlayerColumns, analytics_store, distribution
+from rollups import NO_TEAM
+from bulk import parse_ids
+from statements import compiled_stats, statements
+
+ns = Namespace('stats', description='NBA 数据统计相关操作')
+
+# 允许统计的球员数据列
+stat_columns = {'points': Player.points, 'rebounds': Player.rebounds, 'assists': Player.assists}
+
+MAX_LEADERS = 100
+
+leaders_parser = ns.parser()
+leaders_parser.add_argument('stat', type=str, location='args', default='points', choices=tuple(stat_columns), help='统计项')
+leaders_parser.add_argument('k', type=int, location='args', default=10, help=f'返回前 k 名，最大 {MAX_LEADERS}')
+leaders_parser.add_argument('team_id', type=int, location='args', help='只统计该球队的球员')
+
+
+MAX_BUCKETS = 100
+
+# 分布接口返回的百分位数
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+distribution_parser = ns.parser()
+distribution_parser.add_argument('stat', type=str, location='args', default='points', choices=STATS, help='统计项')
+distribution_parser.add_argument('team_id', type=int, location='args', help='只统计该球队的球员')
+distribution_parser.add_argument('buckets', type=int, location='args', default=10, help=f'直方图区间数，最大 {MAX_BUCKETS}')
+
+# 对比接口一次最多对比的球队数
+MAX_COMPARE_TEAMS = 100
+
+compare_parser = ns.parser()
+compare_parser.add_argument('stat', type=str, location='args', default='points', choices=STATS, help='统计项')
+compare_parser.add_argument('team_ids', type=str, location='args', required=True, help=f'逗号分隔的球队 ID，最多 {MAX_COMPARE_TEAMS} 个')
+
+
+@contextmanager
+def player_columns(team_ids=None):
+    """
+    球员数据列：开启 ANALYTICS_SNAPSHOT 时用进程内的快照，不查数据库；
+    否则为这次请求从数据库读出 team_ids 中球队（None 为全部）的球员
+    """
+    store = analytics_store()
+    if store is not None:
+        with store.read() as columns:
+            yield columns
+    else:
+        yield PlayerColumns.load(db.session.connection(), team_ids)
+
+
+def snapshot_version():
+    """
+    开启 ANALYTICS_SNAPSHOT 时快照接口的 ETag 用快照自己的版本：快照在后台合并改动，可能比数据库晚，
+    按表修订号生成的 ETag 会让旧数据也拿到新 ETag，之后一直返回 304
+    """
+    store = analytics_store()
+    return None if store is None else store.version()
+
+
+def rollup_totals():
+    """球队汇总表里的人数和数据之和，没有汇总行（还没有球员）时为 0"""
+    return (
+        func.coalesce(TeamRollup.players, 0).label('players'),
+        func.coalesce(TeamRollup.points, 0).label('points'),
+        func.coalesce(TeamRollup.rebounds, 0).label('rebounds'),
+        func.coalesce(TeamRollup.assists, 0).label('assists'),
+    )
+
+
+@ns_teams.route('/<int:team_id>/totals')
+class TeamTotals(Resource):
+    """
+    此接口用于获取某支球队全部球员的得分、篮板和助攻之和，
+    读的是由触发器随球员写入增量维护的汇总行，一次按主键查询，不扫描球员表
+    """
+    @ns_teams.doc('get_team_totals')
+    @conditional('team', 'player')
+    def get(self, team_id):
+        stmt = db.select(*rollup_totals()).select_from(Team).outerjoin(TeamRollup, TeamRollup.team_id == Team.id).where(Team.id == team_id)
+        row = db.session.execute(stmt).first()
+        if row is None:
+            ns_teams.abort(404, "Team not found")
+        return {'team_id': team_id, **row._asdict()}
+
+
+@ns.route('/leaders')
+class Leaders(Resource):
+    """
+    此接口用于获取某项数据排名前 k 的球员，排序和截断都在数据库里完成
+    """
+    @ns.doc('get_leaders')
+    @ns.expect(leaders_parser)
+    @conditional('player')
+    def get(self):
+        args = leaders_parser.parse_args()
+        if not 1 <= args['k'] <= MAX_LEADERS:
+            ns.abort(400, f'k must be between 1 and {MAX_LEADERS}')
+        column = stat_columns[args['stat']]
+        stmt = db.select(Player.id, Player.name, Player.team_id, column.label('value')).where(column.isnot(None))
+        if args.get('team_id') is not None:
+            stmt = stmt.where(Player.team_id == args['team_id'])
+        rows = db.session.execute(stmt.order_by(column.desc(), Player.id).limit(args['k']))
+        return [{'rank': rank, **row._asdict()} for rank, row in enumerate(rows, 1)]
+
+
+@ns.route('/by-team')
+class ByTeam(Resource):
+    """
+    此接口用于按球队汇总球员数据，每支有球员的球队返回一行；
+    直接读球队汇总表，查询量和球队数成正比，和球员数无关
+    """
+    @ns.doc('get_stats_by_team')
+    @conditional('team', 'player')
+    def get(self):
+        stmt = (
+            db.select(TeamRollup.team_id, *rollup_totals(), Team.name.label('team_name'))
+            .outerjoin(Team, Team.id == TeamRollup.team_id)
+            .where(TeamRollup.players > 0)
+            .order_by(TeamRollup.team_id)
+        )
+        rows = [row._asdict() for row in db.session.execute(stmt)]
+        # 没有球队的球员汇总在 team_id 0 下，输出为 None，和 GROUP BY team_id 一样排在最前面
+        for row in rows:
+            if row['team_id'] == NO_TEAM:
+                row['team_id'] = None
+        return rows
+
+
+@ns.route('/distribution')
+class Distribution(Resource):
+    """
+    此接口用于查看某项数据的分布：人数、最值、平均数、百分位数和等宽直方图，可只统计一支球队；
+    在球员数据列的数组上排序和二分计算，不创建 ORM 对象
+    """
+    @ns.doc('get_distribution')
+    @ns.expect(distribution_parser)
+    @conditional('player', version=snapshot_version)
+    def get(self):
+        args = distribution_parser.parse_args()
+        if not 1 <= args['buckets'] <= MAX_BUCKETS:
+            ns.abort(400, f'buckets must be between 1 and {MAX_BUCKETS}')
+        team_id = args.get('team_id')
+        with player_columns(None if team_id is None else [team_id]) as columns:
+            values = columns.sorted_values(args['stat'], team_id)
+            result = distribution(values, PERCENTILES, args['buckets'])
+        return {'stat': args['stat'], 'team_id': team_id, **result}
+
+
+@ns.route('/compare')
+class Compare(Resource):
+    """
+    此接口用于按球队对比某项数据，例如 ?team_ids=1,2,3：每支球队的人数、总和、平均数、中位数和最大值
+    """
+    @ns.doc('compare_teams')
+    @ns.expect(compare_parser)
+    @conditional('player', version=snapshot_version)
+    def get(self):
+        args = compare_parser.parse_args()
+        try:
+            team_ids = parse_ids(args['team_ids'])
+        except ValueError as e:
+            ns.abort(400, str(e))
+        if len(team_ids) > MAX_COMPARE_TEAMS:
+            ns.abort(400, f'At most {MAX_COMPARE_TEAMS} teams can be compared')
+        stat = args['stat']
+        result = []
+        with player_columns(team_ids) as columns:
+            for team_id in team_ids:
+                summary = distribution(columns.sorted_values(stat, team_id), (50,), 1)
+                total = columns.totals(*columns.team_range(team_id))
+                result.append({
+                    'team_id': team_id, 'players': total['players'], 'total': total[stat],
+                    'mean': summary['mean'], 'median': summary['percentiles'].get('p50'), 'max': summary['max'],
+                })
+        return result
+
+
+@ns.route('/cache')
+class CacheStats(Resource):
+    """
+    此接口用于查看单条记录缓存的命中、未命中和淘汰次数，用来调整缓存大小；
+    statements 为按形状缓存的查询语句，compiled 为 SQLAlchemy 编译缓存在每次执行时的命中情况
+    """
+    @ns.doc('get_cache_stats')
+    def get(self):
+        result = {name: cache.stats() for name, cache in caches.items()}
+        result['statements'] = statements.stats()
+        result['compiled'] = compiled_stats.stats()
+        return result
@@ -1,7 +1,23 @@
+from flask import request
 from flask_restx import Namespace, Resource, fields
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app import db
-from models import Team
+from models import Team, TeamRollup
+from pagination import add_page_arguments, check_range_filters, page_limit, paginate, page_headers, parse_sort, prefix_bounds, prefix_filter
+from streaming import add_stream_argument, stream_rows, wants_stream
+from revisions import conditional, mark_changed, require_match, table_revision
+from cache import caches
+from search import add_search_arguments, search
+from fieldsets import add_fields_argument, columns_for, parse_fields, row_mapper, select_fields
+from writer import run_write
+from statements import cached_statement
+from bulk import add_ids_argument, bulk_result, check_lookup_args, delete_row, delete_rows, load_by_ids, missing_headers, parse_ids, read_ids, update_row, update_rows, chunked, insert_new_rows, read_items, validate_items, validate_patch
+from csvio import add_import_arguments, import_csv, stream_csv
+from changes import add_since_argument, changes_since, check_since_args, since_headers
+from rollups import STATS as ROLLUP_STATS
+from resources.players import load_rosters, player_model, player_table, sort_columns as player_sort_columns
 
 ns = Namespace('teams', description='NBA 球队相关操作')
 
@@ -12,78 +28,435 @@ team_model = ns.model('Team', {
     'assists': fields.Integer(required=True)
 })
 
+
+def add_filter_arguments(parser):
+    """列表和导出接口共用的过滤参数"""
+    parser.add_argument('min_points_scored', type=int, location='args', help='得分下限（含），列表接口需要 sort=points_scored 或 -points_scored')
+    parser.add_argument('name_prefix', type=str, location='args', help='球队名前缀，列表接口需要 sort=name 或 -name')
+    return parser
+
+
+list_parser = add_filter_arguments(add_fields_argument(add_stream_argument(add_page_arguments(ns.parser()))))
+list_parser.add_argument('include', type=str, location='args', help='展开关联数据：players（每支球队附带球员列表）、totals（附带球员数据汇总），逗号分隔')
+add_ids_argument(list_parser, '逗号分隔的球队 ID，按给出的顺序返回这些球队')
+add_since_argument(list_parser)
+
+export_parser = add_filter_arguments(add_fields_argument(ns.parser()))
+
+import_parser = add_import_arguments(ns.parser())
+
+roster_parser = add_fields_argument(add_page_arguments(ns.parser()))
+
+detail_parser = add_fields_argument(ns.parser())
+
+search_parser = add_fields_argument(add_search_arguments(ns.parser()))
+
+lookup_parser = add_fields_argument(ns.parser())
+lookup_parser.add_argument('include', type=str, location='args', help='展开关联数据：players（每支球队附带球员列表）、totals（附带球员数据汇总），逗号分隔')
+
+# 读接口直接用 Core 查询表，结果是行元组，不经过 ORM 的对象构造和 identity map
+team_table = Team.__table__
+
+# 全部字段，用于默认输出和单条记录缓存
+team_fields = parse_fields(None, team_model)
+
+# 允许排序的字段，每个都有对应的索引
+sort_columns = {'id': team_table.c.id, 'name': team_table.c.name, 'points_scored': team_table.c.points_scored}
+
+
+# 过滤参数对应的条件，取值都是 bindparam（name_prefix 为 prefix_lo、prefix_hi），
+# 用到同一组过滤参数的查询语句相同，可以按形状缓存
+filter_conditions = {
+    'min_points_scored': lambda: team_table.c.points_scored >= bindparam('min_points_scored'),
+    'name_prefix': lambda: prefix_filter(team_table.c.name),
+}
+
+
+# 区间过滤对应的列：只能和按这一列排序一起用（见 check_range_filters）
+range_filters = {'min_points_scored': 'points_scored', 'name_prefix': 'name'}
+
+
+def filter_params(args):
+    """列表接口用到的过滤参数，返回 (过滤参数名元组, bindparam 的取值)"""
+    names, params = [], {}
+    if args.get('min_points_scored') is not None:
+        names.append('min_points_scored')
+        params['min_points_scored'] = args['min_points_scored']
+    if args.get('name_prefix'):
+        names.append('name_prefix')
+        params['prefix_lo'], params['prefix_hi'] = prefix_bounds(args['name_prefix'])
+    return tuple(names), params
+
+
+def filter_teams(stmt, args):
+    """把列表接口的过滤参数加到查询上"""
+    names, params = filter_params(args)
+    return stmt.where(*(filter_conditions[name]() for name in names)).params(params)
+
+
+# ?include= 可以展开的关联数据
+INCLUDES = ('players', 'totals')
+
+
+def parse_include(raw):
+    """解析 ?include=，返回要展开的关联名集合"""
+    names = {name.strip() for name in (raw or '').split(',') if name.strip()}
+    unknown = names - set(INCLUDES)
+    if unknown:
+        raise ValueError('Unknown include: ' + ', '.join(sorted(unknown)))
+    return names
+
+
+def included_tables():
+    """?include=players 或 totals 时响应还依赖 player 表，ETag 要带上它的修订号"""
+    return ['player'] if request.args.get('include') else []
+
+
+ids_parser = ns.parser()
+ids_parser.add_argument('ids', type=str, location='args', required=True, help='逗号分隔的球队 ID')
+
+
+def load_team(team_id, fields=team_fields):
+    """按主键读取单个球队，只查询 fields 对应的列；同一组字段的语句只构造一次"""
+    stmt = cached_statement(('team_by_id', fields), lambda: db.select(*columns_for(team_table, fields)).where(team_table.c.id == bindparam('id')))
+    row = db.session.execute(stmt, {'id': team_id}).first()
+    return row_mapper(fields)(row) if row else None
+
+
+def patch_team(team_id, data):
+    """
+    按请求体里出现的字段更新球队（0 也会写入），一条 UPDATE ... RETURNING 完成，
+    没有更新到行就是球队不存在，返回 404；改成已有的球队名返回 409。返回更新后的球队
+    """
+    try:
+        values = validate_patch(team_model, data)
+    except ValueError as e:
+        ns.abort(400, str(e))
+
+    def update():
+        row = update_row(db, Team, team_id, values, columns_for(team_table, team_fields))
+        if row is None:
+            ns.abort(404, "Team not found")
+        mark_changed('team', [team_id])
+        return row_mapper(team_fields)(row)
+
+    try:
+        return run_write(db, update)
+    except IntegrityError:
+        db.session.rollback()
+        ns.abort(409, "Team name already exists")
+
+
+rollup_table = TeamRollup.__table__
+
+
+def load_totals(team_ids):
+    """
+    批量读取多支球队的球员数据汇总，每批球队一条 WHERE team_id IN (...) 按主键查询，
+    不扫描球员表；还没有球员的球队都是 0
+    """
+    totals = {team_id: dict.fromkeys(('players',) + ROLLUP_STATS, 0) for team_id in team_ids}
+    columns = columns_for(rollup_table, ('team_id', 'players') + ROLLUP_STATS)
+    for ids in chunked(list(totals)):
+        for row in db.session.execute(db.select(*columns).where(rollup_table.c.team_id.in_(ids))):
+            totals[row.team_id] = {name: row._mapping[name] for name in ('players',) + ROLLUP_STATS}
+    return totals
+
+
+def with_includes(rows, fields, include):
+    """把查询到的球队行转成输出的字典，按 ?include= 附带球员列表（players）和球员数据汇总（totals）"""
+    to_dict = row_mapper(fields)
+    teams = [to_dict(row) for row in rows]
+    team_ids = [row._mapping[team_table.c.id] for row in rows]
+    if 'players' in include:
+        rosters = load_rosters(team_ids)
+        for team, team_id in zip(teams, team_ids):
+            team['players'] = rosters[team_id]
+    if 'totals' in include:
+        totals = load_totals(team_ids)
+        for team, team_id in zip(teams, team_ids):
+            team['totals'] = totals[team_id]
+    return teams
+
+
 @ns.route('/', strict_slashes=False)
 class TeamList(Resource):
     """
-    此接口用于获取所有球队的列表
+    此接口用于分页获取球队列表，可按得分、球队名前缀过滤并排序，翻页游标在响应头 X-Next-Cursor 中；
+    得分下限只能和按得分排序、球队名前缀只能和按球队名排序一起用，每页都是索引上的范围扫描，其他组合返回 400；
+    ?stream=1 或 Accept: application/x-ndjson 时以 NDJSON 流式返回全部球队；
+    ?include=players 时每支球队附带球员列表，整页球队的球员用一条批量查询读取；
+    ?include=totals 时附带由触发器维护的球员数据汇总，按主键读取，不扫描球员表；
+    ?ids=1,5,9 时按给出的顺序返回这些球队，不存在的 ID 在响应头 X-Missing-Ids 中；
+    ?since=<序号> 时按变更序号返回之后新增、修改（带 revision）和删除（deleted 为 true）的球队，
+    每页最多 limit 条，下一次的 since 在响应头 X-Revision 中，X-More-Changes 为 true 时还没取完
     """
     @ns.doc('get_all_teams')
+    @ns.expect(list_parser)
+    @conditional('team', included_tables)
     def get(self):
-        # teams = db.session.scalars(db.select(Team)).all()
-        teams = Team.query.all()
-        return [{'id': team.id, 'name': team.name, 'points_scored': team.points_scored, 'rebounds': team.rebounds, 'assists': team.assists} for team in teams]
-        # with Session(db.engine) as session:
-        #     teams = session.scalars(db.select(Team)).all()
-        #     return [{'id': team.id, 'name': team.name, 'points_scored': team.points_scored, 'rebounds': team.rebounds, 'assists': team.assists} for team in teams]
+        args = list_parser.parse_args()
+        try:
+            fields = parse_fields(args.get('fields'), team_model)
+            include = parse_include(args.get('include'))
+            if args.get('since') is not None:
+                check_since_args(args, tuple(filter_conditions) + ('include',))
+                items, next_since, more = changes_since(db.session.connection(), team_table, args['since'], fields, page_limit(args))
+                return items, 200, since_headers(next_since, more)
+            if args.get('ids') is not None:
+                check_lookup_args(args, filter_conditions)
+                rows, missing = load_by_ids(db, team_table, parse_ids(args['ids']), fields)
+                return with_includes(rows, fields, include), 200, missing_headers(missing)
+            if wants_stream(args):
+                if include:
+                    raise ValueError('include cannot be used with stream')
+                stmt = filter_teams(db.select(*columns_for(team_table, fields)), args).order_by(team_table.c.id)
+                if args.get('after') is not None:
+                    stmt = stmt.where(team_table.c.id > args['after'])
+                return stream_rows(db, stmt)
+            sort = parse_sort(args.get('sort'), sort_columns)
+            # 只查询请求的字段，以及游标需要的 id 和排序列；字段、过滤参数和排序相同的请求复用缓存的语句
+            selected = select_fields(fields, 'id', sort[0].key)
+            names, params = filter_params(args)
+            nullable = not check_range_filters(names, sort, range_filters)
+            build = lambda: db.select(*columns_for(team_table, selected)).where(*(filter_conditions[name]() for name in names))
+            rows, next_cursor = paginate(db, build, team_table.c.id, args, sort, key=('teams', selected, names), params=params, nullable=nullable)
+        except ValueError as e:
+            ns.abort(400, str(e))
+        return with_includes(rows, fields, include), 200, page_headers(next_cursor)
 
     """
-    此接口用于创建新的球队
+    此接口用于创建新的球队，球队名已存在时返回 409
     """
     @ns.doc('create_team')
     @ns.expect(team_model)
     def post(self):
         data = ns.payload
-        # team = Team(name=data['name'], points_scored=data['points_scored'], rebounds=data['rebounds'], assists=data['assists'])
-        team = Team(**data)
-        db.session.add(team)
-        db.session.commit()
-        return {'message': 'Team created successfully', 'team_id': team.id}, 201
+
+        def create():
+            # team = Team(name=data['name'], points_scored=data['points_scored'], rebounds=data['rebounds'], assists=data['assists'])
+            team = Team(**data)
+            db.session.add(team)
+            db.session.flush()
+            mark_changed('team', [team.id])
+            return team.id
+
+        try:
+            team_id = run_write(db, create)
+        except IntegrityError:
+            db.session.rollback()
+            ns.abort(409, "Team name already exists")
+        return {'message': 'Team created successfully', 'team_id': team_id}, 201
         # with Session(db.engine) as session:
         #     team = Team(name=data['name'], points_scored=data['points_scored'], rebounds=data['rebounds'], assists=data['assists'])
         #     session.add(team)
         #     session.commit()
         #     return {'message': 'Team created successfully', 'team_id': team.id}, 201
 
+    """
+    此接口用于批量更新球队，请求体为 [{"id": ..., 要修改的字段...}]，
+    按主键执行集合式 UPDATE，不加载 ORM 对象，返回实际更新的行数
+    """
+    @ns.doc('bulk_update_teams')
+    def patch(self):
+        try:
+            items = read_items()
+        except ValueError as e:
+            ns.abort(400, str(e))
+        valid, errors = validate_items(team_model, items, partial=True)
+        if not valid:
+            return {'updated': 0, 'errors': errors}, 400
+        try:
+            updated = update_rows(db, Team, [row for _, row in valid])
+            mark_changed('team', [row['id'] for _, row in valid])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            ns.abort(409, "Team name already exists")
+        return {'updated': updated, 'errors': errors}
+
+    """
+    此接口用于按 ID 集合批量删除球队，例如 DELETE /teams?ids=1,2,3
+    """
+    @ns.doc('bulk_delete_teams')
+    @ns.expect(ids_parser)
+    def delete(self):
+        try:
+            ids = parse_ids(ids_parser.parse_args()['ids'])
+        except ValueError as e:
+            ns.abort(400, str(e))
+        deleted = delete_rows(db, Team, ids)
+        mark_changed('team', ids)
+        db.session.commit()
+        return {'deleted': deleted}
+
+
+@ns.route('/bulk')
+class TeamBulk(Resource):
+    """
+    此接口用于批量创建球队，请求体为 JSON 数组或 NDJSON，所有合法的行在一个事务里写入
+    """
+    @ns.doc('bulk_create_teams')
+    @ns.expect([team_model])
+    def post(self):
+        try:
+            items = read_items()
+        except ValueError as e:
+            ns.abort(400, str(e))
+        valid, errors = validate_items(team_model, items)
+        # 球队名唯一，先挑出库里已有的和本批内重复的，避免整批因约束冲突回滚；
+        # 查完之后并发插入的同名球队由 ON CONFLICT DO NOTHING 跳过，同样按行报错
+        taken = set()
+        for names in chunked([row['name'] for _, row in valid]):
+            taken.update(db.session.scalars(db.select(Team.name).where(Team.name.in_(names))))
+        rows = []
+        for index, row in valid:
+            if row['name'] in taken:
+                errors.append({'index': index, 'error': 'Team name already exists'})
+            else:
+                taken.add(row['name'])
+                rows.append((index, row))
+        inserted = insert_new_rows(db, Team, [row for _, row in rows], 'name')
+        errors.extend({'index': index, 'error': 'Team name already exists'} for index, row in rows if row['name'] not in inserted)
+        errors.sort(key=lambda error: error['index'])
+        ids = list(inserted.values())
+        mark_changed('team', ids)
+        db.session.commit()
+        return bulk_result(ids, errors)
+
+
+@ns.route('/lookup')
+class TeamLookup(Resource):
+    """
+    此接口用于按 ID 列表批量读取球队，请求体为 {"ids": [...]} 或 ID 数组，适合放不进 URL 的长列表；
+    每 500 个 ID 一条 IN 查询，按给出的顺序返回 {"items": [...], "missing": [不存在的 ID]}，
+    ?include=players 或 totals 时附带球员列表或球员数据汇总
+    """
+    @ns.doc('lookup_teams')
+    @ns.expect(lookup_parser)
+    def post(self):
+        args = lookup_parser.parse_args()
+        try:
+            fields = parse_fields(args.get('fields'), team_model)
+            include = parse_include(args.get('include'))
+            rows, missing = load_by_ids(db, team_table, read_ids(), fields)
+        except ValueError as e:
+            ns.abort(400, str(e))
+        return {'items': with_includes(rows, fields, include), 'missing': missing}
+
+
+@ns.route('/export.csv')
+class TeamExport(Resource):
+    """
+    此接口用于以 CSV 导出球队，支持列表接口的过滤参数和 ?fields=（id 总在第一列），
+    按 id 顺序用服务端游标分批读取、边读边发送
+    """
+    @ns.doc('export_teams')
+    @ns.expect(export_parser)
+    @conditional('team')
+    def get(self):
+        args = export_parser.parse_args()
+        try:
+            fields = select_fields(('id',), *parse_fields(args.get('fields'), team_model))
+        except ValueError as e:
+            ns.abort(400, str(e))
+        stmt = filter_teams(db.select(*columns_for(team_table, fields)), args).order_by(team_table.c.id)
+        return stream_csv(db, stmt, 'teams.csv')
+
+
+@ns.route('/import')
+class TeamImport(Resource):
+    """
+    此接口用于从 CSV 导入球队，表头为字段名；边解析边分块写入，每块单独提交。
+    ?upsert=1 时按球队名（唯一）更新已有球队、插入新球队；否则重名的行报错，其余插入。
+    返回处理的行数、新建和更新的数量以及出错的行号
+    """
+    @ns.doc('import_teams')
+    @ns.expect(import_parser)
+    def post(self):
+        args = import_parser.parse_args()
+        try:
+            summary = import_csv(db, Team, team_model, 'name', upsert=args.get('upsert'), unique=('name',))
+        except ValueError as e:
+            ns.abort(400, str(e))
+        return summary, 400 if summary['errors'] and not summary['chunks'] else 200
+
+
+@ns.route('/<int:team_id>/players')
+class TeamPlayers(Resource):
+    """
+    此接口用于分页获取某支球队的球员，支持 ?fields= 和按球员字段排序，走 (team_id, points) 索引
+    """
+    @ns.doc('get_team_players')
+    @ns.expect(roster_parser)
+    @conditional('team', 'player')
+    def get(self, team_id):
+        args = roster_parser.parse_args()
+        if db.session.scalar(db.select(team_table.c.id).where(team_table.c.id == team_id)) is None:
+            ns.abort(404, "Team not found")
+        try:
+            fields = parse_fields(args.get('fields'), player_model)
+            sort = parse_sort(args.get('sort'), player_sort_columns)
+            selected = select_fields(fields, 'id', sort[0].key)
+            build = lambda: db.select(*columns_for(player_table, selected)).where(player_table.c.team_id == bindparam('team_id'))
+            rows, next_cursor = paginate(db, build, player_table.c.id, args, sort, key=('roster', selected), params={'team_id': team_id})
+        except ValueError as e:
+            ns.abort(400, str(e))
+        to_dict = row_mapper(fields)
+        return [to_dict(row) for row in rows], 200, page_headers(next_cursor)
+
+
+@ns.route('/search')
+class TeamSearch(Resource):
+    """
+    此接口用于按名字片段搜索球队，例如 ?q=猛龙；走 FTS5 trigram 索引，中文子串也能匹配，
+    结果按相关度排序并分页，翻页游标在响应头 X-Next-Cursor 中
+    """
+    @ns.doc('search_teams')
+    @ns.expect(search_parser)
+    @conditional('team')
+    def get(self):
+        args = search_parser.parse_args()
+        try:
+            fields = parse_fields(args.get('fields'), team_model)
+            columns = columns_for(team_table, select_fields(fields, 'id'))
+            rows, next_cursor = search(db, team_table, columns, args['q'], args)
+        except ValueError as e:
+            ns.abort(400, str(e))
+        to_dict = row_mapper(fields)
+        return [to_dict(row) for row in rows], 200, page_headers(next_cursor)
+
 
 @ns.route('/<int:team_id>')
 class TeamDetail(Resource):
     """
-    此接口用于根据 ID 获取单个球队的详细信息
+    此接口用于根据 ID 获取单个球队的详细信息，结果经过进程内缓存，写接口提交后失效
     """
     @ns.doc('get_team_by_id')
+    @ns.expect(detail_parser)
+    @conditional('team')
     def get(self, team_id):
-        # team = Team.query.get(team_id)
-        team = db.session.get(Team, team_id)
+        try:
+            fields = parse_fields(detail_parser.parse_args().get('fields'), team_model)
+        except ValueError as e:
+            ns.abort(400, str(e))
+        if set(fields) == set(team_fields):
+            team = caches['team'].get_or_load(team_id, lambda: load_team(team_id), table_revision('team'))
+            team = team and {name: team[name] for name in fields}
+        else:
+            team = load_team(team_id, fields)
         if team:
-            return {'id': team.id, 'name': team.name, 'points_scored': team.points_scored, 'rebounds': team.rebounds, 'assists': team.assists}
+            return team
         else:
             ns.abort(404, "Team not found")
-        # with Session(db.engine) as session:
-        #     team = session.get(Team, team_id)
-        #     if team:
-        #         return {'id': team.id, 'name': team.name, 'points_scored': team.points_scored, 'rebounds': team.rebounds, 'assists': team.assists}
-        #     else:
-        #         ns.abort(404, "Team not found")
 
     """
-    此接口用于根据 ID 更新单个球队的信息
+    此接口用于根据 ID 更新单个球队的信息，只修改请求体里出现的字段
     """
     @ns.doc('update_team_by_id')
+    @require_match('team')
     def put(self, team_id):
-        # team = Team.query.get(team_id)
-        team = db.session.get(Team, team_id)
-        if not team:
-            ns.abort(404, "Team not found")
-        data = ns.payload
-        if data.get('name'):
-            team.name = data['name']
-        if data.get('points_scored'):
-            team.points_scored = data['points_scored']
-        if data.get('rebounds'):
-            team.rebounds = data['rebounds']
-        if data.get('assists'):
-            team.assists = data['assists']
-        db.session.commit()
+        patch_team(team_id, ns.payload)
         return {'message': 'Team updated successfully'}
         # with Session(db.engine) as session:
         #     team = session.get(Team, team_id)
@@ -102,16 +475,26 @@ class TeamDetail(Resource):
         #     return {'message': 'Team updated successfully'}
 
     """
-    此接口用于根据 ID 删除球队
+    此接口用于部分更新单个球队，请求体只需包含要修改的字段，0 也会写入；
+    一条 UPDATE ... RETURNING 完成，不先读出球队，返回更新后的球队
+    """
+    @ns.doc('patch_team_by_id')
+    @require_match('team')
+    def patch(self, team_id):
+        return patch_team(team_id, ns.payload)
+
+    """
+    此接口用于根据 ID 删除球队，一条 DELETE ... RETURNING 完成，没有删除到行时返回 404
     """
     @ns.doc('delete_team_by_id')
+    @require_match('team')
     def delete(self, team_id):
-        # team = Team.query.get(team_id)
-        team = db.session.get(Team, team_id)
-        if not team:
-            ns.abort(404, "Team not found")
-        db.session.delete(team)
-        db.session.commit()
+        def remove():
+            if not delete_row(db, Team, team_id):
+                ns.abort(404, "Team not found")
+            mark_changed('team', [team_id])
+
+        run_write(db, remove)
         return {'message': 'Team deleted successfully'}
         # with Session(db.engine) as session:
         #     team = session.get(Team, team_id)
@@ -0,0 +1,132 @@
+import hashlib
+from functools import wraps
+
+from blinker import Namespace
+from flask import Response, g, request
+from flask_restx import abort
+from flask_restx.utils import unpack
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.http import quote_etag
+
+from models import db, TableRevision
+from streaming import negotiated_mimetype
+
+# 事务提交后发出，sender 为表名，ids 为修改过的行（None 表示不确定是哪些行）
+changes_committed = Namespace().signal('changes-committed')
+
+
+def bump_revision(*tables):
+    """在当前事务里递增这些表的修订号，写接口在 commit 之前调用"""
+    for name in tables:
+        stmt = insert(TableRevision).values(name=name, revision=1)
+        stmt = stmt.on_conflict_do_update(index_elements=[TableRevision.name], set_={'revision': TableRevision.revision + 1})
+        db.session.execute(stmt)
+
+
+def mark_changed(table, ids=None):
+    """
+    记录本事务修改了 table 的哪些行：立即递增修订号，
+    事务提交成功后再发出 changes_committed 信号，回滚则丢弃
+    """
+    bump_revision(table)
+    pending = db.session.info.setdefault('changed', {})
+    if ids is None or (table in pending and pending[table] is None):
+        pending[table] = None
+    else:
+        pending.setdefault(table, set()).update(ids)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _send_committed_changes(session):
+    # SAVEPOINT 的 RELEASE 也会触发 after_commit，这时外层事务还没提交（例如组提交的一批里），
+    # 改动留到外层提交后一起发出
+    if session.in_nested_transaction():
+        return
+    for table, ids in session.info.pop('changed', {}).items():
+        changes_committed.send(table, ids=ids)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    # 回滚到 SAVEPOINT 时外层事务里其他操作的改动还在；回滚掉的那部分多发一次失效没有影响
+    if session.in_nested_transaction():
+        return
+    session.info.pop('changed', None)
+
+
+def current_revisions(tables):
+    """读取表修订号，只查一张很小的表，不创建 ORM 对象；读到的修订号记在 g 上，本次请求里可以再用"""
+    rows = dict(db.session.execute(db.select(TableRevision.name, TableRevision.revision).where(TableRevision.name.in_(tables))).all())
+    revisions = [rows.get(name, 0) for name in tables]
+    g.setdefault('revisions', {}).update(zip(tables, revisions))
+    return revisions
+
+
+def table_revision(table):
+    """本次请求里 table 的修订号：conditional() 生成 ETag 时已经读过就直接用，和响应的 ETag 一致"""
+    revisions = g.get('revisions', {})
+    if table in revisions:
+        return revisions[table]
+    return current_revisions([table])[0]
+
+
+def make_etag(tables, version=None):
+    """
+    ETag = 相关表的修订号 + 请求路径、查询参数和协商出的格式的摘要（JSON 和 NDJSON 的 ETag 不同）；
+    数据不是直接从数据库读的（例如进程内快照）时传入数据自己的版本 version 代替表修订号
+    """
+    if version is not None:
+        revisions = 'v' + version
+    else:
+        revisions = '.'.join(str(revision) for revision in current_revisions(tables))
+    key = f'{request.full_path}\n{negotiated_mimetype()}'
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    return f'{revisions}-{digest}'
+
+
+def _table_names(tables):
+    """表名参数里可以有函数，按当前请求返回额外依赖的表名"""
+    names = []
+    for table in tables:
+        names.extend(table() if callable(table) else [table])
+    return names
+
+
+def conditional(*tables, version=None):
+    """
+    GET 接口装饰器：按表修订号生成 ETag。
+    If-None-Match 命中时直接返回 304，不查询数据也不做序列化。
+    响应格式随 Accept 变化，200 和 304 都带上 Vary: Accept，缓存按 Accept 分开存。
+    version 为函数时，返回值不为 None 就用它代替表修订号生成 ETag
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # 先读修订号再读数据：并发写入时最多让客户端多刷新一次，不会返回过期的 304
+            etag = make_etag(_table_names(tables), version() if version is not None else None)
+            if request.if_none_match.contains_weak(etag):
+                return Response(status=304, headers={'ETag': quote_etag(etag), 'Vary': 'Accept'})
+            resp = func(*args, **kwargs)
+            if isinstance(resp, Response):
+                resp.set_etag(etag)
+                resp.vary.add('Accept')
+                return resp
+            data, code, headers = unpack(resp)
+            if code == 200:
+                headers = dict(headers, ETag=quote_etag(etag), Vary='Accept')
+            return data, code, headers
+        return wrapper
+    return decorator
+
+
+def require_match(*tables):
+    """PUT/DELETE 接口装饰器：带 If-Match 时，ETag 不一致返回 412"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.if_match and not request.if_match.contains(make_etag(_table_names(tables))):
+                abort(412, 'Resource has been modified')
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
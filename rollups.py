@@ -0,0 +1,92 @@
+import click
+from sqlalchemy import DDL, event, text
+
+ROLLUP = 'team_rollup'
+
+# 按球队汇总的球员数据列
+STATS = ('points', 'rebounds', 'assists')
+
+# 没有球队的球员汇总在 team_id 0 下（主键不能为空，真实的球队 ID 从 1 开始）
+NO_TEAM = 0
+
+
+def _add(row):
+    """把 row（new 或 old）这名球员加进所在球队的汇总，汇总行不存在时插入"""
+    values = ', '.join(f'coalesce({row}.{name}, 0)' for name in STATS)
+    updates = ', '.join(f'{name} = {name} + excluded.{name}' for name in STATS)
+    return (f"INSERT INTO {ROLLUP} (team_id, players, {', '.join(STATS)}) "
+            f"VALUES (coalesce({row}.team_id, {NO_TEAM}), 1, {values}) "
+            f"ON CONFLICT (team_id) DO UPDATE SET players = players + 1, {updates};")
+
+
+def _subtract(row):
+    """把 row 这名球员从所在球队的汇总里减掉"""
+    updates = ', '.join(f'{name} = {name} - coalesce({row}.{name}, 0)' for name in STATS)
+    return f"UPDATE {ROLLUP} SET players = players - 1, {updates} WHERE team_id = coalesce({row}.team_id, {NO_TEAM});"
+
+
+def rollup_ddl(base):
+    """
+    base（球员表）上维护球队汇总的触发器：插入时加、删除时减，
+    修改球队或数据列时先从旧球队减掉再加到新球队，每次写入只改一两行汇总，和球员总数无关
+    """
+    source = base.name
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {source}_rollup_ai AFTER INSERT ON {source} BEGIN {_add('new')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {source}_rollup_ad AFTER DELETE ON {source} BEGIN {_subtract('old')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {source}_rollup_au AFTER UPDATE OF team_id, {', '.join(STATS)} ON {source} BEGIN "
+        f"{_subtract('old')} {_add('new')} END",
+    ]
+
+
+def drop_triggers_ddl(base):
+    return [f'DROP TRIGGER IF EXISTS {base.name}_rollup_{suffix}' for suffix in ('ai', 'ad', 'au')]
+
+
+def rebuild_ddl(base):
+    """按球员表重新计算全部汇总，用于迁移、批量导入之后和修复漂移"""
+    sums = ', '.join(f'coalesce(sum({name}), 0)' for name in STATS)
+    return [
+        f'DELETE FROM {ROLLUP}',
+        f"INSERT INTO {ROLLUP} (team_id, players, {', '.join(STATS)}) "
+        f'SELECT coalesce(team_id, {NO_TEAM}), count(*), {sums} FROM {base.name} GROUP BY coalesce(team_id, {NO_TEAM})',
+    ]
+
+
+def install_rollups(base):
+    """create_all / drop_all 时一起创建、删除汇总触发器（只对 SQLite 生效）"""
+    for statement in rollup_ddl(base):
+        event.listen(base, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    for statement in drop_triggers_ddl(base):
+        event.listen(base, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def rebuild_rollups(connection, base):
+    """重建汇总，返回和重建前不一致（漂移）的球队数"""
+    columns = ', '.join(('team_id', 'players') + STATS)
+    before = set(connection.execute(text(f'SELECT {columns} FROM {ROLLUP} WHERE players != 0')))
+    for statement in rebuild_ddl(base):
+        connection.execute(text(statement))
+    after = set(connection.execute(text(f'SELECT {columns} FROM {ROLLUP}')))
+    return len({row[0] for row in before ^ after})
+
+
+def init_rollups(app, db):
+    """注册 flask rollups 命令，按球员表重建球队汇总"""
+    @app.cli.command('rollups')
+    @click.option('--check', is_flag=True, help='只报告漂移的球队数，不修改')
+    def rebuild(check):
+        """按球员表重建球队汇总（team_rollup），修复漂移"""
+        from models import Player
+        from revisions import mark_changed
+
+        drifted = rebuild_rollups(db.session.connection(), Player.__table__)
+        if check:
+            db.session.rollback()
+            click.echo(f'{drifted} teams drifted')
+            return
+        # 汇总变了，让依赖球队和球员的响应的 ETag 失效
+        mark_changed('team')
+        mark_changed('player')
+        db.session.commit()
+        click.echo(f'Rebuilt team rollups, {drifted} teams repaired')
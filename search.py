@@ -0,0 +1,121 @@
+import re
+
+from sqlalchemy import DDL, column, event, select, table, tuple_
+
+from pagination import decode_cursor, encode_cursor, page_limit
+
+# trigram 分词器至少要 3 个字符才能用索引，更短的查询退回到对原表的 LIKE 扫描
+MIN_TRIGRAM = 3
+
+# FTS5 外部内容表及其影子表，不归 SQLAlchemy 的元数据管理
+FTS_NAME = re.compile(r'^\w+_fts(_\w+)?$')
+
+
+def fts_name(base):
+    return f'{base.name}_fts'
+
+
+def fts_ddl(base, column_name='name'):
+    """
+    建立 base 表 column_name 列的 FTS5 trigram 索引（外部内容表，不重复存储数据），
+    以及在插入、删除、修改该列时同步索引的触发器
+    """
+    fts, source = fts_name(base), base.name
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_name}, content='{source}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column_name}) VALUES (new.id, new.{column_name}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column_name}) VALUES ('delete', old.id, old.{column_name}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_name} ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column_name}) VALUES ('delete', old.id, old.{column_name}); "
+        f"INSERT INTO {fts}(rowid, {column_name}) VALUES (new.id, new.{column_name}); END",
+    ]
+
+
+def drop_triggers_ddl(base):
+    fts = fts_name(base)
+    return [f'DROP TRIGGER IF EXISTS {fts}_{suffix}' for suffix in ('ai', 'ad', 'au')]
+
+
+def drop_fts_ddl(base):
+    return drop_triggers_ddl(base) + [f'DROP TABLE IF EXISTS {fts_name(base)}']
+
+
+def rebuild_ddl(base):
+    """按原表内容重建整个索引，用于迁移和批量导入之后"""
+    fts = fts_name(base)
+    return f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+
+
+def install_fts(base, column_name='name'):
+    """create_all / drop_all 时一起创建、删除索引和触发器（只对 SQLite 生效）"""
+    for statement in fts_ddl(base, column_name):
+        event.listen(base, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    for statement in drop_fts_ddl(base):
+        event.listen(base, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def include_name(name, type_, parent_names):
+    """给 alembic 自动生成迁移用：忽略 FTS 表和影子表"""
+    return not (type_ == 'table' and FTS_NAME.match(name))
+
+
+def add_search_arguments(parser):
+    """给搜索接口的解析器加上查询词和分页参数"""
+    parser.add_argument('q', type=str, location='args', required=True, help=f'要搜索的名字片段；不少于 {MIN_TRIGRAM} 个字符时按相关度排序')
+    parser.add_argument('limit', type=int, location='args', help='每页条数')
+    parser.add_argument('cursor', type=str, location='args', help='上一页响应头 X-Next-Cursor 中的游标')
+    return parser
+
+
+def _fts_phrase(q):
+    # 整个查询词作为一个短语，trigram 分词下就是子串匹配
+    return '"' + q.replace('"', '""') + '"'
+
+
+def _like_pattern(q):
+    return '%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search(db, base, columns, q, args, column_name='name'):
+    """
+    在 base 表的 column_name 列里搜索包含 q 的记录，columns 为要查询的列（必须包含 id）。
+    q 不少于 MIN_TRIGRAM 个字符时走 FTS5 索引，按 bm25 相关度、再按 id 排序；
+    更短的查询按 id 顺序扫描 LIKE，凑够一页就停。
+    两种情况都用 keyset 游标翻页，返回 (当前页的行列表, 下一页游标或 None)
+    """
+    q = (q or '').strip()
+    if not q:
+        raise ValueError('q must not be empty')
+    limit = page_limit(args)
+    after = decode_cursor(args['cursor']) if args.get('cursor') else None
+    id_column = base.c.id
+    if len(q) >= MIN_TRIGRAM:
+        fts = table(fts_name(base), column('rowid'), column('rank'))
+        stmt = (
+            select(*columns, fts.c.rank)
+            .join_from(fts, base, id_column == fts.c.rowid)
+            .where(column(fts_name(base)).match(_fts_phrase(q)))
+            .order_by(fts.c.rank, id_column)
+        )
+        if after is not None:
+            if len(after) != 2 or not isinstance(after[0], (int, float)) or not isinstance(after[1], int):
+                raise ValueError('Invalid cursor')
+            stmt = stmt.where(tuple_(fts.c.rank, id_column) > tuple_(*after))
+    else:
+        stmt = select(*columns).where(base.c[column_name].like(_like_pattern(q), escape='\\')).order_by(id_column)
+        if after is not None:
+            if len(after) != 1 or not isinstance(after[0], int):
+                raise ValueError('Invalid cursor')
+            stmt = stmt.where(id_column > after[0])
+
+    # 多取一条用来判断是否还有下一页
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]._mapping
+    if len(q) >= MIN_TRIGRAM:
+        return rows, encode_cursor([last['rank'], last[id_column]])
+    return rows, encode_cursor([last[id_column]])
@@ -0,0 +1,200 @@
+import argparse
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from faker import Faker
+
+fake = Faker(locale = 'zh_CN')
+
+# 球队名后缀
+MASCOTS = ['猛龙', '雄鹰', '猎豹', '火箭', '雷霆', '飞虎', '金狮', '战狼', '蛟龙', '天马', '烈火', '闪电']
+
+# 姓名池：预先用 faker 抽取姓和名，生成球员时只做随机组合，不再逐行调用 faker
+NAME_POOL_SEED = 2024
+NAME_POOL_DRAWS = 5000
+
+# 每批生成/写入的球员数，以及每写入多少行提交一次
+BATCH_SIZE = 10000
+COMMIT_EVERY = 200000
+
+PLAYER_COLUMNS = ('name', 'team_id', 'points', 'rebounds', 'assists')
+
+_name_pool = None
+
+# 生成不重复的球队名
+def team_name(taken):
+    name = fake.city_name() + fake.random_element(elements=MASCOTS)
+    if name in taken:
+        name = f'{name}{len(taken)}'
+    taken.add(name)
+    return name
+
+# 生成球队模拟数据，taken 为数据库里已有的球队名
+def generate_teams(num_teams, taken=None):
+    teams = []
+    taken = set() if taken is None else set(taken)
+    for _ in range(num_teams):
+        team = {
+            'name': team_name(taken),
+            'points_scored': fake.random_int(min=50, max=120),
+            'rebounds': fake.random_int(min=20, max=70),
+            'assists': fake.random_int(min=10, max=50)
+        }
+        teams.append(team)
+    return teams
+
+# 姓和名的候选列表，每个进程只生成一次；固定种子，保证各个进程的姓名池相同
+def name_pool():
+    global _name_pool
+    if _name_pool is None:
+        pool = Faker(locale='zh_CN')
+        pool.seed_instance(NAME_POOL_SEED)
+        last_names = sorted({pool.last_name() for _ in range(NAME_POOL_DRAWS)})
+        first_names = sorted({pool.first_name() for _ in range(NAME_POOL_DRAWS)})
+        _name_pool = last_names, first_names
+    return _name_pool
+
+# 批量生成球员行元组 (name, team_id, points, rebounds, assists)，每一列一次抽取 size 个随机数
+def player_batch(size, team_ids, seed=None):
+    rng = random.Random(seed)
+    last_names, first_names = name_pool()
+    names = map(str.__add__, rng.choices(last_names, k=size), rng.choices(first_names, k=size))
+    return list(zip(
+        names,
+        rng.choices(team_ids, k=size),
+        rng.choices(range(5, 31), k=size),
+        rng.choices(range(2, 16), k=size),
+        rng.choices(range(1, 11), k=size),
+    ))
+
+# 生成球员模拟数据
+def generate_players(num_players, teams):
+    rows = player_batch(num_players, [team['id'] for team in teams])
+    return [dict(zip(PLAYER_COLUMNS, row)) for row in rows]
+
+# 按批次生成球员行；workers > 1 时分发到进程池，在途批次数有上限，内存占用不随总行数增长
+def player_batches(num_players, team_ids, batch_size=BATCH_SIZE, workers=1, seed=None):
+    sizes = [min(batch_size, num_players - start) for start in range(0, num_players, batch_size)]
+    seeds = [None if seed is None else seed + i for i in range(len(sizes))]
+    if workers <= 1:
+        for size, batch_seed in zip(sizes, seeds):
+            yield player_batch(size, team_ids, batch_seed)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for size, batch_seed in zip(sizes, seeds):
+            pending.append(pool.submit(player_batch, size, team_ids, batch_seed))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# 把球队和球员直接流式写入数据库：分批 executemany，每 commit_every 行提交一次，返回 (球队数, 球员数)。
+# defer_indexes 时先删除 player 表的二级索引以及全文索引、球队汇总和变更序号的触发器，写完再重建，比逐行维护快得多
+def seed_database(engine, num_teams, num_players, batch_size=BATCH_SIZE, workers=1, commit_every=COMMIT_EVERY, seed=None, defer_indexes=True, log=None):
+    from sqlalchemy import insert, select
+    from models import Player, Team
+    from search import drop_triggers_ddl, fts_ddl, fts_name, rebuild_ddl
+    import changes
+    import rollups
+
+    player_table = Player.__table__
+    # 预编译 INSERT，驱动是位置参数时直接传行元组，省去每行构造 dict
+    compiled = insert(player_table).compile(dialect=engine.dialect, column_keys=PLAYER_COLUMNS)
+    positional = compiled.positional and tuple(compiled.positiontup) == PLAYER_COLUMNS
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        taken = conn.scalars(select(Team.name)).all()
+        teams = generate_teams(num_teams, taken)
+        if teams:
+            conn.execute(insert(Team), teams)
+        team_ids = conn.scalars(select(Team.id)).all()
+        if num_players and not team_ids:
+            raise ValueError('No teams to assign players to')
+        indexes = sorted(player_table.indexes, key=lambda index: index.name) if defer_indexes and num_players else []
+        for index in indexes:
+            index.drop(conn, checkfirst=True)
+        # 全文索引由迁移或 create_all 建立，库里还没有时不去动它
+        fts = bool(indexes) and engine.dialect.name == 'sqlite' and conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_name(player_table),)).first() is not None
+        if fts:
+            for statement in drop_triggers_ddl(player_table):
+                conn.exec_driver_sql(statement)
+        rollup = bool(indexes) and engine.dialect.name == 'sqlite' and conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (rollups.ROLLUP,)).first() is not None
+        if rollup:
+            for statement in rollups.drop_triggers_ddl(player_table):
+                conn.exec_driver_sql(statement)
+        tracked = bool(indexes) and engine.dialect.name == 'sqlite' and conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (changes.TOMBSTONE,)).first() is not None
+        if tracked:
+            for statement in changes.drop_triggers_ddl(player_table):
+                conn.exec_driver_sql(statement)
+        conn.commit()
+
+        inserted = uncommitted = 0
+        try:
+            for rows in player_batches(num_players, team_ids, batch_size, workers, seed):
+                conn.exec_driver_sql(str(compiled), rows if positional else [dict(zip(PLAYER_COLUMNS, row)) for row in rows])
+                inserted += len(rows)
+                uncommitted += len(rows)
+                if uncommitted >= commit_every:
+                    conn.commit()
+                    uncommitted = 0
+                    if log:
+                        log(f'{inserted} players, {inserted / (time.perf_counter() - started):.0f} rows/s')
+            conn.commit()
+        finally:
+            conn.rollback()
+            for index in indexes:
+                index.create(conn, checkfirst=True)
+            if fts:
+                for statement in fts_ddl(player_table):
+                    conn.exec_driver_sql(statement)
+                conn.exec_driver_sql(rebuild_ddl(player_table))
+            if rollup:
+                for statement in rollups.rollup_ddl(player_table) + rollups.rebuild_ddl(player_table):
+                    conn.exec_driver_sql(statement)
+            if tracked:
+                # 新写入的球员一次性补上变更序号
+                for statement in changes.changes_ddl(player_table) + changes.stamp_ddl(player_table):
+                    conn.exec_driver_sql(statement)
+            conn.commit()
+            if log and indexes:
+                log(f'rebuilt {len(indexes)} indexes' + (' and the full-text index' if fts else '') + (' and team rollups' if rollup else ''))
+    return len(teams), inserted
+
+def main():
+    from app import create_app, db
+    from config import configs
+    from revisions import mark_changed
+
+    parser = argparse.ArgumentParser(description='生成模拟的球队和球员数据并写入数据库')
+    parser.add_argument('--teams', type=int, default=30, help='新建的球队数，0 表示只给已有球队添加球员')
+    parser.add_argument('--players', type=int, default=1000, help='新建的球员数')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='每批生成和写入的球员数')
+    parser.add_argument('--workers', type=int, default=1, help='生成数据的进程数')
+    parser.add_argument('--commit-every', type=int, default=COMMIT_EVERY, help='每写入多少行提交一次')
+    parser.add_argument('--keep-indexes', action='store_true', help='写入时保留 player 表的二级索引，不在结束后重建')
+    parser.add_argument('--seed', type=int, help='随机数种子，指定后生成的数据可复现')
+    parser.add_argument('--config', choices=tuple(configs), default='development', help='使用的配置，决定写入哪个数据库')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    log = lambda message: print(message, file=sys.stderr)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        teams, players = seed_database(db.engine, args.teams, args.players, args.batch_size, args.workers, args.commit_every, args.seed, not args.keep_indexes, log)
+        elapsed = time.perf_counter() - started
+        # 让已有的 ETag 和缓存失效
+        mark_changed('team')
+        mark_changed('player')
+        db.session.commit()
+    print(f'inserted {teams} teams and {players} players in {elapsed:.1f}s ({(teams + players) / elapsed:.0f} rows/s)')
+
+if __name__ == '__main__':
+    main()
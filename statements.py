@@ -0,0 +1,96 @@
+import threading
+from collections import Counter, OrderedDict
+
+from sqlalchemy import event
+
+# 执行上下文的 cache_hit 在编译缓存统计里的名字
+COMPILED_RESULTS = {
+    'CACHE_HIT': 'hit',
+    'CACHE_MISS': 'miss',
+    'CACHING_DISABLED': 'disabled',
+    'NO_CACHE_KEY': 'no_key',
+    'NO_DIALECT_SUPPORT': 'no_dialect',
+}
+
+
+class StatementCache:
+    """
+    按查询形状缓存构造好的 Core 语句：形状由表、输出字段、用到的过滤条件、排序和游标位置组成，
+    所有取值都是 bindparam，执行时再传入。同一形状的请求复用同一个语句对象，
+    省掉每次构造语句和计算 SQLAlchemy 缓存键的开销，编译缓存也总能命中。
+    按 LRU 淘汰，maxsize 为 0 时不缓存（每次重新构造，用于对比）
+    """
+
+    def __init__(self, maxsize=1024):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+
+    def configure(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, key, build):
+        """返回 key 对应的语句，没有时调用 build() 构造并缓存"""
+        with self._lock:
+            stmt = self._data.get(key)
+            if stmt is not None:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return stmt
+            self.misses += 1
+        stmt = build()
+        if self.maxsize:
+            with self._lock:
+                self._data[key] = stmt
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return stmt
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class CompiledCacheStats:
+    """统计每次执行时 SQLAlchemy 编译缓存的命中情况（执行上下文的 cache_hit）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        result = getattr(context, 'cache_hit', None)
+        name = COMPILED_RESULTS.get(getattr(result, 'name', None), 'no_key')
+        with self._lock:
+            self.counts[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {name: self.counts[name] for name in COMPILED_RESULTS.values()}
+
+
+statements = StatementCache()
+compiled_stats = CompiledCacheStats()
+
+
+def cached_statement(key, build):
+    """按形状 key 取缓存的语句，见 StatementCache"""
+    return statements.get(key, build)
+
+
+def init_statement_cache(app, db):
+    """按配置设置语句缓存大小，并统计各引擎上编译缓存的命中情况"""
+    statements.configure(app.config['STATEMENT_CACHE_SIZE'])
+    with app.app_context():
+        engines = [db.engine] + [engine for engine in [app.extensions.get('readonly_engine')] if engine is not None]
+    for engine in engines:
+        if not event.contains(engine, 'after_cursor_execute', compiled_stats.after_cursor_execute):
+            event.listen(engine, 'after_cursor_execute', compiled_stats.after_cursor_execute)
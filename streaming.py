@@ -0,0 +1,42 @@
+import json
+
+from flask import Response, request, stream_with_context
+from flask_restx import inputs
+
+from fieldsets import row_mapper
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+BATCH_SIZE = 1000
+
+
+def add_stream_argument(parser):
+    """给列表接口的解析器加上流式输出开关"""
+    parser.add_argument('stream', type=inputs.boolean, location='args', help='以 NDJSON 流式返回全部数据')
+    return parser
+
+
+def negotiated_mimetype():
+    """按 Accept 协商出的列表格式：JSON 或 NDJSON，没有 Accept 时为 JSON"""
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+
+
+def wants_stream(args):
+    """?stream=1 或 Accept: application/x-ndjson 时走流式输出"""
+    if args.get('stream'):
+        return True
+    return negotiated_mimetype() == NDJSON_MIMETYPE
+
+
+def stream_rows(db, stmt, batch_size=BATCH_SIZE):
+    """
+    用服务端游标按批读取查询结果，逐行以 NDJSON 输出。
+    内存里最多只有一批数据，第一批读完就开始发送。
+    """
+    to_dict = row_mapper(tuple(stmt.selected_columns.keys()))
+
+    def generate():
+        result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+        for batch in result.partitions():
+            yield ''.join(json.dumps(to_dict(row), ensure_ascii=False) + '\n' for row in batch)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -1,8 +1,23 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
 from unittest.mock import MagicMock
+from sqlalchemy import event, text
 from sqlalchemy.orm import Session
 from app import create_app, db
 from models import Team, Player
+from cache import caches
+from config import Config, ProductionConfig
+from engine import read_engine
+from seed import seed_database
+from statements import statements
+from revisions import changes_committed, mark_changed
+from analytics import PlayerColumns
 from flask_restx import inputs
 
 app = create_app()
@@ -13,6 +28,9 @@ class TestNBAStatsAPI(unittest.TestCase):
         self.app_context = app.app_context()
         self.app_context.push()
         db.create_all()
+        # 每个用例都会重建数据库，清掉上一个用例留下的缓存
+        for cache in caches.values():
+            cache.clear()
 
         # 创建测试会话
         self.session = Session(db.engine)
@@ -212,5 +230,843 @@ class TestNBAStatsAPI(unittest.TestCase):
             deleted_player = self.session.get(Player, 1)
             self.assertIsNone(deleted_player)
 
+    def test_get_players_paginated(self):
+        # 在测试会话中添加 5 个球员，按每页 2 条翻页
+        team = Team(name='Team for Paging')
+        self.session.add(team)
+        self.session.add_all([Player(name=f'Paged {i}', team_id=1, points=i, rebounds=i, assists=i) for i in range(5)])
+        self.session.commit()
+
+        with app.test_client() as client:
+            names = []
+            response = client.get('/players?limit=2')
+            while True:
+                self.assertEqual(response.status_code, 200)
+                data = response.get_json()
+                self.assertLessEqual(len(data), 2)
+                names.extend(player['name'] for player in data)
+                cursor = response.headers.get('X-Next-Cursor')
+                if cursor is None:
+                    break
+                response = client.get(f'/players?limit=2&cursor={cursor}')
+            self.assertEqual(names, [f'Paged {i}' for i in range(5)])
+
+            response = client.get('/players?after=3')
+            self.assertEqual([player['name'] for player in response.get_json()], ['Paged 3', 'Paged 4'])
+
+            response = client.get('/players?cursor=not-a-cursor')
+            self.assertEqual(response.status_code, 400)
+
+    def test_stream_teams(self):
+        # 流式输出应返回全部球队，每行一个 JSON 对象
+        self.session.add_all([Team(name=f'Streamed {i}', points_scored=i, rebounds=i, assists=i) for i in range(3)])
+        self.session.commit()
+
+        with app.test_client() as client:
+            for headers in ({}, {'Accept': 'application/x-ndjson'}):
+                response = client.get('/teams' if headers else '/teams?stream=1', headers=headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, 'application/x-ndjson')
+                rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+                self.assertEqual([row['name'] for row in rows], ['Streamed 0', 'Streamed 1', 'Streamed 2'])
+                self.assertEqual(rows[2]['points_scored'], 2)
+                response.close()
+
+    def test_bulk_create_players(self):
+        # 合法的行一次写入，不合法的行逐条报错
+        with app.test_client() as client:
+            data = [
+                {'name': 'Bulk 1', 'team_id': 1, 'points': 10, 'rebounds': 5, 'assists': 2},
+                {'name': 'Bulk 2', 'team_id': 1, 'points': 'many', 'rebounds': 5, 'assists': 2},
+                {'name': 'Bulk 3', 'team_id': 1, 'points': 12, 'rebounds': 6, 'assists': 3},
+            ]
+            response = client.post('/players/bulk', json=data)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json['created'], 2)
+            self.assertEqual(response.json['id_ranges'], [[1, 2]])
+            self.assertEqual([error['index'] for error in response.json['errors']], [1])
+            self.assertEqual(self.session.get(Player, 2).name, 'Bulk 3')
+
+    def test_bulk_create_teams_ndjson(self):
+        # NDJSON 请求体，重名的球队单独报错
+        self.session.add(Team(name='Existing', points_scored=1, rebounds=1, assists=1))
+        self.session.commit()
+
+        with app.test_client() as client:
+            lines = [
+                {'name': 'Existing', 'points_scored': 1, 'rebounds': 1, 'assists': 1},
+                {'name': 'Fresh', 'points_scored': 2, 'rebounds': 2, 'assists': 2},
+                {'name': 'Fresh', 'points_scored': 3, 'rebounds': 3, 'assists': 3},
+            ]
+            body = '\n'.join(json.dumps(line) for line in lines)
+            response = client.post('/teams/bulk', data=body, content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json['created'], 1)
+            self.assertEqual([error['index'] for error in response.json['errors']], [0, 2])
+
+            response = client.post('/teams/bulk', json={'name': 'Not a list'})
+            self.assertEqual(response.status_code, 400)
+
+            # 查重之后、插入之前别的请求插入了同名球队：这一行单独报错，其余的照常写入
+            def race(connection, cursor, statement, parameters, context, many):
+                if statement.startswith('SELECT team.name') and not raced:
+                    raced.append(True)
+                    with db.engine.begin() as other:
+                        other.execute(text("INSERT INTO team (name) VALUES ('Racer')"))
+
+            raced = []
+            event.listen(db.engine, 'after_cursor_execute', race)
+            try:
+                response = client.post('/teams/bulk', json=[{'name': name, 'points_scored': 1, 'rebounds': 1, 'assists': 1} for name in ('Racer', 'Winner')])
+            finally:
+                event.remove(db.engine, 'after_cursor_execute', race)
+            self.assertTrue(raced)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json['created'], 1)
+            self.assertEqual(response.json['errors'], [{'index': 0, 'error': 'Team name already exists'}])
+            self.assertEqual(self.session.scalar(text("SELECT COUNT(*) FROM team WHERE name IN ('Racer', 'Winner')")), 2)
+
+    def test_bulk_update_and_delete_players(self):
+        # 批量更新只改传入的字段，0 也要能写进去；批量删除返回实际删除的行数
+        self.session.add_all([Player(name=f'Batch {i}', team_id=1, points=10, rebounds=5, assists=2) for i in range(4)])
+        self.session.commit()
+
+        with app.test_client() as client:
+            data = [{'id': 1, 'points': 0}, {'id': 2, 'points': 30, 'assists': 9}, {'id': 99, 'points': 1}, {'points': 1}]
+            response = client.patch('/players', json=data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['updated'], 2)
+            self.assertEqual([error['index'] for error in response.json['errors']], [3])
+            self.assertEqual(self.session.get(Player, 1).points, 0)
+            self.assertEqual(self.session.get(Player, 2).assists, 9)
+            self.assertEqual(self.session.get(Player, 2).rebounds, 5)
+
+            response = client.delete('/players?ids=2,3,99')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['deleted'], 2)
+            self.assertIsNone(self.session.get(Player, 3))
+
+            response = client.delete('/players?ids=a,b')
+            self.assertEqual(response.status_code, 400)
+
+    def test_patch_and_delete_single_statement(self):
+        # PATCH 只改传入的字段，0 也要写进去；更新和删除各只执行一条针对球员表的语句，行不存在时 404
+        self.session.add(Team(name='Patch A', points_scored=1, rebounds=1, assists=1))
+        self.session.add(Team(name='Patch B', points_scored=1, rebounds=1, assists=1))
+        self.session.add(Player(name='Patched', team_id=1, points=12, rebounds=6, assists=2))
+        self.session.commit()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        with app.test_client() as client:
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            response = client.patch('/players/1', json={'points': 0, 'assists': 4})
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json, {'id': 1, 'name': 'Patched', 'team_id': 1, 'points': 0, 'rebounds': 6, 'assists': 4})
+            self.assertEqual([statement.split()[0] for statement in statements if ' player' in statement], ['UPDATE'])
+            self.assertIn('RETURNING', statements[0])
+
+            self.assertEqual(client.put('/players/1', json={'rebounds': 0}).status_code, 200)
+            self.assertEqual(self.session.get(Player, 1).rebounds, 0)
+            self.assertEqual(client.patch('/players/9', json={'points': 1}).status_code, 404)
+            self.assertEqual(client.patch('/players/1', json={'points': 'many'}).status_code, 400)
+            self.assertEqual(client.patch('/players/1', json={}).status_code, 400)
+            self.assertEqual(client.patch('/teams/2', json={'name': 'Patch A'}).status_code, 409)
+            self.assertEqual(client.patch('/teams/2', json={'points_scored': 0}).json['points_scored'], 0)
+
+            self.assertEqual(client.delete('/players/1').status_code, 200)
+            self.assertEqual(client.delete('/players/1').status_code, 404)
+            self.assertEqual(client.delete('/teams/9').status_code, 404)
+
+    def test_lookup_by_ids(self):
+        # 按给出的顺序返回，不存在的 ID 单独列出；ID 很多时按块查询，每块一条 IN 语句
+        self.session.add(Team(name='Lookup A', points_scored=1, rebounds=1, assists=1))
+        self.session.add_all([Player(name=f'Lookup {i}', team_id=1, points=i, rebounds=1, assists=1) for i in range(3)])
+        self.session.commit()
+
+        with app.test_client() as client:
+            response = client.get('/players?ids=3,9,1,3&fields=name')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json, [{'name': 'Lookup 2'}, {'name': 'Lookup 0'}])
+            self.assertEqual(response.headers['X-Missing-Ids'], '9')
+            self.assertEqual(client.get('/players?ids=1&team_id=1').status_code, 400)
+            self.assertEqual(client.get('/players?ids=1&sort=-points').status_code, 400)
+
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            response = client.post('/players/lookup', json={'ids': list(range(1200, 0, -1))})
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([player['id'] for player in response.json['items']], [3, 2, 1])
+            self.assertEqual(len(response.json['missing']), 1197)
+            self.assertEqual(len([statement for statement in statements if 'FROM player' in statement]), 3)
+            self.assertEqual(client.post('/players/lookup', json={'ids': ['a']}).status_code, 400)
+
+            response = client.post('/teams/lookup?include=players&fields=name', json=[1, 2])
+            self.assertEqual(response.json['items'][0]['name'], 'Lookup A')
+            self.assertEqual(len(response.json['items'][0]['players']), 3)
+            self.assertEqual(response.json['missing'], [2])
+            self.assertEqual(client.get('/teams?ids=1').json[0]['name'], 'Lookup A')
+
+    def test_filter_and_sort_players(self):
+        # 按球队过滤、按得分降序翻页，同分按 ID 降序，得分为空的球员排在最后
+        points = [12, 30, None, 12, 25, 8]
+        self.session.add_all([Player(name=f'Sorted {i}', team_id=1 if i < 5 else 2, points=p, rebounds=1, assists=1) for i, p in enumerate(points)])
+        self.session.commit()
+
+        with app.test_client() as client:
+            ids = []
+            response = client.get('/players?team_id=1&sort=-points&limit=2')
+            while True:
+                self.assertEqual(response.status_code, 200)
+                ids.extend(player['id'] for player in response.get_json())
+                cursor = response.headers.get('X-Next-Cursor')
+                if cursor is None:
+                    break
+                response = client.get(f'/players?team_id=1&sort=-points&limit=2&cursor={cursor}')
+            self.assertEqual(ids, [2, 5, 4, 1, 3])
+
+            response = client.get('/players?min_points=12&sort=points')
+            self.assertEqual([player['id'] for player in response.get_json()], [1, 4, 5, 2])
+            response = client.get('/players?name_prefix=Sorted&team_id=2&sort=-name')
+            self.assertEqual([player['id'] for player in response.get_json()], [6])
+
+            response = client.get('/players?sort=height')
+            self.assertEqual(response.status_code, 400)
+
+    def test_filter_sort_index_plans(self):
+        # 支持的每种过滤和排序组合（包括翻页后的查询）都是索引上的范围扫描，不扫全表、不另外排序；
+        # 区间过滤和别的列排序一起用时只能把整个索引走一遍或者再排序，返回 400
+        self.session.add_all([Team(name=f'Plan Team {i}', points_scored=i) for i in range(4)])
+        self.session.add_all([Player(name=f'Plan {i}', team_id=1 + i % 2, points=i, rebounds=i, assists=i) for i in range(8)])
+        self.session.commit()
+
+        def queries(path, filters, sorts):
+            for query in filters:
+                for sort in sorts:
+                    for direction in ('', '-'):
+                        yield f'{path}?{query}&sort={direction}{sort}&limit=2'
+
+        supported = list(queries('/players', ('', 'team_id=1'), ('id', 'name', 'points', 'rebounds', 'assists')))
+        supported += queries('/players', ('min_points=1', 'min_points=1&max_points=6', 'team_id=1&max_points=6'), ('points',))
+        supported += queries('/players', ('name_prefix=Plan', 'team_id=2&name_prefix=Plan'), ('name',))
+        supported += queries('/teams', ('',), ('id', 'name', 'points_scored'))
+        supported += queries('/teams', ('min_points_scored=1',), ('points_scored',))
+        supported += queries('/teams', ('name_prefix=Plan',), ('name',))
+
+        executed = []
+        listener = lambda connection, cursor, statement, parameters, context, many: executed.append((statement, parameters))
+        with app.test_client() as client:
+            for url in supported:
+                executed.clear()
+                event.listen(db.engine, 'before_cursor_execute', listener)
+                try:
+                    # 第一页和按游标翻的第二页
+                    response = client.get(url)
+                    self.assertEqual(response.status_code, 200, url)
+                    self.assertIn('X-Next-Cursor', response.headers, url)
+                    self.assertEqual(client.get(url + '&cursor=' + response.headers['X-Next-Cursor']).status_code, 200, url)
+                finally:
+                    event.remove(db.engine, 'before_cursor_execute', listener)
+                pages = [(statement, parameters) for statement, parameters in executed if 'ORDER BY' in statement]
+                self.assertTrue(pages, url)
+                filtered = '?&' not in url
+                with db.engine.connect() as connection:
+                    for statement, parameters in pages:
+                        plan = [row[3] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+                        self.assertFalse([step for step in plan if 'TEMP B-TREE' in step], (url, plan))
+                        if filtered:
+                            self.assertTrue(all(step.startswith('SEARCH') for step in plan), (url, plan))
+
+            for url in ('/players?min_points=29&limit=10', '/players?max_points=6&sort=name', '/players?name_prefix=P&sort=-points',
+                        '/players?team_id=1&min_points=1', '/players?min_points=1&name_prefix=P&sort=points',
+                        '/teams?min_points_scored=1', '/teams?name_prefix=P&sort=points_scored'):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 400, url)
+                self.assertIn('can only be used with sort=', response.json['message'])
+
+    def test_stats_endpoints(self):
+        # 汇总和排行都由数据库计算
+        self.session.add_all([Team(name='Stats A'), Team(name='Stats B')])
+        self.session.add_all([
+            Player(name='A1', team_id=1, points=20, rebounds=5, assists=7),
+            Player(name='A2', team_id=1, points=10, rebounds=8, assists=1),
+            Player(name='B1', team_id=2, points=25, rebounds=3, assists=2),
+        ])
+        self.session.commit()
+
+        with app.test_client() as client:
+            response = client.get('/teams/1/totals')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json, {'team_id': 1, 'players': 2, 'points': 30, 'rebounds': 13, 'assists': 8})
+            self.assertEqual(client.get('/teams/9/totals').status_code, 404)
+
+            response = client.get('/stats/leaders?stat=points&k=2')
+            self.assertEqual([(row['rank'], row['name'], row['value']) for row in response.json], [(1, 'B1', 25), (2, 'A1', 20)])
+            self.assertEqual(client.get('/stats/leaders?stat=height').status_code, 400)
+
+            response = client.get('/stats/by-team')
+            self.assertEqual([(row['team_name'], row['players'], row['points']) for row in response.json], [('Stats A', 2, 30), ('Stats B', 1, 25)])
+
+    def test_team_rollups(self):
+        # 球员的新增、修改、转队和删除都由触发器同步到球队汇总；汇总被改乱后 flask rollups 按球员表重建
+        self.session.add_all([Team(name='Rollup A'), Team(name='Rollup B')])
+        self.session.commit()
+
+        with app.test_client() as client:
+            client.post('/players/bulk', json=[{'name': f'R{i}', 'team_id': 1, 'points': 10, 'rebounds': 2, 'assists': 1} for i in range(3)])
+            client.patch('/players/1', json={'points': 4})
+            client.patch('/players/2', json={'team_id': 2})
+            client.delete('/players/3')
+            client.post('/players', json={'name': 'No Team', 'team_id': None, 'points': 7, 'rebounds': 0, 'assists': 0})
+
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            response = client.get('/teams?include=totals')
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual([team['totals'] for team in response.json], [
+                {'players': 1, 'points': 4, 'rebounds': 2, 'assists': 1},
+                {'players': 1, 'points': 10, 'rebounds': 2, 'assists': 1},
+            ])
+            self.assertFalse([statement for statement in statements if 'FROM player' in statement])
+            etag = response.headers['ETag']
+            client.patch('/players/1', json={'assists': 5})
+            response = client.get('/teams?include=totals', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json[0]['totals']['assists'], 5)
+            response = client.get('/stats/by-team')
+            self.assertEqual([(row['team_id'], row['players'], row['points']) for row in response.json], [(None, 1, 7), (1, 1, 4), (2, 1, 10)])
+
+            self.session.execute(text('UPDATE team_rollup SET points = 99'))
+            self.session.commit()
+            runner = app.test_cli_runner()
+            self.assertIn('3 teams drifted', runner.invoke(args=['rollups', '--check']).output)
+            self.assertEqual(client.get('/teams/1/totals').json['points'], 99)
+            self.assertIn('3 teams repaired', runner.invoke(args=['rollups']).output)
+            self.assertEqual(client.get('/teams/1/totals').json['points'], 4)
+
+    def test_changes_since_and_feed(self):
+        # 每次写入分配一个递增的变更序号，删除留下删除记录；?since= 只返回之后的变更，/changes 以 SSE 推送
+        with app.test_client() as client:
+            client.post('/teams', json={'name': 'Feed A', 'points_scored': 1, 'rebounds': 1, 'assists': 1})
+            client.post('/players/bulk', json=[{'name': f'F{i}', 'team_id': 1, 'points': i, 'rebounds': 1, 'assists': 1} for i in range(3)])
+            response = client.get('/players?since=0')
+            self.assertEqual([(player['id'], player['revision']) for player in response.json], [(1, 2), (2, 3), (3, 4)])
+            self.assertEqual(response.headers['X-Revision'], '4')
+            self.assertNotIn('X-More-Changes', response.headers)
+
+            client.patch('/players/2', json={'points': 9})
+            client.delete('/players/1')
+            response = client.get('/players?since=4&fields=points')
+            self.assertEqual(response.json, [{'points': 9, 'id': 2, 'revision': 5}, {'id': 1, 'revision': 6, 'deleted': True}])
+            response = client.get('/players?since=0&limit=1')
+            self.assertEqual(response.json, [{'id': 3, 'name': 'F2', 'team_id': 1, 'points': 2, 'rebounds': 1, 'assists': 1, 'revision': 4}])
+            self.assertEqual((response.headers['X-Revision'], response.headers['X-More-Changes']), ('4', 'true'))
+            self.assertEqual(client.get('/teams?since=0').json[0]['revision'], 1)
+            self.assertEqual(client.get('/players?since=0&team_id=1').status_code, 400)
+            self.assertEqual(client.get('/players?since=-1').status_code, 400)
+
+            response = client.get('/changes?since=3&follow=false')
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            events = [chunk for chunk in response.get_data(as_text=True).split('\n\n') if chunk.startswith('id:')]
+            self.assertEqual([event.splitlines()[0] for event in events], ['id: 4', 'id: 5', 'id: 6'])
+            self.assertEqual(json.loads(events[2].splitlines()[2][len('data: '):]), {'table': 'players', 'op': 'delete', 'id': 1, 'revision': 6})
+            response = client.get('/changes?tables=teams&follow=false', headers={'Last-Event-ID': '0'})
+            self.assertIn('"table": "teams"', response.get_data(as_text=True))
+            self.assertEqual(client.get('/changes?tables=coaches').status_code, 400)
+
+            # 跟随模式：先发积压的变更，之后的写入提交后立即推送
+            response = client.get('/changes?since=6', buffered=False)
+            chunks = iter(response.response)
+            self.assertEqual(next(chunks), b'retry: 3000\n\n')
+            client.patch('/teams/1', json={'assists': 2})
+            self.assertIn(b'"op": "upsert", "id": 1, "revision": 7', next(chunks))
+            response.close()
+
+            # 两行加两条删除记录，各自都没取满 limit，合起来超过了：下一次的 since 不能跳过没返回的删除
+            client.post('/players', json={'name': 'F3', 'team_id': 1, 'points': 3, 'rebounds': 1, 'assists': 1})
+            client.delete('/players/3')
+            response = client.get('/players?since=0&limit=3')
+            self.assertEqual([(player['id'], player['revision'], player.get('deleted', False)) for player in response.json], [(2, 5, False), (1, 6, True), (4, 8, False)])
+            self.assertEqual((response.headers['X-Revision'], response.headers['X-More-Changes']), ('8', 'true'))
+            response = client.get('/players?since=8&limit=3')
+            self.assertEqual(response.json, [{'id': 3, 'revision': 9, 'deleted': True}])
+            self.assertNotIn('X-More-Changes', response.headers)
+
+    def test_analytics_snapshot(self):
+        # 分布和对比接口在球员数据列上计算；开启快照后写接口提交时增量更新，不再查询球员表
+        self.session.add_all([Team(name='Columns A'), Team(name='Columns B')])
+        self.session.add_all([Player(name=f'C{i}', team_id=1 + i % 2, points=i, rebounds=i, assists=None) for i in range(1, 11)])
+        self.session.commit()
+
+        with app.test_client() as client:
+            response = client.get('/stats/distribution?stat=points&buckets=2')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.json['count'], response.json['min'], response.json['max'], response.json['mean']), (10, 1, 10, 5.5))
+            self.assertEqual(response.json['percentiles']['p50'], 5.5)
+            self.assertEqual([bucket['count'] for bucket in response.json['histogram']], [5, 5])
+            self.assertEqual(client.get('/stats/distribution?stat=assists').json['count'], 0)
+            response = client.get('/stats/compare?stat=points&team_ids=2,1,9')
+            self.assertEqual([(row['team_id'], row['total'], row['median']) for row in response.json], [(2, 25, 5), (1, 30, 6), (9, 0, None)])
+            response = client.get('/stats/compare?team_ids=' + ','.join(str(i) for i in range(1, 102)))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json['message'], 'At most 100 teams can be compared')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            class AnalyticsTestConfig(Config):
+                SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp}/analytics.db'
+                ANALYTICS_SNAPSHOT = True
+
+            analytics_app = create_app(AnalyticsTestConfig)
+            with analytics_app.app_context():
+                db.create_all()
+                store = analytics_app.extensions['analytics']
+                with analytics_app.test_client() as client:
+                    client.post('/teams/bulk', json=[{'name': name, 'points_scored': 0, 'rebounds': 0, 'assists': 0} for name in 'AB'])
+                    client.post('/players/bulk', json=[{'name': f'P{i}', 'team_id': 1, 'points': 10, 'rebounds': 1, 'assists': 1} for i in range(3)])
+                    self.assertEqual(client.get('/teams/1/totals').json['points'], 30)
+                    self.assertEqual(store.loads, 0)
+                    self.assertEqual(client.get('/stats/distribution?team_id=1').json['count'], 3)
+                    self.assertEqual(store.loads, 1)
+
+                    client.put('/players/2', json={'points': 40})
+                    client.put('/players/3', json={'team_id': 2})
+                    client.post('/players', json={'name': 'P3', 'team_id': 2, 'points': 5, 'rebounds': 1, 'assists': 1})
+                    client.delete('/players/1')
+                    # 改动由后台线程合并进新的快照，提交时不等它
+                    self.assertTrue(store.wait(5))
+                    with store.read() as columns, db.engine.connect() as connection:
+                        fresh = PlayerColumns.load(connection)
+                        self.assertEqual((columns.ids, columns.team_ids, columns.columns), (fresh.ids, fresh.team_ids, fresh.columns))
+                    statements = []
+                    listener = lambda *args: statements.append(args[2])
+                    event.listen(db.engine, 'before_cursor_execute', listener)
+                    response = client.get('/stats/by-team')
+                    event.remove(db.engine, 'before_cursor_execute', listener)
+                    self.assertEqual([(row['team_name'], row['players'], row['points']) for row in response.json], [('A', 1, 40), ('B', 2, 15)])
+                    self.assertFalse([statement for statement in statements if 'FROM player' in statement])
+                    self.assertEqual(store.loads, 1)
+                    self.assertEqual(client.get('/stats/compare?team_ids=2').json[0]['max'], 10)
+
+                    # 快照接口的 ETag 跟着快照走：改动合并进快照之前 ETag 不变，合并之后旧 ETag 不再 304
+                    etag = client.get('/stats/distribution').headers['ETag']
+                    with store._build_lock:
+                        client.put('/players/2', json={'points': 99})
+                        response = client.get('/stats/distribution', headers={'If-None-Match': etag})
+                        self.assertEqual(response.status_code, 304)
+                    self.assertTrue(store.wait(5))
+                    response = client.get('/stats/distribution', headers={'If-None-Match': etag})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json['max'], 99)
+                    self.assertNotEqual(response.headers['ETag'], etag)
+                db.session.remove()
+                db.engine.dispose()
+
+    def test_conditional_get_and_if_match(self):
+        # 数据没变时返回 304；写入后 ETag 变化；If-Match 不一致返回 412
+        self.session.add(Team(name='Cached Team', points_scored=80, rebounds=40, assists=20))
+        self.session.commit()
+
+        with app.test_client() as client:
+            response = client.get('/teams/1')
+            etag = response.headers['ETag']
+            response = client.get('/teams/1', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+            response = client.put('/teams/1', json={'points_scored': 90}, headers={'If-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            response = client.put('/teams/1', json={'points_scored': 95}, headers={'If-Match': etag})
+            self.assertEqual(response.status_code, 412)
+
+            response = client.get('/teams/1', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['points_scored'], 90)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+            # JSON 和 NDJSON 是同一个 URL 的两种表示，ETag 不同，响应都带 Vary: Accept
+            response = client.get('/teams')
+            self.assertIn('Accept', response.headers['Vary'])
+            etag = response.headers['ETag']
+            headers = {'Accept': 'application/x-ndjson', 'If-None-Match': etag}
+            response = client.get('/teams', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            self.assertNotEqual(response.headers['ETag'], etag)
+            self.assertIn('Accept', response.headers['Vary'])
+            response.get_data()
+            response.close()
+            response = client.get('/teams', headers=dict(headers, **{'If-None-Match': response.headers['ETag']}))
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers['Vary'], 'Accept')
+
+    def test_player_cache_invalidation(self):
+        # 第二次读取命中缓存；单条更新和批量更新提交后缓存失效
+        self.session.add(Player(name='Star', team_id=1, points=30, rebounds=10, assists=8))
+        self.session.commit()
+
+        with app.test_client() as client:
+            hits = caches['player'].hits
+            self.assertEqual(client.get('/players/1').json['points'], 30)
+            self.assertEqual(client.get('/players/1').json['points'], 30)
+            self.assertEqual(caches['player'].hits, hits + 1)
+
+            client.put('/players/1', json={'points': 35})
+            self.assertEqual(client.get('/players/1').json['points'], 35)
+
+            client.patch('/players', json=[{'id': 1, 'points': 40}])
+            self.assertEqual(client.get('/players/1').json['points'], 40)
+
+            response = client.get('/stats/cache')
+            self.assertEqual(response.json['player']['size'], 1)
+
+            # 其他进程的写入没有提交信号，但会递增表修订号：缓存的条目不再命中，新 ETag 下返回新数据
+            etag = client.get('/players/1').headers['ETag']
+            with db.engine.begin() as connection:
+                connection.execute(text('UPDATE player SET points = 99 WHERE id = 1'))
+                connection.execute(text("UPDATE table_revision SET revision = revision + 1 WHERE name = 'player'"))
+            response = client.get('/players/1', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['points'], 99)
+            hits = caches['player'].hits
+            self.assertEqual(client.get('/players/1').json['points'], 99)
+            self.assertEqual(caches['player'].hits, hits + 1)
+
+    def test_statement_cache(self):
+        # 同一形状的查询复用缓存的语句，取值不同结果也正确；编译缓存命中情况在 /stats/cache 里
+        self.session.add_all([Player(name=f'Shape {i}', team_id=1 + i % 2, points=i, rebounds=1, assists=1) for i in range(6)])
+        self.session.commit()
+        statements.clear()
+
+        with app.test_client() as client:
+            self.assertEqual([p['name'] for p in client.get('/players?team_id=1&limit=2&sort=-points').json], ['Shape 4', 'Shape 2'])
+            before = client.get('/stats/cache').json
+            response = client.get('/players?team_id=2&limit=2&sort=-points')
+            self.assertEqual([p['name'] for p in response.json], ['Shape 5', 'Shape 3'])
+            self.assertEqual([p['name'] for p in client.get('/players?name_prefix=Shape 1&sort=name').json], ['Shape 1'])
+            self.assertEqual(client.get('/players/2?fields=name').json, {'name': 'Shape 1'})
+            self.assertEqual(client.get('/players/3?fields=name').json, {'name': 'Shape 2'})
+            self.assertEqual(client.patch('/players/4', json={'points': 0}).json['points'], 0)
+            self.assertEqual(client.patch('/players/5', json={'points': 0}).json['points'], 0)
+            after = client.get('/stats/cache').json
+            self.assertEqual(after['statements']['hits'] - before['statements']['hits'], 3)
+            self.assertEqual(after['statements']['misses'] - before['statements']['misses'], 3)
+            self.assertGreater(after['compiled']['hit'], before['compiled']['hit'])
+
+    def test_production_engine_profile(self):
+        # 生产配置：WAL 模式，GET 请求走只读引擎，写请求走默认引擎
+        with tempfile.TemporaryDirectory() as tmp:
+            class ProductionTestConfig(ProductionConfig):
+                SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp}/production.db'
+
+            production_app = create_app(ProductionTestConfig)
+            with production_app.app_context():
+                db.create_all()
+                self.assertEqual(db.session.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+                with production_app.test_request_context('/teams'):
+                    self.assertIs(db.session.get_bind(), read_engine())
+                with production_app.test_request_context('/teams', method='POST'):
+                    self.assertIs(db.session.get_bind(), db.engine)
+
+                with production_app.test_client() as client:
+                    data = {'name': 'Production Team', 'points_scored': 70, 'rebounds': 35, 'assists': 15}
+                    self.assertEqual(client.post('/teams', json=data).status_code, 201)
+                    self.assertEqual([team['name'] for team in client.get('/teams').get_json()], ['Production Team'])
+
+                with read_engine().connect() as connection:
+                    with self.assertRaises(Exception):
+                        connection.execute(text("DELETE FROM team"))
+                db.session.remove()
+                read_engine().dispose()
+                db.engine.dispose()
+
+    def test_openapi_spec(self):
+        # swagger.json 只生成一次，带 ETag；也可以读部署时用 flask openapi 生成的文件
+        with app.test_client() as client:
+            response = client.get('/swagger.json')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('/players/export.csv', response.json['paths'])
+            etag = response.headers['ETag']
+            self.assertEqual(client.get('/swagger.json').headers['ETag'], etag)
+            self.assertEqual(client.get('/swagger.json', headers={'If-None-Match': etag}).status_code, 304)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'swagger.json')
+            result = app.test_cli_runner().invoke(args=['openapi', path])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            class PrebuiltSpecConfig(Config):
+                OPENAPI_SPEC_FILE = path
+
+            with open(path, 'rb') as f:
+                prebuilt = f.read()
+            with create_app(PrebuiltSpecConfig).test_client() as client:
+                response = client.get('/swagger.json')
+                self.assertEqual(response.data, prebuilt)
+                self.assertEqual(response.headers['ETag'], etag)
+
+    def test_seed_database(self):
+        # 分批写入球员，写完后重建 player 表的二级索引
+        teams, players = seed_database(db.engine, 3, 2500, batch_size=1000, commit_every=1000, seed=1)
+        self.assertEqual((teams, players), (3, 2500))
+        self.assertEqual(self.session.scalar(text('SELECT COUNT(*) FROM player WHERE team_id IN (SELECT id FROM team)')), 2500)
+        indexes = self.session.scalars(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'player'")).all()
+        self.assertTrue({index.name for index in Player.__table__.indexes} <= set(indexes))
+
+        # 已有球队时只追加球员，同一个种子生成的数据相同
+        self.assertEqual(seed_database(db.engine, 0, 10, seed=7), (0, 10))
+        seed_database(db.engine, 0, 10, seed=7)
+        rows = self.session.execute(text('SELECT name, team_id, points FROM player ORDER BY id DESC LIMIT 20')).all()
+        self.assertEqual(rows[:10], rows[10:])
+
+    def test_metrics(self):
+        # 每个接口的延迟直方图、SQL 语句数、返回行数和字节数以 Prometheus 文本格式输出
+        self.session.add_all([Player(name=f'Metric {i}', team_id=1, points=i, rebounds=i, assists=i) for i in range(3)])
+        self.session.commit()
+        def scrape(client):
+            response = client.get('/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.content_type.startswith('text/plain'))
+            samples = dict(line.rsplit(' ', 1) for line in response.get_data(as_text=True).splitlines() if not line.startswith('#'))
+            return lambda name: float(samples.get(name, 0))
+
+        labels = '{method="GET",endpoint="/players/",status="200",le="+Inf"}'
+        with app.test_client() as client:
+            before = scrape(client)
+            self.assertEqual(len(client.get('/players').get_json()), 3)
+            client.get('/players?stream=1').close()
+            after = scrape(client)
+        self.assertEqual(after('http_request_duration_seconds_bucket' + labels) - before('http_request_duration_seconds_bucket' + labels), 2)
+        self.assertEqual(after('response_rows_total{endpoint="/players/"}') - before('response_rows_total{endpoint="/players/"}'), 6)
+        self.assertGreater(after('db_statements_total{endpoint="/players/"}'), before('db_statements_total{endpoint="/players/"}'))
+        self.assertEqual(after('http_request_duration_seconds_count{method="GET",endpoint="/metrics",status="200"}'), 0)
+
+    def test_slow_request_profile(self):
+        # 超过阈值的请求把采样到的折叠栈写到 PROFILE_DIR
+        with tempfile.TemporaryDirectory() as tmp:
+            profile_app = create_app(type('ProfileTestConfig', (ProductionConfig,), {
+                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/profile.db',
+                'PROFILE_SLOW_REQUESTS': 0, 'PROFILE_INTERVAL': 0.001, 'PROFILE_DIR': f'{tmp}/profiles',
+            }))
+            with profile_app.app_context():
+                db.create_all()
+                with profile_app.test_client() as client:
+                    self.assertEqual(client.get('/stats/by-team').status_code, 200)
+                    self.assertIn('profiles_written_total 1', client.get('/metrics').get_data(as_text=True))
+                self.assertEqual(len(os.listdir(f'{tmp}/profiles')), 1)
+                db.session.remove()
+                read_engine().dispose()
+                db.engine.dispose()
+
+    def test_team_rosters(self):
+        # /teams/<id>/players 分页返回球队的球员；?include=players 时整页球队的阵容只多一条查询
+        self.session.add_all([Team(name=f'Roster {i}', points_scored=i, rebounds=i, assists=i) for i in range(20)])
+        self.session.add_all([Player(name=f'R{i}', team_id=i % 20 + 1, points=i, rebounds=i, assists=i) for i in range(60)])
+        self.session.commit()
+
+        statements = []
+        count = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            with app.test_client() as client:
+                response = client.get('/teams?include=players&limit=20')
+                self.assertEqual(response.status_code, 200)
+                teams = response.get_json()
+                # 修订号、球队列表、阵容各一条
+                self.assertEqual(len(statements), 3)
+                self.assertEqual([len(team['players']) for team in teams], [3] * 20)
+                self.assertEqual([player['name'] for player in teams[0]['players']], ['R0', 'R20', 'R40'])
+
+                response = client.get('/teams/2/players?sort=-points&limit=2&fields=name,points')
+                self.assertEqual(response.get_json(), [{'name': 'R41', 'points': 41}, {'name': 'R21', 'points': 21}])
+                response = client.get('/teams/2/players', query_string={'cursor': response.headers['X-Next-Cursor'], 'sort': '-points', 'fields': 'name'})
+                self.assertEqual(response.get_json(), [{'name': 'R1'}])
+                self.assertEqual(client.get('/teams/99/players').status_code, 404)
+                self.assertEqual(client.get('/teams?include=coaches').status_code, 400)
+
+                # 带 include 时球员的修改会让 ETag 失效
+                etag = client.get('/teams?include=players').headers['ETag']
+                plain = client.get('/teams').headers['ETag']
+                client.put('/players/1', json={'points': 99})
+                self.assertNotEqual(client.get('/teams?include=players').headers['ETag'], etag)
+                self.assertEqual(client.get('/teams').headers['ETag'], plain)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+    def test_search(self):
+        # 中文子串走 trigram 全文索引，写接口通过触发器同步索引；少于 3 个字的查询退回 LIKE
+        self.session.add_all([Team(name='上海雄鹰'), Team(name='北京雄狮')])
+        self.session.add_all([Player(name=name, team_id=1, points=1, rebounds=1, assists=1) for name in ['张伟华', '李张伟华', '王伟', '张伟华强']])
+        self.session.commit()
+
+        with app.test_client() as client:
+            response = client.get('/players/search?q=张伟华')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({player['name'] for player in response.get_json()}, {'张伟华', '李张伟华', '张伟华强'})
+
+            # 按相关度翻页，不重复不遗漏
+            first = client.get('/players/search?q=张伟华&limit=2&fields=id')
+            second = client.get('/players/search', query_string={'q': '张伟华', 'limit': 2, 'fields': 'id', 'cursor': first.headers['X-Next-Cursor']})
+            self.assertNotIn('X-Next-Cursor', second.headers)
+            self.assertEqual(sorted(player['id'] for player in first.get_json() + second.get_json()), [1, 2, 4])
+
+            self.assertEqual([player['name'] for player in client.get('/players/search?q=伟').get_json()], ['张伟华', '李张伟华', '王伟', '张伟华强'])
+            self.assertEqual([team['name'] for team in client.get('/teams/search?q=雄鹰').get_json()], ['上海雄鹰'])
+            self.assertEqual([team['name'] for team in client.get('/teams/search?q=北京雄').get_json()], ['北京雄狮'])
+
+            client.put('/players/3', json={'name': '王张伟华'})
+            client.delete('/players/1')
+            self.assertEqual({player['name'] for player in client.get('/players/search?q=张伟华').get_json()}, {'李张伟华', '张伟华强', '王张伟华'})
+            self.assertEqual(client.get('/players/search?q=%20').status_code, 400)
+            self.assertEqual(client.get('/players/search?q=100%25').get_json(), [])
+
+    def test_group_commit(self):
+        # 并发的单行写请求合并成少数几个事务提交，出错的请求只影响自己
+        with tempfile.TemporaryDirectory() as tmp:
+            group_app = create_app(type('GroupCommitTestConfig', (ProductionConfig,), {
+                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/group.db',
+                'GROUP_COMMIT': True, 'GROUP_COMMIT_MAX_DELAY': 0.05,
+            }))
+            with group_app.app_context():
+                db.create_all()
+                group = group_app.extensions['group_commit']
+
+                def post(i):
+                    return group_app.test_client().post('/teams', json={'name': f'Group {i % 9}', 'points_scored': i, 'rebounds': i, 'assists': i})
+
+                def put_missing(i):
+                    return group_app.test_client().put('/players/404', json={'points': 1})
+
+                with ThreadPoolExecutor(10) as pool:
+                    futures = [pool.submit(post, i) for i in range(10)] + [pool.submit(put_missing, 0)]
+                    responses = [future.result() for future in futures]
+                group.close()
+
+                codes = sorted(response.status_code for response in responses)
+                # Group 0 重复一次，违反唯一约束的那个请求返回 409
+                self.assertEqual(codes.count(201), 9)
+                self.assertEqual(codes.count(404), 1)
+                self.assertEqual(codes.count(409), 1)
+                self.assertEqual(db.session.scalar(text('SELECT COUNT(*) FROM team')), 9)
+                self.assertEqual(group.items, 11)
+                self.assertLess(group.batches, 11)
+
+                # 同一批里每个操作的 SAVEPOINT 释放时不发提交信号，整批提交之后才发，收到时已经能读到新数据
+                seen = []
+
+                def on_commit(table, ids=None):
+                    with db.engine.connect() as connection:
+                        seen.append((table, connection.execute(text("SELECT points_scored FROM team WHERE name = 'Group 1'")).scalar()))
+
+                def rename():
+                    db.session.execute(text("UPDATE team SET points_scored = 99 WHERE name = 'Group 1'"))
+                    mark_changed('team', [1])
+
+                changes_committed.connect(on_commit)
+                try:
+                    batches = group.batches
+                    release, futures = threading.Event(), [Future(), Future()]
+                    group._queue.put((lambda: release.wait(5), Future()))
+                    group._queue.put((rename, futures[0]))
+                    group._queue.put((lambda: time.sleep(0.05), futures[1]))
+                    group._start()
+                    release.set()
+                    for future in futures:
+                        future.result(5)
+                finally:
+                    changes_committed.disconnect(on_commit)
+                self.assertEqual(group.batches, batches + 1)
+                self.assertEqual(seen, [('team', 99)])
+
+                # 写线程里回滚出错时这一批的请求拿到异常，写线程不退出，之后的写入照常执行
+                apply = group._apply
+                group._apply = lambda batch: (_ for _ in ()).throw(RuntimeError('rollback failed'))
+                with self.assertRaises(RuntimeError):
+                    group.submit(lambda: 1)
+                group._apply = apply
+                self.assertEqual(group_app.test_client().post('/teams', json={'name': 'After failure'}).status_code, 201)
+
+                # 等不到写线程时返回 503，排队中的操作被取消，不会再写入
+                group.timeout = 0.05
+                release, blocked = threading.Event(), Future()
+                group._queue.put((lambda: release.wait(5), blocked))
+                self.assertEqual(group_app.test_client().post('/teams', json={'name': 'Timed out'}).status_code, 503)
+                release.set()
+                self.assertTrue(blocked.result(5))
+                group.close()
+                self.assertIsNone(db.session.scalar(text("SELECT id FROM team WHERE name = 'Timed out'")))
+                db.session.remove()
+                read_engine().dispose()
+                db.engine.dispose()
+
+    def test_sparse_fieldsets(self):
+        # ?fields= 只返回请求的字段，未知字段返回 400
+        self.session.add_all([Player(name=f'Narrow {i}', team_id=1, points=i, rebounds=i, assists=i) for i in range(3)])
+        self.session.commit()
+
+        with app.test_client() as client:
+            response = client.get('/players?fields=id,name,points&sort=-rebounds')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()[0], {'id': 3, 'name': 'Narrow 2', 'points': 2})
+
+            response = client.get('/players/2?fields=name')
+            self.assertEqual(response.get_json(), {'name': 'Narrow 1'})
+            response = client.get('/players/2?fields=assists,id,name,points,rebounds,team_id')
+            self.assertEqual(list(response.get_json()), ['assists', 'id', 'name', 'points', 'rebounds', 'team_id'])
+            self.assertEqual(client.get('/players/9?fields=name').status_code, 404)
+
+            response = client.get('/players?stream=1&fields=name')
+            self.assertEqual(response.get_data(as_text=True).splitlines()[0], '{"name": "Narrow 0"}')
+            response.close()
+
+            self.assertEqual(client.get('/players?fields=salary').status_code, 400)
+            self.assertEqual(client.get('/teams/1?fields=salary').status_code, 400)
+
+    def test_csv_export_and_import(self):
+        # 导出的 CSV 可以原样导回：按 id upsert 只更新已有球员，新 id 缺必填列时报错；球队按名字 upsert，不 upsert 时重名报错
+        self.session.add_all([Player(name=f'Csv {i}', team_id=1, points=i, rebounds=i, assists=i) for i in range(3)])
+        self.session.add(Team(name='Csv Team', points_scored=1, rebounds=1, assists=1))
+        self.session.commit()
+
+        with app.test_client() as client:
+            response = client.get('/players/export.csv?min_points=1&fields=name,points')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'text/csv')
+            self.assertIn('players.csv', response.headers['Content-Disposition'])
+            self.assertEqual(response.get_data(as_text=True).splitlines(), ['id,name,points', '2,Csv 1,1', '3,Csv 2,2'])
+            response.close()
+
+            body = 'id,points\r\n2,0\r\n3,many\r\n7,9\r\n'
+            response = client.post('/players/import?upsert=1', data=body, content_type='text/csv')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.json['rows'], response.json['created'], response.json['updated'], response.json['failed']), (3, 0, 1, 2))
+            self.assertEqual([error['line'] for error in response.json['errors']], [3, 4])
+            self.assertIn("'name' is a required property", response.json['errors'][1]['error'])
+            self.assertIsNone(self.session.get(Player, 7))
+            self.assertEqual(self.session.get(Player, 2).points, 0)
+            self.assertEqual(self.session.get(Player, 2).name, 'Csv 1')
+
+            body = 'id,name,team_id,points,rebounds,assists\n3,Csv 2,1,4,2,2\n7,Upserted,1,9,1,1\n'
+            response = client.post('/players/import?upsert=1', data=body, content_type='text/csv')
+            self.assertEqual((response.json['created'], response.json['updated'], response.json['failed']), (1, 1, 0))
+            self.assertEqual(self.session.get(Player, 7).name, 'Upserted')
+
+            csv_file = (io.BytesIO('name,team_id,points,rebounds,assists\n新秀,1,5,2,1\n'.encode()), 'players.csv')
+            response = client.post('/players/import', data={'file': csv_file}, content_type='multipart/form-data')
+            self.assertEqual(response.json['created'], 1)
+            self.assertEqual(self.session.scalar(db.select(Player.id).where(Player.name == '新秀')), 8)
+
+            body = 'name,points_scored,rebounds,assists\nCsv Team,9,9,9\nNew Team,2,2,2\n'
+            response = client.post('/teams/import', data=body, content_type='text/csv')
+            self.assertEqual((response.json['created'], response.json['failed']), (1, 1))
+            response = client.post('/teams/import?upsert=1', data=body, content_type='text/csv')
+            self.assertEqual((response.json['created'], response.json['updated']), (0, 2))
+            self.assertEqual(client.get('/teams/1').json['points_scored'], 9)
+
+            response = client.post('/teams/import', data='name,salary\nX,1\n', content_type='text/csv')
+            self.assertEqual(response.status_code, 400)
+
 if __name__ == '__main__':
     unittest.main()
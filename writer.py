@@ -0,0 +1,149 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from flask import current_app
+from flask_restx import abort
+from sqlalchemy import text
+
+GROUP_COMMIT = 'group_commit'
+
+
+class GroupCommitQueue:
+    """
+    组提交：单个写线程从队列里取出待执行的写操作，攒够 max_items 个或等满 max_delay 秒后
+    放在一个事务里执行并提交一次，再把每个操作自己的结果或异常交还给对应的请求。
+    每个操作在自己的 SAVEPOINT 里执行，一个失败不影响同批的其他操作。
+    SQLite 同一时刻只有一个写者，并发写请求排队拿锁、各自 fsync 的开销由整批分摊。
+    请求最多等 timeout 秒，写线程出错时这一批的请求都拿到异常，写线程退出后下一个请求会重新启动它
+    """
+
+    def __init__(self, app, db, max_items=100, max_delay=0, timeout=30):
+        self.app, self.db = app, db
+        self.max_items, self.max_delay, self.timeout = max_items, max_delay, timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = self.items = 0
+
+    def submit(self, work):
+        """
+        把 work 交给写线程执行并等待结果。work 不带参数，在写线程的 db.session 上执行；
+        返回值要是普通数据（例如新建记录的 ID），不要返回 ORM 对象。
+        超过 timeout 秒还没有结果时返回 503；还没开始执行的操作会被取消，不会再写入
+        """
+        self._start()
+        future = Future()
+        self._queue.put((work, future))
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()
+            abort(503, 'Timed out waiting for the write queue')
+
+    def close(self):
+        """停止写线程，已经在队列里的操作会先执行完"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        try:
+            with self.app.app_context():
+                while True:
+                    batch = [self._queue.get()]
+                    deadline = time.monotonic() + self.max_delay
+                    while batch[-1] is not None and len(batch) < self.max_items:
+                        try:
+                            batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                        except queue.Empty:
+                            break
+                    stopping = batch[-1] is None
+                    batch = [item for item in batch if item is not None]
+                    if batch:
+                        self._run_batch(batch)
+                    if stopping:
+                        return
+        finally:
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _run_batch(self, batch):
+        """执行一批操作；回滚或关闭会话时出错也不让写线程退出，还没拿到结果的请求都拿到这个异常"""
+        try:
+            self._apply(batch)
+            self.db.session.close()
+        except Exception as e:
+            self.app.logger.exception('Group commit failed')
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            try:
+                self.db.session.remove()
+            except Exception:
+                # 连接已经坏了，丢掉这个会话，下一批用新的
+                self.db.session.registry.clear()
+
+    def _apply(self, batch):
+        session = self.db.session
+        results = []
+        try:
+            # pysqlite 在第一条写语句前才发 BEGIN，直接以 SAVEPOINT 开头时 RELEASE 就会提交；
+            # 先执行一条不改数据的 UPDATE，让整批处在同一个事务里，同时提前拿到写锁
+            session.execute(text('UPDATE table_revision SET revision = revision WHERE 0'))
+            for work, future in batch:
+                # 等超时被取消的操作不再执行；整批失败逐个重试时已经是执行中的状态
+                if not future.running() and not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with session.begin_nested():
+                        results.append((future, work(), None))
+                except Exception as e:
+                    results.append((future, None, e))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if len(batch) > 1:
+                # 整批提交失败时逐个重试，每个请求拿到自己的结果
+                for item in batch:
+                    self._apply([item])
+                return
+            results = [(batch[0][1], None, e)]
+        self.batches += 1
+        self.items += len(batch)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def init_group_commit(app, db):
+    """GROUP_COMMIT 打开时为应用创建组提交队列"""
+    if app.config['GROUP_COMMIT']:
+        app.extensions[GROUP_COMMIT] = GroupCommitQueue(
+            app, db, app.config['GROUP_COMMIT_MAX_ITEMS'], app.config['GROUP_COMMIT_MAX_DELAY'], app.config['GROUP_COMMIT_TIMEOUT'])
+
+
+def run_write(db, work):
+    """
+    执行一个单行写操作并提交。开启组提交时交给写线程和其他请求一起提交，
+    否则在当前请求的会话里执行并立即提交；返回 work 的返回值
+    """
+    group = current_app.extensions.get(GROUP_COMMIT)
+    if group is not None:
+        return group.submit(work)
+    result = work()
+    db.session.commit()
+    return result